@@ -4,6 +4,7 @@ Serveur Django pur avec Uvicorn pour DAMA Desktop
 Usage: python Welto.py (serveur seulement, pas Electron)
 """
 
+import multiprocessing
 import sys
 import os
 import uvicorn
@@ -101,6 +102,8 @@ def run_django_server():
     )
 
 if __name__ == "__main__":
+    # Exécutable PyInstaller : un processus enfant (spawn) exécute sa tâche au lieu de relancer le serveur
+    multiprocessing.freeze_support()
     print("=" * 60)
     print("[DAMA] Django Server - Mode Standalone")
     print("=" * 60)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import TypeDepense, Depense, MouvementStock
+from .models import TypeDepense, Depense, MouvementStock, DailyStats
 
 
 @admin.register(TypeDepense)
@@ -75,4 +75,11 @@ class MouvementStockAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         if not change:  # Nouveau objet
             obj.created_by = request.user
-        super().save_model(request, obj, form, change)
\ No newline at end of file
+        super().save_model(request, obj, form, change)
+
+@admin.register(DailyStats)
+class DailyStatsAdmin(admin.ModelAdmin):
+    list_display = ['jour', 'categorie', 'ventes', 'nb_commandes', 'articles_vendus', 'depenses', 'cout_entrees_stock']
+    list_filter = ['categorie']
+    date_hierarchy = 'jour'
+    readonly_fields = [f.name for f in DailyStats._meta.fields]
@@ -0,0 +1,86 @@
+"""
+Journal des mouvements de stock en écriture groupée.
+
+Les mouvements créés pendant une transaction sont mis en attente puis insérés
+en un seul bulk_create au commit (transaction.on_commit). Hors transaction,
+ils sont écrits immédiatement.
+
+Un lot est ouvert par savepoint (bloc atomic() imbriqué) : son callback on_commit
+est rattaché à ce savepoint, donc Django l'abandonne si le savepoint est annulé,
+et les mouvements de ce bloc ne sont jamais écrits, même si la transaction
+englobante est validée.
+"""
+
+import threading
+import weakref
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import MouvementStock
+
+
+_local = threading.local()
+
+
+class _LotMouvements:
+    """Mouvements en attente pour un savepoint, écrits par un seul callback on_commit"""
+
+    def __init__(self, using):
+        self.using = using
+        self.mouvements = []
+        self.ecrit = False
+
+    def __call__(self):
+        self.ecrit = True
+        mouvements, self.mouvements = self.mouvements, []
+        if mouvements:
+            MouvementStock.objects.using(self.using).bulk_create(mouvements)
+
+
+def _lots_en_attente():
+    """Lots du thread encore détenus par un callback on_commit : {(base, savepoints): lot}.
+    Les références sont faibles : un lot abandonné par un rollback disparaît avec son callback."""
+    lots = getattr(_local, 'lots', None)
+    if lots is None:
+        lots = _local.lots = weakref.WeakValueDictionary()
+    return lots
+
+
+def _lot_courant(using):
+    """Retourne le lot du savepoint en cours, en l'enregistrant auprès de on_commit si besoin"""
+    lots = _lots_en_attente()
+    # Identifiants de savepoint uniques jusqu'à la fin de la transaction englobante
+    cle = (using, tuple(transaction.get_connection(using).savepoint_ids))
+    lot = lots.get(cle)
+    if lot is None or lot.ecrit:
+        lot = lots[cle] = _LotMouvements(using)
+        transaction.on_commit(lot, using=using)
+    return lot
+
+
+def journaliser_mouvement(mouvement, using=DEFAULT_DB_ALIAS):
+    """Ajoute un MouvementStock (non sauvegardé) au journal de la transaction courante"""
+    journaliser_mouvements([mouvement], using=using)
+
+
+def journaliser_mouvements(mouvements, using=DEFAULT_DB_ALIAS):
+    """Ajoute plusieurs MouvementStock (non sauvegardés) au journal de la transaction courante"""
+    mouvements = list(mouvements)
+    for mouvement in mouvements:
+        mouvement.calculer_cout_total()
+
+    if not transaction.get_connection(using).in_atomic_block:
+        MouvementStock.objects.using(using).bulk_create(mouvements)
+        return
+    _lot_courant(using).mouvements.extend(mouvements)
+
+
+def detacher_commande(order_id, using=DEFAULT_DB_ALIAS):
+    """Retire la référence à une commande supprimée des mouvements encore en attente
+    (équivalent du SET_NULL que la base appliquerait aux mouvements déjà écrits)"""
+    for (alias, _), lot in list(_lots_en_attente().items()):
+        if alias != using:
+            continue
+        for mouvement in lot.mouvements:
+            if mouvement.reference_commande_id == order_id:
+                mouvement.reference_commande_id = None
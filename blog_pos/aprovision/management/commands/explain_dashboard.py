@@ -0,0 +1,175 @@
+"""
+Plan d'exécution (EXPLAIN) et durée des requêtes des tableaux de bord, avant et après
+les index composites (migrations *_query_indexes) et la réécriture des filtres __date.
+
+« Avant » : ancienne forme de chaque requête, exécutée sans les nouveaux index (ils
+sont supprimés le temps de la mesure, dans une transaction annulée ensuite).
+« Après » : forme actuelle, avec les index.
+
+Usage:
+    python manage.py explain_dashboard
+    python manage.py explain_dashboard --debut 2024-01-01 --fin 2024-12-31 --repetitions 20
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from aprovision.models import Depense, MouvementStock, TypeMouvement, periode_jours
+from order.models import Order, Payment
+from product.models import Product, get_low_stock_threshold
+
+# Index ajoutés par order/0007, aprovision/0004 et product/0003
+NOUVEAUX_INDEX = {
+    'order_date_paid_idx', 'order_client_date_idx', 'payment_order_amount_idx',
+    'depense_date_type_idx', 'mvt_date_idx', 'mvt_produit_date_idx', 'mvt_type_date_idx',
+    'product_active_qty_idx',
+}
+MODELES = (Order, Payment, Depense, MouvementStock, Product)
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Date invalide : {value} (format attendu AAAA-MM-JJ)")
+
+
+def _ancienne_periode(champ, debut, fin):
+    return {f'{champ}__date__gte': debut, f'{champ}__date__lte': fin}
+
+
+def requetes(debut, fin):
+    """(libellé, requête avant, requête après) pour chaque requête des tableaux de bord et des listes"""
+    periode_commandes = {'date__gte': debut, 'date__lte': fin}
+    mouvements_par_type = lambda qs: qs.values('type_mouvement').annotate(nombre=Count('id'), quantite_totale=Sum('quantite'))
+    produits_mouvementes = lambda qs: qs.annotate(
+        total_mouvements=Count('mouvements'), total_quantite=Sum('mouvements__quantite')
+    ).order_by('-total_mouvements')[:5]
+    entrees = lambda qs: qs.filter(type_mouvement=TypeMouvement.ENTREE, cout_total__isnull=False).values('produit__category_id').annotate(total=Sum('cout_total'))
+
+    liste = [
+        (
+            "Mouvements de la période par type (tableau de bord)",
+            mouvements_par_type(MouvementStock.objects.filter(**_ancienne_periode('date_mouvement', debut, fin))),
+            mouvements_par_type(MouvementStock.objects.filter(**periode_jours('date_mouvement', debut, fin))),
+        ),
+        (
+            "Produits les plus mouvementés (analytique)",
+            produits_mouvementes(Product.objects.filter(**_ancienne_periode('mouvements__date_mouvement', debut, fin))),
+            produits_mouvementes(Product.objects.filter(**periode_jours('mouvements__date_mouvement', debut, fin))),
+        ),
+        (
+            "Entrées de stock de la période (agrégats journaliers)",
+            entrees(MouvementStock.objects.filter(**_ancienne_periode('date_mouvement', debut, fin))),
+            entrees(MouvementStock.objects.filter(**periode_jours('date_mouvement', debut, fin))),
+        ),
+        (
+            "Liste des mouvements d'un type",
+            MouvementStock.objects.filter(type_mouvement=TypeMouvement.SORTIE_VENTE, **_ancienne_periode('date_mouvement', debut, fin)).order_by('-date_mouvement')[:50],
+            MouvementStock.objects.filter(type_mouvement=TypeMouvement.SORTIE_VENTE, **periode_jours('date_mouvement', debut, fin)).order_by('-date_mouvement')[:50],
+        ),
+        (
+            "Dépenses de la période par type",
+            Depense.objects.filter(date_depense__gte=debut, date_depense__lte=fin).order_by().values('type_depense_id').annotate(total=Sum('montant')),
+            Depense.objects.filter(date_depense__gte=debut, date_depense__lte=fin).order_by().values('type_depense_id').annotate(total=Sum('montant')),
+        ),
+        (
+            "Commandes impayées de la période (liste)",
+            Order.objects.filter(is_paid=False, **periode_commandes)[:50],
+            Order.objects.filter(is_paid=False, **periode_commandes)[:50],
+        ),
+        (
+            "Reste dû des commandes de la période (paiements)",
+            Order.objects.filter(**periode_commandes).with_balance().order_by().values('pk', 'balance'),
+            Order.objects.filter(**periode_commandes).with_balance().order_by().values('pk', 'balance'),
+        ),
+        (
+            "Produits en stock faible",
+            Product.objects.filter(active=True, qty__lt=get_low_stock_threshold(), qty__gt=0).order_by('qty')[:10],
+            Product.objects.filter(active=True, qty__lt=get_low_stock_threshold(), qty__gt=0).order_by('qty')[:10],
+        ),
+    ]
+
+    produit_id = MouvementStock.objects.order_by().values_list('produit_id', flat=True).first()
+    if produit_id is not None:
+        liste.append((
+            "Liste des mouvements d'un produit",
+            MouvementStock.objects.filter(produit_id=produit_id, **_ancienne_periode('date_mouvement', debut, fin)).order_by('-date_mouvement')[:50],
+            MouvementStock.objects.filter(produit_id=produit_id, **periode_jours('date_mouvement', debut, fin)).order_by('-date_mouvement')[:50],
+        ))
+    client_id = Order.objects.filter(client__isnull=False).order_by().values_list('client_id', flat=True).first()
+    if client_id is not None:
+        liste.append((
+            "Commandes d'un client",
+            Order.objects.filter(client_id=client_id).order_by('-date')[:20],
+            Order.objects.filter(client_id=client_id).order_by('-date')[:20],
+        ))
+    titre = f"CMD-{fin:%Y%m%d}"
+    liste.append((
+        f"Recherche par numéro de commande ({titre})",
+        Order.objects.filter(title__contains=titre),
+        Order.objects.title_matching(titre),
+    ))
+    return liste
+
+
+class Command(BaseCommand):
+    help = "Compare le plan d'exécution et la durée des requêtes des tableaux de bord avant et après les index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debut', type=_parse_date, help="Premier jour de la période (défaut : il y a 30 jours)")
+        parser.add_argument('--fin', type=_parse_date, help="Dernier jour de la période (défaut : aujourd'hui)")
+        parser.add_argument('--repetitions', type=int, default=5, help="Exécutions par mesure (la meilleure est retenue)")
+
+    def handle(self, *args, **options):
+        fin = options['fin'] or timezone.localdate()
+        debut = options['debut'] or fin - timedelta(days=30)
+        repetitions = max(1, options['repetitions'])
+        liste = requetes(debut, fin)
+
+        # Avant : sans les nouveaux index, dans une transaction annulée
+        avant = []
+        with transaction.atomic():
+            supprimes = self._supprimer_index()
+            for _libelle, requete, _ in liste:
+                avant.append(self._mesurer(requete, repetitions))
+            transaction.set_rollback(True)
+        if not supprimes:
+            self.stdout.write(self.style.WARNING("Aucun des nouveaux index n'est présent : appliquez d'abord les migrations"))
+
+        self.stdout.write(f"Période du {debut} au {fin}, meilleure de {repetitions} exécution(s)\n")
+        for (libelle, _, requete), (plan_avant, duree_avant) in zip(liste, avant):
+            plan_apres, duree_apres = self._mesurer(requete, repetitions)
+            self.stdout.write(self.style.MIGRATE_HEADING(libelle))
+            self.stdout.write(f"  avant : {duree_avant:.2f} ms")
+            for ligne in plan_avant:
+                self.stdout.write(f"      {ligne}")
+            self.stdout.write(f"  après : {duree_apres:.2f} ms")
+            for ligne in plan_apres:
+                self.stdout.write(f"      {ligne}")
+
+    def _supprimer_index(self):
+        supprimes = 0
+        with connection.cursor() as cursor:
+            for model in MODELES:
+                existants = connection.introspection.get_constraints(cursor, model._meta.db_table)
+                for index in model._meta.indexes:
+                    if index.name in NOUVEAUX_INDEX and index.name in existants:
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+                        supprimes += 1
+        return supprimes
+
+    def _mesurer(self, requete, repetitions):
+        plan = requete.explain().splitlines()
+        meilleure = None
+        for _ in range(repetitions):
+            debut = time.perf_counter()
+            list(requete.all())
+            duree = (time.perf_counter() - debut) * 1000
+            meilleure = duree if meilleure is None else min(meilleure, duree)
+        return plan, meilleure
@@ -0,0 +1,32 @@
+"""
+Reconstruit les agrégats journaliers (DailyStats) utilisés par les tableaux de bord.
+
+Usage:
+    python manage.py rebuild_daily_stats                                  # tout l'historique
+    python manage.py rebuild_daily_stats --debut 2024-01-01 --fin 2024-12-31
+"""
+
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from aprovision.rollup import reconstruire
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Date invalide : {value} (format attendu AAAA-MM-JJ)")
+
+
+class Command(BaseCommand):
+    help = "Recalcule les statistiques journalières (ventes, dépenses, entrées de stock) à partir des données"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debut', type=_parse_date, help="Premier jour à recalculer (AAAA-MM-JJ)")
+        parser.add_argument('--fin', type=_parse_date, help="Dernier jour à recalculer (AAAA-MM-JJ)")
+
+    def handle(self, *args, **options):
+        nombre = reconstruire(debut=options['debut'], fin=options['fin'])
+        self.stdout.write(self.style.SUCCESS(f"{nombre} jour(s) recalculé(s)"))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-17 12:36
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def remplir_stats_journalieres(apps, schema_editor):
+    """Calcule les agrégats de l'historique existant"""
+    from aprovision.rollup import reconstruire
+    reconstruire(using=schema_editor.connection.alias, apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aprovision', '0002_initial'),
+        ('product', '0001_initial'),
+        ('order', '0004_ordersequence_unique_title'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('ventes', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=20)),
+                ('nb_commandes', models.PositiveIntegerField(default=0)),
+                ('articles_vendus', models.PositiveIntegerField(default=0)),
+                ('cout_produits_vendus', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=20)),
+                ('encaissements', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=20)),
+                ('depenses', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=20)),
+                ('depenses_par_type', models.JSONField(blank=True, default=dict)),
+                ('cout_entrees_stock', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('categorie', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stats_journalieres', to='product.category')),
+            ],
+            options={
+                'verbose_name': 'Statistique journalière',
+                'verbose_name_plural': 'Statistiques journalières',
+                'ordering': ['jour'],
+                'constraints': [models.UniqueConstraint(fields=('jour', 'categorie'), name='dailystats_jour_categorie_unique'), models.UniqueConstraint(condition=models.Q(('categorie__isnull', True)), fields=('jour',), name='dailystats_jour_global_unique')],
+            },
+        ),
+        migrations.RunPython(remplir_stats_journalieres, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-17 13:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aprovision', '0003_dailystats'),
+        ('order', '0007_query_indexes'),
+        ('product', '0003_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='depense',
+            index=models.Index(fields=['date_depense', 'type_depense'], name='depense_date_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mouvementstock',
+            index=models.Index(fields=['date_mouvement'], name='mvt_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mouvementstock',
+            index=models.Index(fields=['produit', 'date_mouvement'], name='mvt_produit_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mouvementstock',
+            index=models.Index(fields=['type_mouvement', 'date_mouvement'], name='mvt_type_date_idx'),
+        ),
+    ]
@@ -2,12 +2,36 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from decimal import Decimal
+from datetime import datetime, time, timedelta
+
+from blog_pos.tracking import LoadedValuesMixin
+
 
 def _currency():
     from users.models import AppSetting
     return AppSetting.get_currency_label()
 
 
+def periode_jours(champ, debut=None, fin=None):
+    """Filtres [debut 00:00, lendemain de fin 00:00[ sur un DateTimeField (heure locale).
+
+    Équivalent de champ__date__gte / champ__date__lte, mais la colonne reste nue
+    dans la requête : les index sur champ restent utilisables, alors que __date
+    l'enveloppe dans une fonction de conversion.
+    """
+    filtres = {}
+    if debut is not None:
+        filtres[f'{champ}__gte'] = _debut_du_jour(debut)
+    if fin is not None:
+        filtres[f'{champ}__lt'] = _debut_du_jour(fin + timedelta(days=1))
+    return filtres
+
+
+def _debut_du_jour(jour):
+    debut = datetime.combine(jour, time.min)
+    return timezone.make_aware(debut) if settings.USE_TZ else debut
+
+
 class TypeDepense(models.Model):
     """Types de dépenses pour catégoriser les dépenses"""
     nom = models.CharField(max_length=100, unique=True, help_text="Ex: Approvisionnement, Matériel, Main d'œuvre")
@@ -25,8 +49,11 @@ class TypeDepense(models.Model):
         return self.nom
 
 
-class Depense(models.Model):
+class Depense(LoadedValuesMixin, models.Model):
     """Enregistrement des dépenses du commerce"""
+    # Valeurs chargées : variations des statistiques journalières au save() suivant
+    loaded_fields = ('date_depense', 'montant', 'type_depense_id')
+
     type_depense = models.ForeignKey(TypeDepense, on_delete=models.PROTECT, related_name='depenses')
     description = models.CharField(max_length=200, help_text="Description de la dépense")
     montant = models.DecimalField(max_digits=10, decimal_places=2, help_text="Montant de la dépense")
@@ -45,6 +72,9 @@ class Depense(models.Model):
         verbose_name = "Dépense"
         verbose_name_plural = "Dépenses"
         ordering = ['-date_depense', '-created_at']
+        indexes = [
+            models.Index(fields=['date_depense', 'type_depense'], name='depense_date_type_idx'),
+        ]
 
     def __str__(self):
         return f"{self.description} - {self.montant} {_currency()}"
@@ -63,8 +93,10 @@ class TypeMouvement(models.TextChoices):
     AJUSTEMENT_MOINS = 'AJUSTEMENT_MOINS', 'Ajustement -'
 
 
-class MouvementStock(models.Model):
+class MouvementStock(LoadedValuesMixin, models.Model):
     """Traçabilité des mouvements de stock"""
+    loaded_fields = ('date_mouvement', 'type_mouvement')
+
     produit = models.ForeignKey('product.Product', on_delete=models.CASCADE, related_name='mouvements')
     type_mouvement = models.CharField(max_length=20, choices=TypeMouvement.choices)
     quantite = models.IntegerField(help_text="Quantité (positive pour entrée, négative pour sortie)")
@@ -94,16 +126,24 @@ class MouvementStock(models.Model):
         verbose_name = "Mouvement de Stock"
         verbose_name_plural = "Mouvements de Stock"
         ordering = ['-date_mouvement']
+        indexes = [
+            models.Index(fields=['date_mouvement'], name='mvt_date_idx'),
+            models.Index(fields=['produit', 'date_mouvement'], name='mvt_produit_date_idx'),
+            models.Index(fields=['type_mouvement', 'date_mouvement'], name='mvt_type_date_idx'),
+        ]
 
     def __str__(self):
         signe = "+" if self.quantite > 0 else ""
         return f"{self.produit.title} - {signe}{self.quantite} ({self.get_type_mouvement_display()})"
 
     def save(self, *args, **kwargs):
-        # Calculer le coût total si prix d'achat fourni
+        self.calculer_cout_total()
+        super().save(*args, **kwargs)
+
+    def calculer_cout_total(self):
+        """Calculer le coût total si prix d'achat fourni (aussi utilisé avant un bulk_create)"""
         if self.prix_achat_unitaire and self.quantite:
             self.cout_total = Decimal(abs(self.quantite)) * self.prix_achat_unitaire
-        super().save(*args, **kwargs)
 
     def get_couleur_badge(self):
         """Retourne la couleur du badge selon le type de mouvement"""
@@ -128,6 +168,46 @@ class MouvementStock(models.Model):
         return icones.get(self.type_mouvement, 'bi-arrow-right-circle')
 
 
+class DailyStats(models.Model):
+    """Agrégats journaliers pré-calculés pour les tableaux de bord (voir aprovision.rollup).
+
+    Une ligne globale par jour (categorie vide) et une ligne par catégorie de produits vendue
+    ou approvisionnée ce jour-là. Les dépenses et encaissements ne sont portés que par la ligne globale.
+    """
+    jour = models.DateField()
+    categorie = models.ForeignKey('product.Category', on_delete=models.CASCADE, null=True, blank=True,
+                                  related_name='stats_journalieres')
+
+    # Ventes (commandes contenant au moins un produit)
+    ventes = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0.00'))
+    nb_commandes = models.PositiveIntegerField(default=0)
+    articles_vendus = models.PositiveIntegerField(default=0)
+    cout_produits_vendus = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0.00'))
+    encaissements = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0.00'))
+
+    # Dépenses : total et détail {id du type: {"total": "...", "nombre": n}}
+    depenses = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0.00'))
+    depenses_par_type = models.JSONField(default=dict, blank=True)
+
+    # Coût des entrées de stock (mouvements ENTREE)
+    cout_entrees_stock = models.DecimalField(max_digits=20, decimal_places=2, default=Decimal('0.00'))
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Statistique journalière"
+        verbose_name_plural = "Statistiques journalières"
+        ordering = ['jour']
+        constraints = [
+            models.UniqueConstraint(fields=['jour', 'categorie'], name='dailystats_jour_categorie_unique'),
+            models.UniqueConstraint(fields=['jour'], condition=models.Q(categorie__isnull=True),
+                                    name='dailystats_jour_global_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.jour} - {self.categorie or 'Global'}"
+
+
 class ApprovisionnementManager(models.Manager):
     """Manager pour les approvisionnements"""
     
@@ -156,12 +236,12 @@ class ApprovisionnementManager(models.Manager):
                 created_by=user
             )
             
-            # 2. Sauvegarder l'ancien stock
-            stock_avant = produit.qty
+            # 2. Mettre à jour le stock du produit (incrément atomique)
+            from product.models import Product
+            Product.objects.increment_stock(produit, quantite)
             
-            # 3. Mettre à jour le stock du produit
-            produit.qty += quantite
-            produit.save()
+            # 3. Ancien stock déduit de la nouvelle quantité retournée
+            stock_avant = produit.qty - quantite
             
             # 4. Créer le mouvement de stock
             mouvement = MouvementStock.objects.create(
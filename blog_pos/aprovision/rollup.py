@@ -0,0 +1,370 @@
+"""
+Agrégats journaliers (DailyStats) pour les tableaux de bord.
+
+Chaque écriture sur les commandes, lignes, paiements, dépenses ou entrées de stock
+ajoute sa variation aux lignes de son jour (cumuler_jour, appelé depuis
+aprovision.signals) : un UPSERT « compteur = compteur + variation » par ligne
+touchée, dans la transaction de l'écriture (annulé avec elle). Les tableaux de
+bord lisent ensuite quelques lignes pré-calculées (charger_lignes / resumer_periode)
+au lieu de parcourir toutes les commandes et dépenses de la période.
+
+Les recalculs complets d'un jour (rafraichir_jours) sont réservés aux événements
+rares (commande supprimée ou changée de jour), à la réconciliation et à la
+reconstruction :
+    python manage.py rebuild_daily_stats   # reconstruit toutes les lignes
+"""
+
+import datetime
+from decimal import Decimal
+
+from django.apps import apps as django_apps
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import periode_jours
+
+
+ZERO = Decimal('0.00')
+
+# Compteurs additifs d'une ligne DailyStats (variations appliquées par cumuler_jour)
+COMPTEURS = (
+    'ventes', 'nb_commandes', 'articles_vendus', 'cout_produits_vendus',
+    'encaissements', 'depenses', 'cout_entrees_stock',
+)
+# Compteurs entiers positifs : bornés à 0 si une variation dépasse une ligne déjà fausse
+COMPTEURS_ENTIERS = ('nb_commandes', 'articles_vendus')
+
+
+# === MAINTENANCE ===
+
+def jour_local(jour):
+    """Jour (date) d'une date ou d'un datetime, dans le fuseau local pour un datetime"""
+    if isinstance(jour, datetime.datetime):
+        return timezone.localdate(jour) if timezone.is_aware(jour) else jour.date()
+    return jour
+
+
+def cumuler_jour(jour, categorie_id=None, using=DEFAULT_DB_ALIAS, **variations):
+    """Ajoute des variations (ventes=..., nb_commandes=...) aux compteurs de la ligne
+    (jour, catégorie) de DailyStats, créée au besoin ; categorie_id vide : ligne globale.
+
+    Un seul INSERT ... ON CONFLICT DO UPDATE SET compteur = compteur + variation quand la
+    base le permet (SQLite >= 3.24, PostgreSQL), sinon UPDATE puis INSERT si la ligne manque.
+    """
+    from .models import DailyStats
+
+    variations = {champ: valeur for champ, valeur in variations.items() if valeur}
+    if jour is None or not variations:
+        return
+    jour = jour_local(jour)
+    connection = connections[using]
+    maintenant = timezone.now()
+
+    if not connection.features.supports_update_conflicts_with_target:
+        with transaction.atomic(using=using):
+            lignes = DailyStats.objects.using(using).filter(
+                jour=jour, **({'categorie__isnull': True} if categorie_id is None else {'categorie_id': categorie_id})
+            )
+            maj = {
+                champ: Case(When(**{f'{champ}__lt': -valeur}, then=Value(0)), default=F(champ) + valeur)
+                if champ in COMPTEURS_ENTIERS else F(champ) + valeur
+                for champ, valeur in variations.items()
+            }
+            if not lignes.update(updated_at=maintenant, **maj):
+                DailyStats.objects.using(using).create(
+                    jour=jour, categorie_id=categorie_id, depenses_par_type={},
+                    **{champ: max(valeur, 0) if champ in COMPTEURS_ENTIERS else valeur for champ, valeur in variations.items()},
+                )
+        return
+
+    qn = connection.ops.quote_name
+    opts = DailyStats._meta
+    table = qn(opts.db_table)
+    valeurs = {'jour': jour, 'categorie': categorie_id, 'depenses_par_type': {}, 'updated_at': maintenant}
+    for champ in COMPTEURS:
+        valeur = variations.get(champ, 0)
+        valeurs[champ] = max(valeur, 0) if champ in COMPTEURS_ENTIERS else valeur
+    colonnes, parametres = [], []
+    for nom, valeur in valeurs.items():
+        field = opts.get_field(nom)
+        colonnes.append(qn(field.column))
+        parametres.append(field.get_db_prep_save(valeur, connection))
+
+    affectations = [f'{qn("updated_at")} = excluded.{qn("updated_at")}']
+    for champ, valeur in variations.items():
+        colonne = f'{table}.{qn(champ)}'
+        if champ in COMPTEURS_ENTIERS:
+            affectations.append(f'{qn(champ)} = CASE WHEN {colonne} + %s < 0 THEN 0 ELSE {colonne} + %s END')
+            parametres.extend([valeur, valeur])
+        else:
+            affectations.append(f'{qn(champ)} = {colonne} + %s')
+            parametres.append(opts.get_field(champ).get_db_prep_save(valeur, connection))
+    # Deux index uniques : (jour) pour la ligne globale (index partiel), (jour, catégorie) sinon
+    if categorie_id is None:
+        cible = f'({qn("jour")}) WHERE {qn("categorie_id")} IS NULL'
+    else:
+        cible = f'({qn("jour")}, {qn("categorie_id")})'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({", ".join(colonnes)}) VALUES ({", ".join(["%s"] * len(colonnes))}) '
+            f'ON CONFLICT {cible} DO UPDATE SET {", ".join(affectations)}',
+            parametres,
+        )
+
+
+def recompter_depenses_par_type(jours, using=DEFAULT_DB_ALIAS):
+    """Réécrit le détail des dépenses par type des lignes globales des jours donnés.
+
+    Le détail est un JSON (pas de variation en SQL) : il est recalculé par une requête
+    d'agrégat sur les dépenses de ces jours seulement.
+    """
+    from .models import DailyStats, Depense
+
+    jours = sorted({jour_local(jour) for jour in jours if jour is not None})
+    if not jours:
+        return
+    detail = {jour: {} for jour in jours}
+    lignes = (
+        Depense.objects.using(using).filter(date_depense__in=jours).order_by()
+        .values('date_depense', 'type_depense_id').annotate(total=Sum('montant'), nombre=Count('id'))
+    )
+    for row in lignes:
+        detail[row['date_depense']][str(row['type_depense_id'])] = {
+            'total': str(row['total'] or ZERO), 'nombre': row['nombre'],
+        }
+    for jour, par_type in detail.items():
+        globale = DailyStats.objects.using(using).filter(jour=jour, categorie__isnull=True)
+        if not globale.update(depenses_par_type=par_type, updated_at=timezone.now()) and par_type:
+            DailyStats.objects.using(using).create(jour=jour, depenses_par_type=par_type)
+
+
+def rafraichir_jours(jours, using=DEFAULT_DB_ALIAS, apps=django_apps):
+    """Recalcule entièrement les lignes DailyStats des jours donnés (5 requêtes d'agrégat,
+    quel que soit le nombre de jours) ; pour la réconciliation et les événements rares.
+
+    apps permet l'appel depuis une migration avec les modèles historiques.
+    """
+    jours = sorted({jour_local(jour) for jour in jours if jour is not None})
+    if not jours:
+        return 0
+
+    Order = apps.get_model('order', 'Order')
+    OrderItem = apps.get_model('order', 'OrderItem')
+    Payment = apps.get_model('order', 'Payment')
+    Depense = apps.get_model('aprovision', 'Depense')
+    MouvementStock = apps.get_model('aprovision', 'MouvementStock')
+    DailyStats = apps.get_model('aprovision', 'DailyStats')
+
+    lignes = {}
+
+    def ligne(jour, categorie_id=None):
+        if (jour, categorie_id) not in lignes:
+            lignes[(jour, categorie_id)] = DailyStats(jour=jour, categorie_id=categorie_id, depenses_par_type={})
+        return lignes[(jour, categorie_id)]
+
+    # Ventes : commandes contenant au moins un produit
+    commandes = (
+        Order.objects.using(using)
+        .filter(date__in=jours)
+        .filter(Exists(OrderItem.objects.filter(order=OuterRef('pk'))))
+        .order_by()
+        .values('date')
+        .annotate(ventes=Sum('final_value'), nombre=Count('id'))
+    )
+    for row in commandes:
+        stats = ligne(row['date'])
+        stats.ventes = row['ventes'] or ZERO
+        stats.nb_commandes = row['nombre']
+
+    # Articles vendus et coût des produits vendus, par catégorie
+    articles = (
+        OrderItem.objects.using(using)
+        .filter(order__date__in=jours)
+        .order_by()
+        .values('order__date', 'product__category_id')
+        .annotate(
+            ventes=Sum('total_price'),
+            articles=Sum('qty'),
+            cout=Sum(F('qty') * F('product__prix_achat')),
+            nombre=Count('order_id', distinct=True),
+        )
+    )
+    for row in articles:
+        cout = row['cout'] or ZERO
+        stats = ligne(row['order__date'])
+        stats.articles_vendus += row['articles'] or 0
+        stats.cout_produits_vendus += cout
+        if row['product__category_id'] is not None:
+            stats = ligne(row['order__date'], row['product__category_id'])
+            stats.ventes = row['ventes'] or ZERO
+            stats.nb_commandes = row['nombre']
+            stats.articles_vendus = row['articles'] or 0
+            stats.cout_produits_vendus = cout
+
+    # Encaissements du jour
+    paiements = (
+        Payment.objects.using(using)
+        .filter(date__in=jours)
+        .order_by()
+        .values('date')
+        .annotate(total=Sum('amount'))
+    )
+    for row in paiements:
+        ligne(row['date']).encaissements = row['total'] or ZERO
+
+    # Dépenses, au total et par type
+    depenses = (
+        Depense.objects.using(using)
+        .filter(date_depense__in=jours)
+        .order_by()
+        .values('date_depense', 'type_depense_id')
+        .annotate(total=Sum('montant'), nombre=Count('id'))
+    )
+    for row in depenses:
+        stats = ligne(row['date_depense'])
+        total = row['total'] or ZERO
+        stats.depenses += total
+        stats.depenses_par_type[str(row['type_depense_id'])] = {'total': str(total), 'nombre': row['nombre']}
+
+    # Coût des entrées de stock, au total et par catégorie
+    entrees = (
+        MouvementStock.objects.using(using)
+        .filter(type_mouvement='ENTREE', cout_total__isnull=False)
+        # Intervalle couvrant les jours demandés (index type_mouvement + date_mouvement), les autres jours sont ignorés
+        .filter(**periode_jours('date_mouvement', jours[0], jours[-1]))
+        .order_by()
+        .values(jour=TruncDate('date_mouvement'), categorie_id=F('produit__category_id'))
+        .annotate(total=Sum('cout_total'))
+    )
+    demandes = set(jours)
+    for row in entrees:
+        if row['jour'] not in demandes:
+            continue
+        total = row['total'] or ZERO
+        ligne(row['jour']).cout_entrees_stock += total
+        if row['categorie_id'] is not None:
+            ligne(row['jour'], row['categorie_id']).cout_entrees_stock += total
+
+    with transaction.atomic(using=using):
+        DailyStats.objects.using(using).filter(jour__in=jours).delete()
+        DailyStats.objects.using(using).bulk_create(lignes.values())
+    return len(jours)
+
+
+def reconstruire(debut=None, fin=None, using=DEFAULT_DB_ALIAS, apps=django_apps, taille_lot=90):
+    """Recalcule toutes les lignes (ou celles de la période donnée). Retourne le nombre de jours traités"""
+    Order = apps.get_model('order', 'Order')
+    Payment = apps.get_model('order', 'Payment')
+    Depense = apps.get_model('aprovision', 'Depense')
+    MouvementStock = apps.get_model('aprovision', 'MouvementStock')
+    DailyStats = apps.get_model('aprovision', 'DailyStats')
+
+    # Jours ayant une activité, plus ceux déjà présents (pour effacer les lignes devenues vides)
+    jours = set()
+    for model, champ in ((Order, 'date'), (Payment, 'date'), (Depense, 'date_depense'), (DailyStats, 'jour')):
+        jours.update(model.objects.using(using).order_by().values_list(champ, flat=True).distinct())
+    jours.update(
+        MouvementStock.objects.using(using).filter(type_mouvement='ENTREE')
+        .annotate(jour=TruncDate('date_mouvement')).order_by().values_list('jour', flat=True).distinct()
+    )
+    jours = sorted(
+        jour for jour in jours
+        if jour is not None and (debut is None or jour >= debut) and (fin is None or jour <= fin)
+    )
+
+    for i in range(0, len(jours), taille_lot):
+        rafraichir_jours(jours[i:i + taille_lot], using=using, apps=apps)
+    return len(jours)
+
+
+# === LECTURE ===
+
+def lignes_periode(debut, fin, categorie=None):
+    """Queryset des lignes globales de la période (et de celles de la catégorie demandée)"""
+    from .models import DailyStats
+
+    filtre = Q(categorie__isnull=True)
+    if categorie is not None:
+        filtre |= Q(categorie=categorie)
+    return DailyStats.objects.filter(filtre, jour__gte=debut, jour__lte=fin).order_by('jour')
+
+
+def charger_lignes(debut, fin, categorie=None):
+    """Lignes globales de la période (et celles de la catégorie demandée), en une requête"""
+    return list(lignes_periode(debut, fin, categorie))
+
+
+async def acharger_lignes(debut, fin, categorie=None):
+    """Comme charger_lignes, par l'ORM async"""
+    return [ligne async for ligne in lignes_periode(debut, fin, categorie)]
+
+
+def resumer_periode(lignes, debut=None, fin=None, categorie=None):
+    """Totalise des lignes chargées par charger_lignes, éventuellement restreintes à [debut, fin].
+
+    Avec une catégorie, les ventes et entrées de stock sont celles de la catégorie ;
+    les dépenses et encaissements restent globaux (ils ne sont pas liés aux produits).
+    """
+    categorie_id = getattr(categorie, 'pk', categorie)
+    resume = {
+        'ventes': ZERO,
+        'nb_commandes': 0,
+        'articles_vendus': 0,
+        'cout_produits_vendus': ZERO,
+        'encaissements': ZERO,
+        'depenses': ZERO,
+        'depenses_par_type': {},
+        'cout_entrees_stock': ZERO,
+        'ventes_par_jour': [],
+        'depenses_par_jour': [],
+    }
+
+    for stats in lignes:
+        if (debut is not None and stats.jour < debut) or (fin is not None and stats.jour > fin):
+            continue
+
+        if stats.categorie_id is None:
+            resume['encaissements'] += stats.encaissements
+            resume['depenses'] += stats.depenses
+            for type_id, detail in stats.depenses_par_type.items():
+                cumul = resume['depenses_par_type'].setdefault(int(type_id), {'total': ZERO, 'nombre': 0})
+                cumul['total'] += Decimal(detail['total'])
+                cumul['nombre'] += detail['nombre']
+            if stats.depenses:
+                resume['depenses_par_jour'].append({'date': stats.jour, 'total': stats.depenses})
+
+        if stats.categorie_id == categorie_id:
+            resume['ventes'] += stats.ventes
+            resume['nb_commandes'] += stats.nb_commandes
+            resume['articles_vendus'] += stats.articles_vendus
+            resume['cout_produits_vendus'] += stats.cout_produits_vendus
+            resume['cout_entrees_stock'] += stats.cout_entrees_stock
+            if stats.nb_commandes:
+                resume['ventes_par_jour'].append({
+                    'date': stats.jour, 'total': stats.ventes, 'nombre_commandes': stats.nb_commandes,
+                })
+
+    return resume
+
+
+def detailler_depenses_par_type(resume):
+    """Dépenses par type d'un résumé, au format des templates (nom, couleur, total, nombre), par total décroissant"""
+    from .models import TypeDepense
+
+    par_type = resume['depenses_par_type']
+    if not par_type:
+        return []
+    types = TypeDepense.objects.in_bulk(list(par_type))
+    detail = [
+        {
+            'type_depense__nom': types[type_id].nom if type_id in types else '',
+            'type_depense__couleur': types[type_id].couleur if type_id in types else '',
+            'total': cumul['total'],
+            'nombre': cumul['nombre'],
+        }
+        for type_id, cumul in par_type.items()
+    ]
+    detail.sort(key=lambda d: d['total'], reverse=True)
+    return detail
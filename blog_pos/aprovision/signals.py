@@ -1,7 +1,19 @@
-from django.db.models.signals import post_save, post_delete
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import Count, Q, Sum
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
-from order.models import Order, OrderItem
-from .models import MouvementStock, TypeMouvement
+from order.models import Order, OrderItem, Payment
+from product.models import Product
+from .journal import detacher_commande, journaliser_mouvement, journaliser_mouvements
+from .models import Depense, MouvementStock, TypeMouvement
+from .rollup import cumuler_jour, rafraichir_jours, recompter_depenses_par_type
+
+
+def _suppression_de_commande(origin):
+    """Vrai si la suppression vient d'une commande entière (cascade), gérée en bloc"""
+    return isinstance(origin, Order) or (isinstance(origin, models.QuerySet) and origin.model is Order)
 
 
 @receiver(post_save, sender=OrderItem)
@@ -10,39 +22,71 @@ def tracer_vente_produit(sender, instance, created, **kwargs):
     Signal pour tracer automatiquement les mouvements de stock lors des ventes
     """
     if created:
-        # Nouvelle vente - créer un mouvement de sortie
+        # Nouvelle vente - créer un mouvement de sortie (écrit au commit avec les autres)
         stock_avant = instance.product.qty + instance.qty  # Stock avant la vente
         
-        MouvementStock.objects.create(
+        journaliser_mouvement(MouvementStock(
             produit=instance.product,
             type_mouvement=TypeMouvement.SORTIE_VENTE,
             quantite=-instance.qty,  # Négatif pour une sortie
             stock_avant=stock_avant,
             stock_apres=instance.product.qty,
-            reference_commande=instance.order,
-            description=f"Vente - Commande #{instance.order.id}",
+            reference_commande_id=instance.order_id,
+            description=f"Vente - Commande #{instance.order_id}",
             created_by=None  # Sera défini si on a accès au user dans le contexte
-        )
+        ))
 
 
 @receiver(post_delete, sender=OrderItem)
-def annuler_mouvement_vente(sender, instance, **kwargs):
+def annuler_mouvement_vente(sender, instance, origin=None, **kwargs):
     """
     Signal pour annuler le mouvement de stock si un item de commande est supprimé
     """
-    # Restaurer le stock
-    instance.product.qty += instance.qty
-    instance.product.save()
+    # Commande entière supprimée : stock restauré en bloc par restaurer_stock_commande
+    if _suppression_de_commande(origin):
+        return
+
+    # Restaurer le stock (incrément atomique, nouvelle quantité retournée par la même requête)
+    stock_apres = Product.objects.increment_stock(instance.product_id, instance.qty)
+    if stock_apres is None:
+        return
     
     # Créer un mouvement d'ajustement pour tracer cette annulation
-    MouvementStock.objects.create(
-        produit=instance.product,
+    journaliser_mouvement(MouvementStock(
+        produit_id=instance.product_id,
         type_mouvement=TypeMouvement.AJUSTEMENT_PLUS,
         quantite=instance.qty,
-        stock_avant=instance.product.qty - instance.qty,
-        stock_apres=instance.product.qty,
-        description=f"Annulation vente - Commande #{instance.order.id}",
+        stock_avant=stock_apres - instance.qty,
+        stock_apres=stock_apres,
+        description=f"Annulation vente - Commande #{instance.order_id}",
         created_by=None
+    ))
+
+
+@receiver(pre_delete, sender=Order)
+def restaurer_stock_commande(sender, instance, **kwargs):
+    """
+    Signal pour restaurer en bloc le stock de toutes les lignes d'une commande supprimée :
+    un seul UPDATE pour les produits et une seule insertion groupée dans le journal
+    """
+    quantites = dict(
+        instance.order_items.order_by().values('product_id')
+        .annotate(total=Sum('qty')).values_list('product_id', 'total')
+    )
+    nouveaux_stocks = Product.objects.increment_stock_bulk(quantites)
+    detacher_commande(instance.id)
+
+    journaliser_mouvements(
+        MouvementStock(
+            produit_id=product_id,
+            type_mouvement=TypeMouvement.AJUSTEMENT_PLUS,
+            quantite=quantites[product_id],
+            stock_avant=stock_apres - quantites[product_id],
+            stock_apres=stock_apres,
+            description=f"Annulation vente - Commande #{instance.id}",
+            created_by=None
+        )
+        for product_id, stock_apres in nouveaux_stocks.items()
     )
 
 
@@ -55,4 +99,173 @@ def tracer_statut_commande(sender, instance, created, **kwargs):
         # Commande existante modifiée
         # On pourrait ajouter ici une logique pour tracer les changements de statut
         # Par exemple, si is_paid change de False à True
-        pass
\ No newline at end of file
+        pass
+
+
+# === AGRÉGATS JOURNALIERS (DailyStats) ===
+# Chaque écriture ajoute sa variation aux lignes de son jour (rollup.cumuler_jour), dans sa
+# propre transaction. Les valeurs d'avant une modification sont celles chargées depuis la base
+# (LoadedValuesMixin, OrderItem._loaded_*) : pas de relecture avant chaque save().
+
+@receiver(pre_save, sender=Order)
+@receiver(pre_save, sender=Payment)
+@receiver(pre_save, sender=Depense)
+@receiver(pre_save, sender=MouvementStock)
+def relire_valeurs_avant(sender, instance, raw=False, **kwargs):
+    """Instance construite à la main avec un pk (pas chargée) : relire les valeurs d'avant"""
+    if raw or instance._state.adding or instance.pk is None or instance.loaded_values() is not None:
+        return
+    valeurs = sender.objects.filter(pk=instance.pk).values(*sender.loaded_fields).first()
+    instance.remember_loaded_values(valeurs or {})
+
+
+def _avant_apres(instance, created, update_fields):
+    """(valeurs d'avant ou None pour une création, valeurs écrites), puis mémorise les nouvelles"""
+    avant = None if created else instance.loaded_values()
+    apres = {name: getattr(instance, name) for name in instance.loaded_fields}
+    if avant is not None and update_fields is not None:
+        # Champs non écrits par ce save() : inchangés en base
+        apres = {name: apres[name] if name in update_fields or name.removesuffix('_id') in update_fields else avant[name]
+                 for name in apres}
+    instance.remember_loaded_values(dict(apres))
+    return avant, apres
+
+
+def _cumuler_ligne_commande(item, qty, total, sens):
+    """Variation d'une ligne de commande (qty, total) ; sens : 1 ligne créée, -1 supprimée, 0 modifiée"""
+    order, product = item.order, item.product
+    categorie_id = product.category_id
+    cout = qty * Decimal(product.prix_achat)
+    globale = {'ventes': total, 'articles_vendus': qty, 'cout_produits_vendus': cout}
+    par_categorie = dict(globale)
+    if sens:
+        autres = OrderItem.objects.filter(order_id=item.order_id).exclude(pk=item.pk).aggregate(
+            lignes=Count('pk'), meme_categorie=Count('pk', filter=Q(product__category_id=categorie_id)),
+        )
+        if not autres['lignes']:
+            # Première ligne ou dernière retirée : la commande entre dans les ventes (ou en sort)
+            # avec sa remise
+            globale['nb_commandes'] = sens
+            globale['ventes'] = total - sens * Decimal(order.discount)
+        if not autres['meme_categorie']:
+            par_categorie['nb_commandes'] = sens
+    cumuler_jour(order.date, **globale)
+    if categorie_id is not None:
+        cumuler_jour(order.date, categorie_id, **par_categorie)
+
+
+@receiver(post_save, sender=OrderItem)
+def cumuler_stats_ligne_commande(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # OrderItem.save() garde dans _loaded_* les valeurs d'avant jusqu'après ce signal
+    qty = instance.qty - instance._loaded_qty
+    total = Decimal(instance.total_price) - Decimal(instance._loaded_total_price)
+    if created or qty or total:
+        _cumuler_ligne_commande(instance, qty, total, 1 if created else 0)
+
+
+@receiver(post_delete, sender=OrderItem)
+def decompter_stats_ligne_commande(sender, instance, origin=None, **kwargs):
+    # Commande entière supprimée : ses jours sont recalculés par recalculer_stats_commande_supprimee
+    if _suppression_de_commande(origin):
+        return
+    qty = getattr(instance, '_loaded_qty', instance.qty)
+    total = Decimal(getattr(instance, '_loaded_total_price', instance.total_price))
+    _cumuler_ligne_commande(instance, -qty, -total, -1)
+
+
+@receiver(post_save, sender=Order)
+def cumuler_stats_commande(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    avant, apres = _avant_apres(instance, created, update_fields)
+    if avant is None:
+        # Nouvelle commande : comptée dans les ventes avec sa première ligne
+        return
+    if avant['date'] != apres['date']:
+        # Commande changée de jour (rare) : recalcul complet des deux jours
+        rafraichir_jours([avant['date'], apres['date']])
+    elif avant['discount'] != apres['discount'] and instance.order_items.exists():
+        cumuler_jour(apres['date'], ventes=Decimal(avant['discount']) - Decimal(apres['discount']))
+
+
+@receiver(pre_delete, sender=Order)
+def memoriser_jours_commande_supprimee(sender, instance, **kwargs):
+    # Jour de la commande et jours de ses paiements, supprimés avec elle
+    instance._jours_stats = {instance.date, *instance.payments.order_by().values_list('date', flat=True).distinct()}
+
+
+@receiver(post_delete, sender=Order)
+def recalculer_stats_commande_supprimee(sender, instance, **kwargs):
+    rafraichir_jours(instance.__dict__.pop('_jours_stats', {instance.date}))
+
+
+@receiver(post_save, sender=Payment)
+def cumuler_stats_paiement(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    avant, apres = _avant_apres(instance, created, update_fields)
+    if avant == apres:
+        return
+    if avant is not None:
+        cumuler_jour(avant['date'], encaissements=-Decimal(avant['amount']))
+    cumuler_jour(apres['date'], encaissements=Decimal(apres['amount']))
+
+
+@receiver(post_delete, sender=Payment)
+def decompter_stats_paiement(sender, instance, origin=None, **kwargs):
+    # Paiements supprimés avec leur commande : jours recalculés par recalculer_stats_commande_supprimee
+    if _suppression_de_commande(origin):
+        return
+    valeurs = instance.loaded_values() or {'date': instance.date, 'amount': instance.amount}
+    cumuler_jour(valeurs['date'], encaissements=-Decimal(valeurs['amount']))
+
+
+@receiver(post_save, sender=Depense)
+def cumuler_stats_depense(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    avant, apres = _avant_apres(instance, created, update_fields)
+    if avant == apres:
+        return
+    jours = {apres['date_depense']}
+    if avant is not None:
+        cumuler_jour(avant['date_depense'], depenses=-Decimal(avant['montant']))
+        jours.add(avant['date_depense'])
+    cumuler_jour(apres['date_depense'], depenses=Decimal(apres['montant']))
+    recompter_depenses_par_type(jours)
+
+
+@receiver(post_delete, sender=Depense)
+def decompter_stats_depense(sender, instance, **kwargs):
+    valeurs = instance.loaded_values() or {'date_depense': instance.date_depense, 'montant': instance.montant}
+    cumuler_jour(valeurs['date_depense'], depenses=-Decimal(valeurs['montant']))
+    recompter_depenses_par_type([valeurs['date_depense']])
+
+
+def _cumuler_entree_stock(mouvement, sens):
+    if mouvement.type_mouvement != TypeMouvement.ENTREE or mouvement.cout_total is None:
+        return
+    cout = sens * Decimal(mouvement.cout_total)
+    cumuler_jour(mouvement.date_mouvement, cout_entrees_stock=cout)
+    categorie_id = mouvement.produit.category_id
+    if categorie_id is not None:
+        cumuler_jour(mouvement.date_mouvement, categorie_id, cout_entrees_stock=cout)
+
+
+@receiver(post_save, sender=MouvementStock)
+def cumuler_stats_entree_stock(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    avant, apres = _avant_apres(instance, created, update_fields)
+    if avant is None:
+        _cumuler_entree_stock(instance, 1)
+    elif TypeMouvement.ENTREE in (avant['type_mouvement'], apres['type_mouvement']):
+        # Entrée de stock modifiée (rare) : recalcul complet des jours concernés
+        rafraichir_jours([avant['date_mouvement'], apres['date_mouvement']])
+
+
+@receiver(post_delete, sender=MouvementStock)
+def decompter_stats_entree_stock(sender, instance, **kwargs):
+    _cumuler_entree_stock(instance, -1)
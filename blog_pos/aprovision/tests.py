@@ -1,3 +1,203 @@
-from django.test import TestCase
+import datetime
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from blog_pos.testing import PosTestCase
+from order.models import Order, OrderItem, Payment
+from product.models import Category
+
+from . import analytics
+from .analytics import PeriodeAnalytique
+from .journal import journaliser_mouvement
+from .models import Approvisionnement, DailyStats, Depense, MouvementStock, TypeDepense, TypeMouvement
+from .rollup import COMPTEURS, charger_lignes, reconstruire, resumer_periode
+
+JOUR = datetime.date(2026, 3, 10)
+LENDEMAIN = JOUR + datetime.timedelta(days=1)
+
+
+def etat_stats():
+    """Lignes DailyStats non vides : {(jour, catégorie): (compteurs..., détail des dépenses)}"""
+    etat = {}
+    for stats in DailyStats.objects.all():
+        valeurs = tuple(getattr(stats, champ) for champ in COMPTEURS)
+        if any(valeurs) or stats.depenses_par_type:
+            etat[(stats.jour, stats.categorie_id)] = valeurs + (stats.depenses_par_type,)
+    return etat
+
+
+class DailyStatsDeltaTests(PosTestCase):
+    """Les variations appliquées écriture par écriture donnent les mêmes lignes qu'un recalcul complet"""
+
+    def setUp(self):
+        super().setUp()
+        self.boissons = Category.objects.create(title='Boissons')
+        self.epicerie = Category.objects.create(title='Épicerie')
+        self.jus = self.make_product('Jus', qty=50, value='500.00', prix_achat='300.00', category=self.boissons)
+        self.riz = self.make_product('Riz', qty=50, value='1000.00', prix_achat='700.00', category=self.epicerie)
+        self.savon = self.make_product('Savon', qty=50, value='250.00', prix_achat='100.00')
+
+    def assertEgalRecalcul(self):
+        incremental = etat_stats()
+        reconstruire()
+        self.assertEqual(incremental, etat_stats())
+
+    def test_lines_discount_payments_and_deletions(self):
+        order = Order.objects.create(date=JOUR, discount=Decimal('50.00'))
+        jus = OrderItem.objects.create(order=order, product=self.jus, qty=2, price=self.jus.value)
+        OrderItem.objects.create(order=order, product=self.riz, qty=1, price=self.riz.value)
+        OrderItem.objects.create(order=order, product=self.savon, qty=3, price=self.savon.value)
+        jus.qty = 5
+        jus.save()
+        Payment.objects.create(order=order, amount=Decimal('1000.00'), date=JOUR)
+        paiement = Payment.objects.create(order=order, amount=Decimal('200.00'), date=LENDEMAIN)
+        self.assertEgalRecalcul()
+
+        order = Order.objects.get(pk=order.pk)
+        order.discount = Decimal('120.00')
+        order.save()
+        paiement.amount = Decimal('300.00')
+        paiement.date = JOUR
+        paiement.save()
+        OrderItem.objects.get(order=order, product=self.riz).delete()
+        self.assertEgalRecalcul()
+
+        for item in OrderItem.objects.filter(order=order):
+            item.delete()
+        self.assertEgalRecalcul()
+
+    def test_order_moved_to_another_day_and_deleted(self):
+        order = Order.objects.create(date=JOUR)
+        OrderItem.objects.create(order=order, product=self.jus, qty=1, price=self.jus.value)
+        Payment.objects.create(order=order, amount=Decimal('500.00'), date=LENDEMAIN)
+        order = Order.objects.get(pk=order.pk)
+        order.date = LENDEMAIN
+        order.save()
+        self.assertEgalRecalcul()
+        order.delete()
+        self.assertEgalRecalcul()
+        self.assertEqual(etat_stats(), {})
+
+    def test_expenses_and_stock_entries(self):
+        loyer = TypeDepense.objects.create(nom='Loyer')
+        depense = Depense.objects.create(type_depense=loyer, description='Mars', montant=Decimal('40000.00'), date_depense=JOUR)
+        Approvisionnement.objects.create_approvisionnement(self.jus, 10, Decimal('300.00'))
+        self.assertEgalRecalcul()
+
+        depense = Depense.objects.get(pk=depense.pk)
+        depense.montant = Decimal('45000.00')
+        depense.date_depense = LENDEMAIN
+        depense.save()
+        self.assertEgalRecalcul()
+        depense.delete()
+        self.assertEgalRecalcul()
+
+    def test_summary_matches_orders(self):
+        order = Order.objects.create(date=JOUR)
+        OrderItem.objects.create(order=order, product=self.riz, qty=2, price=self.riz.value)
+        resume = resumer_periode(charger_lignes(JOUR, JOUR))
+        self.assertEqual(resume['ventes'], Decimal('2000.00'))
+        self.assertEqual(resume['nb_commandes'], 1)
+        self.assertEqual(resume['cout_produits_vendus'], Decimal('1400.00'))
+
+    def test_cart_click_updates_day_rows_without_recompute(self):
+        order = Order.objects.create()
+        OrderItem.objects.create(order=order, product=self.jus, qty=1, price=self.jus.value)
+        url = reverse('ajax_add', args=[order.pk, self.jus.pk])
+        with CaptureQueriesContext(connection) as capture:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.get(url, {'qty': 1, 'mode': 'delta', 'version': 1})
+        self.assertEqual(response.status_code, 200)
+        sql = [query['sql'] for query in capture.captured_queries if 'aprovision_dailystats' in query['sql']]
+        # Ligne globale et ligne de la catégorie, une requête chacune, sans DELETE ni agrégat
+        self.assertEqual(len(sql), 2)
+        self.assertTrue(all(requete.startswith('INSERT') for requete in sql))
+        self.assertEgalRecalcul()
+
+
+class JournalMouvementsTests(PosTestCase):
+    """Mouvements de stock mis en attente et écrits au commit, par savepoint"""
+
+    def setUp(self):
+        super().setUp()
+        self.produit = self.make_product('Farine', qty=20)
+
+    def mouvement(self, quantite):
+        return MouvementStock(
+            produit=self.produit, type_mouvement=TypeMouvement.AJUSTEMENT_PLUS, quantite=quantite,
+            stock_avant=20, stock_apres=20 + quantite, description='Test',
+        )
+
+    def test_movements_are_written_together_at_commit(self):
+        with CaptureQueriesContext(connection) as capture:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                with transaction.atomic():
+                    journaliser_mouvement(self.mouvement(1))
+                    journaliser_mouvement(self.mouvement(2))
+                    self.assertFalse(MouvementStock.objects.filter(description='Test').exists())
+        self.assertEqual(len(callbacks), 1)
+        inserts = [q for q in capture.captured_queries if q['sql'].startswith('INSERT INTO "aprovision_mouvementstock"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(sorted(MouvementStock.objects.filter(description='Test').values_list('quantite', flat=True)), [1, 2])
+
+    def test_rolled_back_savepoint_drops_its_movements(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                journaliser_mouvement(self.mouvement(1))
+                try:
+                    with transaction.atomic():
+                        journaliser_mouvement(self.mouvement(5))
+                        raise ValueError
+                except ValueError:
+                    pass
+                journaliser_mouvement(self.mouvement(3))
+        self.assertEqual(sorted(MouvementStock.objects.filter(description='Test').values_list('quantite', flat=True)), [1, 3])
+
+    def test_deleted_order_is_detached_from_pending_movements(self):
+        order = Order.objects.create()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                OrderItem.objects.create(order=order, product=self.produit, qty=2, price=self.produit.value)
+                order.delete()
+        mouvements = MouvementStock.objects.filter(produit=self.produit)
+        self.assertEqual(mouvements.count(), 2)
+        self.assertFalse(mouvements.filter(reference_commande__isnull=False).exists())
+
+
+class PeriodeAnalytiqueTests(PosTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.riz = self.make_product('Riz', qty=50, value='1000.00')
+        self.savon = self.make_product('Savon', qty=50, value='250.00')
+        self.order = Order.objects.create(date=JOUR)
+        OrderItem.objects.create(order=self.order, product=self.riz, qty=2, price=self.riz.value)
+        OrderItem.objects.create(order=self.order, product=self.savon, qty=1, price=self.savon.value)
+        Payment.objects.create(order=self.order, amount=Decimal('1000.00'), date=JOUR)
+
+    def test_debts_and_top_products(self):
+        periode = PeriodeAnalytique(JOUR, JOUR)
+        self.assertEqual(periode.reste_a_payer(), Decimal('1250.00'))
+        top = periode.top_produits_ventes()
+        self.assertEqual([ligne['product__title'] for ligne in top], ['Riz', 'Savon'])
+        self.assertEqual(top[0]['total_revenue'], Decimal('2000.00'))
+
+    def test_order_written_between_reads_is_skipped(self):
+        centimes = analytics._centimes
+
+        def vente_concurrente(montant):
+            # Une caisse enregistre une vente pendant la lecture des commandes
+            if not OrderItem.objects.filter(product=self.savon, qty=5).exists():
+                nouvelle = Order.objects.create(date=JOUR)
+                OrderItem.objects.create(order=nouvelle, product=self.savon, qty=5, price=self.savon.value)
+            return centimes(montant)
+
+        with mock.patch.object(analytics, '_centimes', side_effect=vente_concurrente):
+            periode = PeriodeAnalytique(JOUR, JOUR)
+        self.assertEqual(len(periode.commande_id), 1)
+        self.assertEqual(periode.reste_a_payer(), Decimal('1250.00'))
+        self.assertEqual(periode.top_produits_ventes()[1]['total_qty'], 1)
@@ -19,6 +19,8 @@ urlpatterns = [
     # Listes
     path('mouvements/', views.MouvementListView.as_view(), name='mouvement_list'),
     path('depenses/', views.DepenseListView.as_view(), name='depense_list'),
+    path('mouvements/export/', views.MouvementExportView.as_view(), name='mouvement_export'),
+    path('depenses/export/', views.DepenseExportView.as_view(), name='depense_export'),
     
     # AJAX
     path('ajax/depense-rapide/', views.ajax_depense_rapide, name='ajax_depense_rapide'),
@@ -27,11 +27,16 @@ from django.urls import reverse_lazy
 
 from .models import (
     TypeDepense, Depense, MouvementStock, TypeMouvement, 
-    Approvisionnement
+    Approvisionnement, periode_jours
 )
+from .rollup import acharger_lignes, charger_lignes, resumer_periode, detailler_depenses_par_type
+from .analytics import PeriodeAnalytique
 from product.models import Product, Category, get_low_stock_threshold
+from product.search import aindex_available, search as search_products
 from users.models import AppSetting
 from order.models import Order, OrderItem
+from blog_pos.exports import StreamingExportMixin
+from blog_pos.pagination import KeysetPaginationMixin
 
 
 @login_required
@@ -61,24 +66,15 @@ def dashboard_view(request):
     if categorie_id:
         categorie = get_object_or_404(Category, id=categorie_id)
     
-    # === STATISTIQUES DÉPENSES ===
-    depenses_periode = Depense.objects.filter(
-        date_depense__gte=date_debut,
-        date_depense__lte=date_fin
-    )
+    # Agrégats journaliers pré-calculés de la période
+    stats = resumer_periode(charger_lignes(date_debut, date_fin))
     
+    # === STATISTIQUES DÉPENSES ===
     # Total des dépenses
-    total_depenses = depenses_periode.aggregate(
-        total=Sum('montant')
-    )['total'] or 0
+    total_depenses = stats['depenses']
     
     # Dépenses par type avec pourcentages
-    depenses_par_type = depenses_periode.values(
-        'type_depense__nom', 'type_depense__couleur'
-    ).annotate(
-        total=Sum('montant'),
-        nombre=models.Count('id')
-    ).order_by('-total')
+    depenses_par_type = detailler_depenses_par_type(stats)
     
     # Calculer les pourcentages côté serveur
     for depense_type in depenses_par_type:
@@ -89,8 +85,7 @@ def dashboard_view(request):
     
     # === STATISTIQUES MOUVEMENTS ===
     mouvements_periode = MouvementStock.objects.filter(
-        date_mouvement__date__gte=date_debut,
-        date_mouvement__date__lte=date_fin
+        **periode_jours('date_mouvement', date_debut, date_fin)
     )
     
     # Mouvements par type
@@ -102,12 +97,7 @@ def dashboard_view(request):
     )
     
     # Coût total des approvisionnements
-    cout_approvisionnements = mouvements_periode.filter(
-        type_mouvement=TypeMouvement.ENTREE,
-        cout_total__isnull=False
-    ).aggregate(
-        total=Sum('cout_total')
-    )['total'] or 0
+    cout_approvisionnements = stats['cout_entrees_stock']
     
     # === DERNIÈRES ACTIVITÉS ===
     dernieres_depenses = Depense.objects.order_by('-created_at')[:10]
@@ -261,22 +251,19 @@ def ajax_depense_rapide(request):
 
 
 @login_required
-def ajax_recherche_produits(request):
-    """AJAX - Rechercher des produits pour l'approvisionnement"""
+async def ajax_recherche_produits(request):
+    """AJAX - Rechercher des produits pour l'approvisionnement (vue async, lecture seule)"""
     if request.method == 'GET':
         search = request.GET.get('search', '').strip()
         
         if len(search) < 2:
             return JsonResponse({'success': True, 'produits': []})
         
-        produits = Product.objects.filter(
-            Q(title__icontains=search) |
-            Q(category__title__icontains=search),
-            active=True
-        )[:10]
+        produits = Product.objects.filter(active=True).select_related('category')
+        produits = search_products(produits, search, limit=10, use_index=await aindex_available(produits.db))
         
         produits_data = []
-        for produit in produits:
+        async for produit in produits:
             produits_data.append({
                 'id': produit.id,
                 'title': produit.title,
@@ -311,8 +298,8 @@ def ajax_get_types_depense(request):
 
 
 @login_required
-def ajax_get_dashboard_stats(request):
-    """AJAX - Récupérer les statistiques du dashboard"""
+async def ajax_get_dashboard_stats(request):
+    """AJAX - Récupérer les statistiques du dashboard (vue async, lecture seule)"""
     if request.method == 'GET':
         # Période par défaut : 30 derniers jours
         today = timezone.now().date()
@@ -331,23 +318,14 @@ def ajax_get_dashboard_stats(request):
                 lambda: timezone.now().date()
             )
         
-        # Statistiques
-        total_depenses = Depense.objects.filter(
-            date_depense__gte=date_debut,
-            date_depense__lte=date_fin
-        ).aggregate(total=Sum('montant'))['total'] or 0
-        
-        total_mouvements = MouvementStock.objects.filter(
-            date_mouvement__date__gte=date_debut,
-            date_mouvement__date__lte=date_fin
-        ).count()
+        # Statistiques (agrégats journaliers pré-calculés)
+        stats = resumer_periode(await acharger_lignes(date_debut, date_fin))
+        total_depenses = stats['depenses']
+        cout_approvisionnements = stats['cout_entrees_stock']
         
-        cout_approvisionnements = MouvementStock.objects.filter(
-            date_mouvement__date__gte=date_debut,
-            date_mouvement__date__lte=date_fin,
-            type_mouvement=TypeMouvement.ENTREE,
-            cout_total__isnull=False
-        ).aggregate(total=Sum('cout_total'))['total'] or 0
+        total_mouvements = await MouvementStock.objects.filter(
+            **periode_jours('date_mouvement', date_debut, date_fin)
+        ).acount()
         
         return JsonResponse({
             'success': True,
@@ -390,74 +368,35 @@ def analytics_dashboard(request):
     if categorie_id:
         categorie = get_object_or_404(Category, id=categorie_id)
     
-    # === STATISTIQUES DÉPENSES ===
-    depenses_periode = Depense.objects.filter(
-        date_depense__gte=date_debut,
-        date_depense__lte=date_fin
-    )
+    # Agrégats journaliers pré-calculés (lignes globales et de la catégorie sélectionnée)
+    # Les dépenses ne sont pas liées aux produits : elles restent globales même avec une catégorie
+    stats = resumer_periode(charger_lignes(date_debut, date_fin, categorie), categorie=categorie)
     
-    # Filtrer par catégorie si sélectionnée
-    if categorie:
-        # Pour les dépenses, on ne peut pas filtrer par catégorie directement
-        # car les dépenses ne sont pas liées aux produits
-        pass
-    
-    total_depenses = depenses_periode.aggregate(
-        total=Sum('montant')
-    )['total'] or 0
+    # === STATISTIQUES DÉPENSES ===
+    total_depenses = stats['depenses']
     
     # Dépenses par type
-    depenses_par_type = depenses_periode.values(
-        'type_depense__nom', 'type_depense__couleur'
-    ).annotate(
-        total=Sum('montant'),
-        nombre=Count('id')
-    ).order_by('-total')
+    depenses_par_type = detailler_depenses_par_type(stats)
     
     # === SÉRIES DÉPENSES PAR JOUR (POUR LE GRAPHIQUE) ===
-    depenses_series = (
-        depenses_periode.values('date_depense')
-        .annotate(total=Sum('montant'))
-        .order_by('date_depense')
-    )
     # Adapter au format attendu par le template JS
     depenses_par_jour = [
         {
-            'date_depense': d['date_depense'].strftime('%Y-%m-%d') if d['date_depense'] else None,
-            'total': float(d['total'] or 0),
+            'date_depense': d['date'].strftime('%Y-%m-%d'),
+            'total': float(d['total']),
         }
-        for d in depenses_series
+        for d in stats['depenses_par_jour']
     ]
 
     # === STATISTIQUES DE VENTE ===
-    # Commandes de la période (avec des produits vendus)
-    commandes_periode = Order.objects.filter(
-        date__gte=date_debut,
-        date__lte=date_fin,
-        order_items__isnull=False  # Commandes avec des produits
-    ).distinct()
-    
-    # Filtrer par catégorie si sélectionnée
-    if categorie:
-        # Filtrer les commandes par les produits de la catégorie sélectionnée
-        commandes_periode = commandes_periode.filter(
-            order_items__product__category=categorie
-        ).distinct()
-    
-    # Total des ventes en argent (toutes les commandes avec des produits)
-    total_ventes_argent = commandes_periode.aggregate(
-        total=Sum('final_value')
-    )['total'] or 0
+    # Total des ventes en argent (pour une catégorie : montant des lignes de cette catégorie)
+    total_ventes_argent = stats['ventes']
     
     # Nombre de commandes
-    total_ventes_nombre_commandes = commandes_periode.count()
+    total_ventes_nombre_commandes = stats['nb_commandes']
     
     # Nombre total de produits vendus
-    total_ventes_nombre_produits = OrderItem.objects.filter(
-        order__in=commandes_periode
-    ).aggregate(
-        total=Sum('qty')
-    )['total'] or 0
+    total_ventes_nombre_produits = stats['articles_vendus']
     
     # Panier moyen (total ventes / nombre commandes)
     panier_moyen = 0
@@ -468,39 +407,21 @@ def analytics_dashboard(request):
     marge_beneficiaire = total_ventes_argent - total_depenses
     
     # === BÉNÉFICE (VENTES - COÛT DES PRODUITS VENDUS) ===
-    # Calculer le coût total des produits vendus (basé sur prix_achat)
-    cout_produits_vendus = OrderItem.objects.filter(
-        order__in=commandes_periode
-    ).aggregate(
-        total=Sum(models.F('qty') * models.F('product__prix_achat'))
-    )['total'] or 0
+    # Coût total des produits vendus (basé sur prix_achat)
+    cout_produits_vendus = stats['cout_produits_vendus']
     
     benefice = total_ventes_argent - cout_produits_vendus
     
-    # === RESTE À PAYER (DETTES) ===
-    # Commandes non payées de la période
-    commandes_impayees = Order.objects.filter(
-        date__gte=date_debut,
-        date__lte=date_fin,
-        is_paid=False  # Seulement les commandes non payées
-    )
+    # Commandes et lignes de la période chargées en colonnes (2 requêtes)
+    periode = PeriodeAnalytique(date_debut, date_fin)
     
-    # Filtrer par catégorie si sélectionnée
-    if categorie:
-        commandes_impayees = commandes_impayees.filter(
-            order_items__product__category=categorie
-        ).distinct()
-    
-    # Total des dettes (en tenant compte des paiements partiels)
-    reste_a_payer = sum(
-        commande.remaining_amount()
-        for commande in commandes_impayees
-    )
+    # === RESTE À PAYER (DETTES) ===
+    # Total des dettes des commandes non payées (en tenant compte des paiements partiels)
+    reste_a_payer = periode.reste_a_payer(categorie)
     
     # === MOUVEMENTS DE STOCK ===
     mouvements_periode = MouvementStock.objects.filter(
-        date_mouvement__date__gte=date_debut,
-        date_mouvement__date__lte=date_fin
+        **periode_jours('date_mouvement', date_debut, date_fin)
     )
     
     # Filtrer par catégorie si sélectionnée
@@ -518,28 +439,15 @@ def analytics_dashboard(request):
     )
 
     # Coût total des approvisionnements (entrées) pour la période
-    total_approvisionnements = (
-        mouvements_periode.filter(
-            type_mouvement=TypeMouvement.ENTREE, cout_total__isnull=False
-        ).aggregate(total=Sum('cout_total'))['total']
-        or 0
-    )
+    total_approvisionnements = stats['cout_entrees_stock']
     
     # === TOP PRODUITS ===
     # Produits les plus vendus
-    top_produits_ventes = OrderItem.objects.filter(
-        order__in=commandes_periode
-    ).values(
-        'product__title', 'product__category__title'
-    ).annotate(
-        total_qty=Sum('qty'),
-        total_revenue=Sum('total_price')
-    ).order_by('-total_qty')[:5]
+    top_produits_ventes = periode.top_produits_ventes(categorie)
     
     # Produits avec le plus de mouvements
     produits_qs = Product.objects.filter(
-        mouvements__date_mouvement__date__gte=date_debut,
-        mouvements__date_mouvement__date__lte=date_fin
+        **periode_jours('mouvements__date_mouvement', date_debut, date_fin)
     )
     
     if categorie:
@@ -551,29 +459,13 @@ def analytics_dashboard(request):
     ).order_by('-total_mouvements')[:5]
     
     # === ÉVOLUTION DES VENTES ===
-    # Données pour le graphique d'évolution des ventes
-    ventes_series = Order.objects.filter(
-        date__gte=date_debut,
-        date__lte=date_fin,
-        order_items__isnull=False
-    ).values('date').annotate(
-        total_ventes=Sum('final_value'),
-        nombre_commandes=Count('id')
-    ).order_by('date')
-    
-    # Filtrer par catégorie si sélectionnée
-    if categorie:
-        ventes_par_jour = ventes_par_jour.filter(
-            order_items__product__category=categorie
-        )
-    
-    # Adapter au format attendu par le template JS
+    # Données pour le graphique d'évolution des ventes, au format attendu par le template JS
     ventes_par_jour = [
         {
-            'date': v['date'].strftime('%Y-%m-%d') if v['date'] else None,
-            'total': float(v['total_ventes'] or 0),
+            'date': v['date'].strftime('%Y-%m-%d'),
+            'total': float(v['total']),
         }
-        for v in ventes_series
+        for v in stats['ventes_par_jour']
     ]
     
     context = {
@@ -633,53 +525,25 @@ def ajax_analytics_data(request):
         if categorie_id:
             categorie = get_object_or_404(Category, id=categorie_id)
         
-        # === STATISTIQUES DÉPENSES ===
-        depenses_periode = Depense.objects.filter(
-            date_depense__gte=date_debut,
-            date_depense__lte=date_fin
-        )
+        # Agrégats journaliers pré-calculés (dépenses globales, ventes de la catégorie si sélectionnée)
+        stats = resumer_periode(charger_lignes(date_debut, date_fin, categorie), categorie=categorie)
         
-        total_depenses = depenses_periode.aggregate(
-            total=Sum('montant')
-        )['total'] or 0
+        # === STATISTIQUES DÉPENSES ===
+        total_depenses = stats['depenses']
         
         # Série dépenses par jour
-        depenses_series = (
-            depenses_periode.values('date_depense')
-            .annotate(total=Sum('montant'))
-            .order_by('date_depense')
-        )
         depenses_par_jour = [
             {
-                'date_depense': d['date_depense'].strftime('%Y-%m-%d') if d['date_depense'] else None,
-                'total': float(d['total'] or 0),
+                'date_depense': d['date'].strftime('%Y-%m-%d'),
+                'total': float(d['total']),
             }
-            for d in depenses_series
+            for d in stats['depenses_par_jour']
         ]
         
         # === STATISTIQUES VENTES ===
-        commandes_periode = Order.objects.filter(
-            date__gte=date_debut,
-            date__lte=date_fin,
-            order_items__isnull=False
-        ).distinct()
-        
-        if categorie:
-            commandes_periode = commandes_periode.filter(
-                order_items__product__category=categorie
-            ).distinct()
-        
-        total_ventes_argent = commandes_periode.aggregate(
-            total=Sum('final_value')
-        )['total'] or 0
-        
-        total_ventes_nombre_commandes = commandes_periode.count()
-        
-        total_ventes_nombre_produits = OrderItem.objects.filter(
-            order__in=commandes_periode
-        ).aggregate(
-            total=Sum('qty')
-        )['total'] or 0
+        total_ventes_argent = stats['ventes']
+        total_ventes_nombre_commandes = stats['nb_commandes']
+        total_ventes_nombre_produits = stats['articles_vendus']
         
         panier_moyen = 0
         if total_ventes_nombre_commandes > 0:
@@ -688,66 +552,27 @@ def ajax_analytics_data(request):
         marge_beneficiaire = total_ventes_argent - total_depenses
         
         # === BÉNÉFICE ===
-        cout_produits_vendus = OrderItem.objects.filter(
-            order__in=commandes_periode
-        ).aggregate(
-            total=Sum(models.F('qty') * models.F('product__prix_achat'))
-        )['total'] or 0
-        
-        benefice = total_ventes_argent - cout_produits_vendus
+        benefice = total_ventes_argent - stats['cout_produits_vendus']
         
         # === RESTE À PAYER ===
-        commandes_impayees = Order.objects.filter(
-            date__gte=date_debut,
-            date__lte=date_fin,
-            is_paid=False
-        )
-        
+        # Somme SQL de la colonne remaining_amount (une requête)
+        commandes_impayees = Order.objects.filter(date__gte=date_debut, date__lte=date_fin)
         if categorie:
             commandes_impayees = commandes_impayees.filter(
                 order_items__product__category=categorie
             ).distinct()
-        
-        reste_a_payer = sum(
-            commande.remaining_amount()
-            for commande in commandes_impayees
-        )
+        reste_a_payer = commandes_impayees.total_balance()
         
         # === APPROVISIONNEMENTS ===
-        mouvements_periode = MouvementStock.objects.filter(
-            date_mouvement__date__gte=date_debut,
-            date_mouvement__date__lte=date_fin
-        )
-        if categorie:
-            mouvements_periode = mouvements_periode.filter(produit__category=categorie)
-        total_approvisionnements = (
-            mouvements_periode.filter(
-                type_mouvement=TypeMouvement.ENTREE, cout_total__isnull=False
-            ).aggregate(total=Sum('cout_total'))['total']
-            or 0
-        )
+        total_approvisionnements = stats['cout_entrees_stock']
         
         # === ÉVOLUTION DES VENTES ===
-        ventes_par_jour = Order.objects.filter(
-            date__gte=date_debut,
-            date__lte=date_fin,
-            order_items__isnull=False
-        ).values('date').annotate(
-            total_ventes=Sum('final_value'),
-            nombre_commandes=Count('id')
-        ).order_by('date')
-        
-        if categorie:
-            ventes_par_jour = ventes_par_jour.filter(
-                order_items__product__category=categorie
-            )
-        
         ventes_par_jour = [
             {
-                'date': v['date'].strftime('%Y-%m-%d') if v['date'] else None,
-                'total': float(v['total_ventes'] or 0),
+                'date': v['date'].strftime('%Y-%m-%d'),
+                'total': float(v['total']),
             }
-            for v in ventes_par_jour
+            for v in stats['ventes_par_jour']
         ]
         
         return JsonResponse({
@@ -827,12 +652,13 @@ def ajax_create_type_depense(request):
     return JsonResponse({'success': False, 'error': 'Méthode non autorisée'})
 
 
-class MouvementListView(ListView):
+class MouvementListView(KeysetPaginationMixin, ListView):
     """Liste des mouvements de stock"""
     model = MouvementStock
     template_name = 'aprovision/mouvement_list.html'
     context_object_name = 'mouvements'
     paginate_by = 50
+    keyset_ordering = ('-date_mouvement', '-pk')
     
     def get_queryset(self):
         queryset = MouvementStock.objects.select_related(
@@ -848,13 +674,10 @@ class MouvementListView(ListView):
         if produit_id:
             queryset = queryset.filter(produit_id=produit_id)
         
-        date_debut = self.request.GET.get('date_debut')
-        if date_debut:
-            queryset = queryset.filter(date_mouvement__date__gte=date_debut)
-        
-        date_fin = self.request.GET.get('date_fin')
-        if date_fin:
-            queryset = queryset.filter(date_mouvement__date__lte=date_fin)
+        date_debut = parse_date_with_default(self.request.GET.get('date_debut'), lambda: None)
+        date_fin = parse_date_with_default(self.request.GET.get('date_fin'), lambda: None)
+        if date_debut or date_fin:
+            queryset = queryset.filter(**periode_jours('date_mouvement', date_debut, date_fin))
         
         return queryset
     
@@ -865,12 +688,33 @@ class MouvementListView(ListView):
         return context
 
 
-class DepenseListView(ListView):
+class MouvementExportView(StreamingExportMixin, MouvementListView):
+    """Export CSV / XLSX des mouvements filtrés (mêmes filtres que la liste), en flux"""
+    export_filename = 'mouvements-stock'
+    export_sheet_name = 'Mouvements'
+    export_columns = (
+        ('Date', 'date_mouvement'),
+        ('Produit', 'produit__title'),
+        ('Catégorie', 'produit__category__title'),
+        ('Type', 'type_mouvement', dict(TypeMouvement.choices).get),
+        ('Quantité', 'quantite'),
+        ('Stock avant', 'stock_avant'),
+        ('Stock après', 'stock_apres'),
+        ("Prix d'achat unitaire", 'prix_achat_unitaire'),
+        ('Coût total', 'cout_total'),
+        ('Commande', 'reference_commande__title'),
+        ('Dépense', 'reference_depense__description'),
+        ('Description', 'description'),
+        ('Utilisateur', 'created_by__username'),
+    )
+
+class DepenseListView(KeysetPaginationMixin, ListView):
     """Liste des dépenses"""
     model = Depense
     template_name = 'aprovision/depense_list.html'
     context_object_name = 'depenses'
     paginate_by = 50
+    keyset_ordering = ('-date_depense', '-pk')
     
     def get_queryset(self):
         queryset = Depense.objects.select_related('type_depense').order_by('-date_depense')
@@ -901,4 +745,21 @@ class DepenseListView(ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['types_depense'] = TypeDepense.objects.filter(actif=True)
-        return context
\ No newline at end of file
+        return context
+
+
+class DepenseExportView(StreamingExportMixin, DepenseListView):
+    """Export CSV / XLSX des dépenses filtrées (mêmes filtres que la liste), en flux"""
+    export_filename = 'depenses'
+    export_sheet_name = 'Dépenses'
+    export_columns = (
+        ('Date', 'date_depense'),
+        ('Type', 'type_depense__nom'),
+        ('Description', 'description'),
+        ('Montant', 'montant'),
+        ('Fournisseur', 'fournisseur'),
+        ('Référence', 'reference'),
+        ('Notes', 'notes'),
+        ('Saisie le', 'created_at'),
+        ('Utilisateur', 'created_by__username'),
+    )
@@ -0,0 +1,296 @@
+"""
+Exports CSV / XLSX en flux des listes (commandes, mouvements de stock, dépenses).
+
+Les lignes sont lues par values_list() et .iterator(chunk_size=EXPORT_CHUNK_SIZE),
+mises en forme par morceaux d'environ STREAM_CHUNK_SIZE octets et envoyées par une
+StreamingHttpResponse : la mémoire reste constante quel que soit le nombre de
+lignes, et l'en-tête part avant même que la requête SQL soit exécutée.
+
+Sous ASGI (Uvicorn, Welto.py), Django consomme un itérateur synchrone d'un seul bloc
+(sync_to_async(list)) avant d'envoyer le premier octet : streaming_response() fournit
+alors un itérateur async qui lit un morceau par appel sync_to_async.
+
+Les textes commençant par =, +, -, @ (ou tabulation / retour chariot) sont préfixés
+d'une apostrophe : un nom de client ou de produit ne peut pas devenir une formule.
+
+Le XLSX est écrit sans dépendance (zipfile + SpreadsheetML minimal, textes en
+ligne) : les montants restent des nombres et les dates de vraies dates Excel.
+"""
+
+import csv
+import datetime
+import io
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+EXPORT_CHUNK_SIZE = 2000
+STREAM_CHUNK_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Débuts de texte interprétés comme une formule par les tableurs
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+# Caractères de contrôle refusés par XML 1.0
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+
+
+class ChunkBuffer:
+    """Flux en écriture seule : zipfile y écrit, le générateur vide au fur et à mesure"""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts.clear()
+        self.size = 0
+        return data
+
+
+def _safe_text(value):
+    """Texte neutralisé : apostrophe devant ce qu'un tableur prendrait pour une formule"""
+    if value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _local(value):
+    if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+        return timezone.localtime(value).replace(tzinfo=None)
+    return value
+
+
+# --- CSV ---
+
+def _csv_value(value):
+    value = _local(value)
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'Oui' if value else 'Non'
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, str):
+        return _safe_text(value)
+    return value
+
+
+def stream_csv(header, rows):
+    """CSV (séparateur « ; » et BOM, ouverts tels quels par Excel), par morceaux"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    writer.writerow(header)
+    yield ('\ufeff' + buffer.getvalue()).encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        if buffer.tell() >= STREAM_CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+# --- XLSX ---
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+# Styles : 0 normal, 1 date, 2 date + heure, 3 en-tête en gras
+_XLSX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '</cellXfs>'
+    '</styleSheet>'
+)
+_XLSX_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0">'
+    '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+    '</sheetView></sheetViews>'
+    '<sheetData>'
+)
+_XLSX_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+def _xlsx_text(value, style=''):
+    text = escape(_ILLEGAL_XML.sub('', str(value)))
+    return f'<c t="inlineStr"{style}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_cell(value):
+    value = _local(value)
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return _xlsx_text('Oui' if value else 'Non')
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, datetime.datetime):
+        serial = (value - _EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c s="2"><v>{serial:.6f}</v></c>'
+    if isinstance(value, datetime.date):
+        return f'<c s="1"><v>{(value - _EXCEL_EPOCH.date()).days}</v></c>'
+    return _xlsx_text(_safe_text(str(value)))
+
+
+def stream_xlsx(header, rows, sheet_name='Export'):
+    """Classeur XLSX d'une feuille, la feuille étant compressée et émise au fil des lignes"""
+    buffer = ChunkBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _XLSX_ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _XLSX_WORKBOOK.format(name=escape(sheet_name[:31])))
+        archive.writestr('xl/_rels/workbook.xml.rels', _XLSX_WORKBOOK_RELS)
+        archive.writestr('xl/styles.xml', _XLSX_STYLES)
+        yield buffer.drain()
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(_XLSX_SHEET_HEAD.encode('utf-8'))
+            sheet.write(('<row>' + ''.join(_xlsx_text(title, ' s="3"') for title in header) + '</row>').encode('utf-8'))
+            for row in rows:
+                sheet.write(('<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>').encode('utf-8'))
+                if buffer.size >= STREAM_CHUNK_SIZE:
+                    yield buffer.drain()
+            sheet.write(_XLSX_SHEET_TAIL.encode('utf-8'))
+    yield buffer.drain()
+
+
+# --- Réponse ---
+
+def export_rows(queryset, columns):
+    """Lignes (tuples) de values_list() lues par lots ; la requête n'est exécutée qu'à la première ligne.
+
+    columns : tuples (titre, champ) ou (titre, champ, conversion)
+    """
+    fields = [column[1] for column in columns]
+    conversions = [(index, column[2]) for index, column in enumerate(columns) if len(column) > 2]
+    rows = queryset.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    if not conversions:
+        return rows
+    return (_convert(row, conversions) for row in rows)
+
+
+def _convert(row, conversions):
+    row = list(row)
+    for index, conversion in conversions:
+        row[index] = conversion(row[index])
+    return row
+
+
+_END = object()
+
+
+async def aiter_chunks(chunks):
+    """Itérateur async sur un générateur synchrone (requêtes SQL, rendu PDF...) : un appel
+    sync_to_async par morceau, dans le thread de la requête et donc sur sa connexion"""
+    chunks = iter(chunks)
+    read = sync_to_async(next)
+    try:
+        while True:
+            chunk = await read(chunks, _END)
+            if chunk is _END:
+                return
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            # Client déconnecté : le générateur libère curseur et fichiers temporaires
+            await sync_to_async(close)()
+
+
+def streaming_response(request, chunks, **kwargs):
+    """StreamingHttpResponse envoyée au fil des morceaux en WSGI comme en ASGI"""
+    if isinstance(request, ASGIRequest):
+        chunks = aiter_chunks(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
+
+
+def export_response(request, queryset, columns, filename, export_format='csv', sheet_name='Export'):
+    """StreamingHttpResponse du queryset au format csv ou xlsx, en pièce jointe"""
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'csv'
+    header = [column[0] for column in columns]
+    rows = export_rows(queryset, columns)
+    if export_format == 'xlsx':
+        content = stream_xlsx(header, rows, sheet_name)
+    else:
+        content = stream_csv(header, rows)
+    response = streaming_response(request, content, content_type=CONTENT_TYPES[export_format])
+    stamp = timezone.localdate().strftime('%Y%m%d')
+    response['Content-Disposition'] = f'attachment; filename="{filename}-{stamp}.{export_format}"'
+    return response
+
+
+class StreamingExportMixin:
+    """À placer devant une ListView : GET exporte get_queryset() (mêmes filtres que la liste)
+    au format ?format=csv|xlsx au lieu d'afficher la page"""
+    export_columns = ()
+    export_filename = 'export'
+    export_sheet_name = 'Export'
+
+    def get(self, request, *args, **kwargs):
+        return export_response(
+            request, self.get_queryset(), self.export_columns, self.export_filename,
+            request.GET.get('format', 'csv'), self.export_sheet_name,
+        )
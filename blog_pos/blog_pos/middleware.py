@@ -0,0 +1,37 @@
+"""
+Middlewares du projet utilisables en mode asynchrone.
+
+Sous Uvicorn (Welto.py), Django n'exécute la chaîne de middlewares en asynchrone que si
+chacun d'eux l'accepte : un seul middleware synchrone et toute requête, vues async
+comprises, repasse par un thread. WhiteNoise (6.x) n'est que synchrone, d'où la
+sous-classe ci-dessous.
+"""
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    """WhiteNoise en modes synchrone et asynchrone : en ASGI, seuls les fichiers statiques
+    servis passent par un thread (ouverture du fichier), les autres requêtes continuent en async"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
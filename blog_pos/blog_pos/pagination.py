@@ -0,0 +1,200 @@
+"""
+Pagination par clé (keyset / seek) pour les listes longues.
+
+Le paginateur de Django lit la page n par OFFSET (n - 1) * taille, donc en parcourant
+toutes les lignes précédentes, et compte le total à chaque page. Ici une page est
+désignée par la clé de tri (par exemple (date, id)) de la dernière ligne affichée :
+la suivante est « les 50 lignes après cette clé », lues directement dans l'index.
+La page 500 coûte donc autant que la première.
+
+Il n'y a pas de numéro de page : première, précédente, suivante et dernière page.
+Le total est facultatif et plafonné (count_limit lignes au plus sont comptées).
+
+Usage (ListView) :
+    class MaListe(KeysetPaginationMixin, ListView):
+        paginate_by = 50
+        keyset_ordering = ('-date', '-pk')
+"""
+
+import base64
+import json
+from urllib.parse import urlencode
+
+from django.db.models import Q
+
+CURSOR_PARAM = 'cursor'
+LAST_PAGE = 'last'
+
+
+class KeysetPage:
+    """Page de résultats ; les liens (first_url, previous_url...) conservent les autres paramètres GET"""
+
+    def __init__(self, paginator, object_list, has_previous, has_next, params):
+        self.paginator = paginator
+        self.object_list = object_list
+        self._has_previous = has_previous
+        self._has_next = has_next
+        self._params = params
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    def _url(self, cursor):
+        params = [(key, value) for key, value in self._params if key not in (CURSOR_PARAM, 'page')]
+        if cursor:
+            params.append((CURSOR_PARAM, cursor))
+        return '?' + urlencode(params)
+
+    @property
+    def first_url(self):
+        return self._url(None)
+
+    @property
+    def last_url(self):
+        return self._url(LAST_PAGE)
+
+    @property
+    def previous_url(self):
+        if not self.object_list:
+            return self.first_url
+        return self._url('p.' + self.paginator.encode(self.object_list[0]))
+
+    @property
+    def next_url(self):
+        if not self.object_list:
+            return self.last_url
+        return self._url('n.' + self.paginator.encode(self.object_list[-1]))
+
+
+class KeysetPaginator:
+    """Pagination sur une clé de tri unique, par exemple ('-date_mouvement', '-pk')"""
+
+    def __init__(self, queryset, ordering, per_page, count_limit=None):
+        self.queryset = queryset
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.per_page = per_page
+        self.count_limit = count_limit
+        self._count = None
+
+    # --- Curseurs ---
+
+    def _key(self, obj):
+        return [getattr(obj, 'pk' if name == 'pk' else name) for name, _ in self.ordering]
+
+    @property
+    def signature(self):
+        return ','.join(('-' if descending else '') + name for name, descending in self.ordering)
+
+    def encode(self, obj):
+        """Curseur opaque : base64 du JSON [tri, valeurs de la clé...]"""
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in self._key(obj)]
+        raw = json.dumps([self.signature] + values, default=str, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode(self, token):
+        """Valeurs de la clé converties par les champs du modèle, ou None si le curseur est invalide
+        (ou créé pour un autre tri, par exemple après un clic sur un en-tête de colonne)"""
+        try:
+            values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            if not isinstance(values, list) or values[:1] != [self.signature]:
+                return None
+            values = values[1:]
+            if len(values) != len(self.ordering):
+                return None
+            opts = self.queryset.model._meta
+            return [
+                (opts.pk if name == 'pk' else opts.get_field(name)).to_python(value)
+                for (name, _), value in zip(self.ordering, values)
+            ]
+        except Exception:
+            return None
+
+    def _seek(self, values, forward):
+        """Lignes strictement après (forward) ou avant la clé values dans l'ordre de tri.
+
+        (a, b) après (x, y) s'écrit a <= x AND (a < x OR (a = x AND b < y)) pour un tri
+        décroissant : la première condition borne le parcours de l'index.
+        """
+        condition = None
+        for (name, descending), value in reversed(list(zip(self.ordering, values))):
+            operator = 'lt' if descending == forward else 'gt'
+            step = Q(**{f'{name}__{operator}': value})
+            if condition is not None:
+                step |= Q(**{name: value}) & condition
+            condition = step
+        name, descending = self.ordering[0]
+        operator = 'lte' if descending == forward else 'gte'
+        return Q(**{f'{name}__{operator}': values[0]}) & condition
+
+    def _order_by(self, forward):
+        return [
+            f'-{name}' if descending == forward else name
+            for name, descending in self.ordering
+        ]
+
+    # --- Pages ---
+
+    def page(self, cursor=None, params=()):
+        """Page désignée par le curseur (paramètre GET), la première si absent ou invalide"""
+        direction, values = 'n', None
+        if cursor == LAST_PAGE:
+            direction = 'p'
+        elif cursor and cursor[:2] in ('n.', 'p.'):
+            values = self.decode(cursor[2:])
+            if values is not None:
+                direction = cursor[0]
+
+        forward = direction == 'n'
+        queryset = self.queryset.order_by(*self._order_by(forward))
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward))
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if forward:
+            return KeysetPage(self, rows, has_previous=values is not None, has_next=more, params=params)
+        rows.reverse()
+        return KeysetPage(self, rows, has_previous=more, has_next=values is not None, params=params)
+
+    @property
+    def count(self):
+        """Nombre de lignes, compté au plus jusqu'à count_limit (None si le comptage est désactivé)"""
+        if self.count_limit is None:
+            return None
+        if self._count is None:
+            self._count = self.queryset.order_by().values('pk')[:self.count_limit + 1].count()
+        return min(self._count, self.count_limit)
+
+    @property
+    def count_is_capped(self):
+        return self.count is not None and self._count > self.count_limit
+
+
+class KeysetPaginationMixin:
+    """Remplace la pagination OFFSET d'une ListView par KeysetPaginator (paramètre GET cursor)"""
+    keyset_ordering = ('-pk',)
+    keyset_count_limit = 10000
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(
+            queryset, self.get_keyset_ordering(), page_size, count_limit=self.keyset_count_limit
+        )
+        params = [(key, value) for key, values in self.request.GET.lists() for value in values]
+        page = paginator.page(self.request.GET.get(CURSOR_PARAM), params=params)
+        return paginator, page, page.object_list, page.has_other_pages()
@@ -0,0 +1,332 @@
+"""
+Budget de requêtes : mesure, vue par vue, du nombre de requêtes SQL, du temps passé
+en base, dans les templates et en Python, et repérage des requêtes répétées (N+1).
+
+Désactivé par défaut. Pour l'activer (serveur Uvicorn de Welto.py ou runserver) :
+    WELTO_QUERY_BUDGET=true python Welto.py
+
+Chaque requête HTTP résolue (nom d'URL) ajoute un échantillon à un fichier SQLite local
+(QUERY_BUDGET_FILE) ; seuls les QUERY_BUDGET_SAMPLES derniers échantillons de chaque vue
+sont conservés, d'où des percentiles glissants. Le rapport s'affiche avec :
+    python manage.py query_budget
+
+La réponse porte aussi un en-tête Server-Timing (onglet Réseau des outils de développement).
+"""
+
+import contextvars
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template import base as template_base
+
+logger = logging.getLogger(__name__)
+
+# Nombre d'exécutions d'une même requête (paramètres différents) signalé comme N+1
+REPEAT_THRESHOLD = 3
+
+_current = contextvars.ContextVar('query_budget_recorder', default=None)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_SPACES = re.compile(r'\s+')
+
+
+def sql_signature(sql):
+    """Forme normalisée d'une requête : paramètres déjà à part (%s), listes IN (...) réduites"""
+    return _IN_LIST.sub('IN (...)', _SPACES.sub(' ', sql).strip())
+
+
+class Recorder:
+    """Compteurs d'une requête HTTP, alimentés par le wrapper SQL et le rendu des templates"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self.signatures = {}
+        self.executions = {}
+        self._template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_ms += (time.perf_counter() - debut) * 1000
+            self.queries += 1
+            signature = sql_signature(sql)
+            self.signatures[signature] = self.signatures.get(signature, 0) + 1
+            key = (signature, repr(params))
+            self.executions[key] = self.executions.get(key, 0) + 1
+
+    def duplicates(self):
+        """{signature: exécutions} des requêtes rejouées à l'identique ou en N+1"""
+        identiques = {signature for (signature, _), count in self.executions.items() if count > 1}
+        return {
+            signature: count for signature, count in self.signatures.items()
+            if signature in identiques or count >= REPEAT_THRESHOLD
+        }
+
+
+def _timed_render(render):
+    def wrapper(self, context):
+        recorder = _current.get()
+        if recorder is None or recorder._template_depth:
+            # Hors mesure, ou template inclus : déjà compté par le template englobant
+            return render(self, context)
+        recorder._template_depth += 1
+        debut, db_debut = time.perf_counter(), recorder.db_ms
+        try:
+            return render(self, context)
+        finally:
+            recorder._template_depth -= 1
+            # Le temps des requêtes lancées depuis le template reste compté en base
+            recorder.template_ms += (time.perf_counter() - debut) * 1000 - (recorder.db_ms - db_debut)
+    wrapper.query_budget = True
+    return wrapper
+
+
+def _install_template_timer():
+    if not getattr(template_base.Template.render, 'query_budget', False):
+        template_base.Template.render = _timed_render(template_base.Template.render)
+
+
+# --- Stockage ---
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sample (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    view TEXT NOT NULL,
+    created REAL NOT NULL,
+    queries INTEGER NOT NULL,
+    db_ms REAL NOT NULL,
+    template_ms REAL NOT NULL,
+    python_ms REAL NOT NULL,
+    total_ms REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sample_view_idx ON sample (view, id);
+CREATE TABLE IF NOT EXISTS duplicate (
+    view TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    executions INTEGER NOT NULL,
+    max_per_request INTEGER NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (view, signature)
+);
+"""
+
+
+class BudgetStore:
+    """Fichier SQLite indépendant de la base de l'application (ses écritures ne sont pas mesurées)"""
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, samples=500):
+        self.path = str(path)
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._connection = None
+        self._writes = 0
+
+    def connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.executescript(_SCHEMA)
+        return self._connection
+
+    def record(self, view, recorder, total_ms):
+        python_ms = max(0.0, total_ms - recorder.db_ms - recorder.template_ms)
+        now = time.time()
+        with self._lock:
+            db = self.connect()
+            with db:
+                db.execute(
+                    'INSERT INTO sample (view, created, queries, db_ms, template_ms, python_ms, total_ms) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (view, now, recorder.queries, recorder.db_ms, recorder.template_ms, python_ms, total_ms),
+                )
+                for signature, count in recorder.duplicates().items():
+                    db.execute(
+                        'INSERT INTO duplicate (view, signature, requests, executions, max_per_request, last_seen) '
+                        'VALUES (?, ?, 1, ?, ?, ?) '
+                        'ON CONFLICT (view, signature) DO UPDATE SET '
+                        'requests = requests + 1, executions = executions + excluded.executions, '
+                        'max_per_request = MAX(max_per_request, excluded.max_per_request), last_seen = excluded.last_seen',
+                        (view, signature, count, count, now),
+                    )
+                self._writes += 1
+                if self._writes % self.PRUNE_EVERY == 0:
+                    self.prune(db)
+
+    def prune(self, db):
+        """Ne garde que les `samples` derniers échantillons de chaque vue"""
+        db.execute(
+            'DELETE FROM sample WHERE id IN ('
+            ' SELECT id FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY view ORDER BY id DESC) AS rang FROM sample)'
+            ' WHERE rang > ?)',
+            (self.samples,),
+        )
+
+    def report(self):
+        """Par vue : nombre d'échantillons et percentiles (p50, p95, max) de chaque mesure"""
+        with self._lock:
+            db = self.connect()
+            with db:
+                self.prune(db)
+            rows = db.execute(
+                'SELECT view, queries, db_ms, template_ms, python_ms, total_ms FROM sample ORDER BY view'
+            ).fetchall()
+            duplicates = db.execute(
+                'SELECT view, signature, requests, executions, max_per_request FROM duplicate '
+                'ORDER BY view, max_per_request DESC'
+            ).fetchall()
+
+        par_vue = {}
+        for view, *mesures in rows:
+            par_vue.setdefault(view, []).append(mesures)
+        champs = ('queries', 'db_ms', 'template_ms', 'python_ms', 'total_ms')
+        rapport = {}
+        for view, mesures in par_vue.items():
+            rapport[view] = {'samples': len(mesures), 'duplicates': []}
+            for index, champ in enumerate(champs):
+                valeurs = sorted(mesure[index] for mesure in mesures)
+                rapport[view][champ] = {
+                    'p50': percentile(valeurs, 50),
+                    'p95': percentile(valeurs, 95),
+                    'max': valeurs[-1],
+                }
+        for view, signature, requests, executions, max_per_request in duplicates:
+            if view in rapport:
+                rapport[view]['duplicates'].append({
+                    'signature': signature,
+                    'requests': requests,
+                    'executions': executions,
+                    'max_per_request': max_per_request,
+                })
+        return rapport
+
+    def reset(self):
+        with self._lock:
+            db = self.connect()
+            with db:
+                db.execute('DELETE FROM sample')
+                db.execute('DELETE FROM duplicate')
+
+
+def percentile(valeurs, rang):
+    """Percentile (méthode du rang le plus proche) d'une liste déjà triée"""
+    if not valeurs:
+        return None
+    index = max(0, min(len(valeurs) - 1, -(-rang * len(valeurs) // 100) - 1))
+    return valeurs[index]
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = BudgetStore(settings.QUERY_BUDGET_FILE, settings.QUERY_BUDGET_SAMPLES)
+    return _store
+
+
+# --- Middleware ---
+
+class QueryBudgetMiddleware:
+    """Mesure chaque requête HTTP résolue ; retiré de la chaîne si QUERY_BUDGET_ENABLED est faux.
+
+    À placer en tête de MIDDLEWARE pour compter aussi les requêtes des autres middlewares
+    (session, utilisateur, licence).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.QUERY_BUDGET_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        self.max_queries = settings.QUERY_BUDGET_MAX_QUERIES
+        self.store = get_store()
+        _install_template_timer()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = Recorder()
+        token = _current.set(recorder)
+        stack = ExitStack()
+        debut = time.perf_counter()
+        self._instrument(stack, recorder)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            stack.close()
+            raise
+        finally:
+            _current.reset(token)
+        self._report(stack, request, response, recorder, (time.perf_counter() - debut) * 1000)
+        return response
+
+    async def __acall__(self, request):
+        recorder = Recorder()
+        token = _current.set(recorder)
+        stack = ExitStack()
+        debut = time.perf_counter()
+        # Les requêtes SQL (ORM async compris) passent par le thread de base de données de la
+        # requête (sync_to_async thread_sensitive) : le wrapper est posé sur la connexion de ce thread
+        await sync_to_async(self._instrument)(stack, recorder)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            await sync_to_async(stack.close)()
+            raise
+        finally:
+            _current.reset(token)
+        total_ms = (time.perf_counter() - debut) * 1000
+        await sync_to_async(self._report)(stack, request, response, recorder, total_ms)
+        return response
+
+    @staticmethod
+    def _instrument(stack, recorder):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+
+    def _report(self, stack, request, response, recorder, total_ms):
+        """Retire le wrapper SQL, puis en-tête Server-Timing, avertissement et échantillon"""
+        stack.close()
+        match = request.resolver_match
+        if match is None or not match.url_name:
+            # Fichiers statiques, 404 : rien à attribuer à une vue nommée
+            return
+        view = match.view_name
+        python_ms = max(0.0, total_ms - recorder.db_ms - recorder.template_ms)
+        response['Server-Timing'] = (
+            f'db;desc="{recorder.queries} requetes";dur={recorder.db_ms:.1f}, '
+            f'tpl;dur={recorder.template_ms:.1f}, py;dur={python_ms:.1f}'
+        )
+
+        duplicates = recorder.duplicates()
+        if recorder.queries > self.max_queries or duplicates:
+            logger.warning(
+                "%s : %d requêtes (budget %d), %d requête(s) répétée(s)%s",
+                view, recorder.queries, self.max_queries, len(duplicates),
+                ''.join(f"\n  {count} x {signature[:200]}" for signature, count in duplicates.items()),
+            )
+        try:
+            self.store.record(view, recorder, total_ms)
+        except sqlite3.Error:
+            logger.exception("Enregistrement du budget de requêtes impossible (%s)", self.store.path)
@@ -92,8 +92,9 @@ LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/users/login/'
 
 MIDDLEWARE = [
+    'blog_pos.querybudget.QueryBudgetMiddleware',  # Budget de requêtes par vue (WELTO_QUERY_BUDGET=true)
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Servir fichiers statiques en production
+    'blog_pos.middleware.WhiteNoiseMiddleware',  # Servir fichiers statiques en production (WhiteNoise, compatible async)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     # 'django.middleware.csrf.CsrfViewMiddleware',  # Désactivé pour desktop (pas nécessaire)
@@ -234,5 +235,12 @@ MEDIA_ROOT = str(MEDIA_DIR)
 
 CURRENCY = os.getenv('CURRENCY', 'GMD')
 
+# Budget de requêtes (blog_pos/querybudget.py) : désactivé par défaut
+# Rapport par vue : python manage.py query_budget
+QUERY_BUDGET_ENABLED = os.getenv('WELTO_QUERY_BUDGET', 'False').lower() == 'true'
+QUERY_BUDGET_FILE = (DATA_DIR if USER_DATA_PATH else Path(BASE_DIR)) / 'query_budget.sqlite3'
+QUERY_BUDGET_MAX_QUERIES = int(os.getenv('WELTO_QUERY_BUDGET_MAX', '30'))  # Au-delà : avertissement dans les logs
+QUERY_BUDGET_SAMPLES = 500  # Échantillons conservés par vue (percentiles glissants)
+
 # Configuration par défaut pour les clés primaires
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
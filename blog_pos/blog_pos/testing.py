@@ -0,0 +1,51 @@
+"""
+Outils communs aux tests des applications (python manage.py test).
+
+PosTestCase fournit un gérant connecté, une licence considérée comme valide (sans
+fichier .welto_license), un cache vidé à chaque test (catalogue, paramètres) et de quoi
+créer rapidement des produits.
+"""
+
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from licensing.license_manager import LicenseManager
+
+VALID_LICENSE = {
+    'is_valid': True,
+    'message': 'Licence valide',
+    'days_remaining': 365,
+    'expiry_date': '31/12/2099',
+    'type': 'TEST',
+    'installation_date': '',
+    'features': [],
+}
+
+
+class PosTestCase(TestCase):
+    """Base des tests de vues : utilisateur connecté (rôle manager) et licence valide"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patcher = mock.patch.object(LicenseManager, 'get_cached_license_status', return_value=VALID_LICENSE)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        from users.models import AppSetting, User
+        AppSetting.invalidate_cache()
+        self.addCleanup(AppSetting.invalidate_cache)
+        self.user = User.objects.create_superuser('gerant', 'gerant@example.com', 'secret', role='manager')
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+
+    def make_product(self, title, qty=10, value='1000.00', prix_achat='600.00', category=None):
+        """Produit créé comme par l'interface : les callbacks on_commit (catalogue, index) sont exécutés"""
+        from product.models import Product
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                title=title, qty=qty, value=Decimal(value), prix_achat=Decimal(prix_achat), category=category,
+            )
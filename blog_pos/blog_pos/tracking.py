@@ -0,0 +1,35 @@
+"""
+Valeurs chargées depuis la base, pour calculer au save() suivant ce qui a changé
+(jour d'une commande, montant d'un paiement...) sans relire la ligne.
+
+Usage :
+    class Payment(LoadedValuesMixin, models.Model):
+        loaded_fields = ('date', 'amount')
+
+    payment.loaded_values()   # {'date': ..., 'amount': ...} tel que chargé, ou None
+"""
+
+
+class LoadedValuesMixin:
+    """Mixin de modèle : from_db() mémorise les champs de loaded_fields (attnames, par ex.
+    'type_depense_id'). Une instance construite en mémoire n'a pas de valeurs chargées."""
+    loaded_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {name: getattr(instance, name) for name in cls.loaded_fields if name in field_names}
+        return instance
+
+    def loaded_values(self):
+        """Valeurs en base au chargement, ou None si l'instance n'a pas été chargée (ou l'a été sans ces champs)"""
+        values = getattr(self, '_loaded_values', None)
+        if values is None or len(values) != len(self.loaded_fields):
+            return None
+        return values
+
+    def remember_loaded_values(self, values=None):
+        """Valeurs de référence pour le prochain save() : celles données, sinon celles de l'instance"""
+        self._loaded_values = values if values is not None else {
+            name: getattr(self, name) for name in self.loaded_fields
+        }
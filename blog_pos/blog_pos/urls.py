@@ -4,10 +4,10 @@ from django.conf import settings
 from django.conf.urls.static import static
 
 from order.views import (HomepageView, OrderUpdateView, CreateOrderView, delete_order,
-                         OrderListView, done_order_view, auto_create_order_view,
-                         ajax_add_product, ajax_modify_order_item, ajax_search_products, ajax_calculate_results_view,
+                         OrderListView, OrderExportView, done_order_view, auto_create_order_view,
+                         ajax_add_product, ajax_modify_order_item, ajax_apply_cart_operations, ajax_search_products, ajax_calculate_results_view,
                          order_action_view, ajax_calculate_category_view, ajax_add_payment, ajax_delete_payment,
-                         invoice_preview_view, invoice_pdf_view
+                         invoice_preview_view, invoice_pdf_view, invoice_export_view, invoice_export_progress_view
                          )
 
 urlpatterns = [
@@ -23,6 +23,7 @@ urlpatterns = [
     
     # Gestion des commandes
     path('order-list/', OrderListView.as_view(), name='order_list'),
+    path('order-list/export/', OrderExportView.as_view(), name='order_export'),
     path('', CreateOrderView.as_view(), name='create-order'),
     path('create-auto/', auto_create_order_view, name='create_auto'),
     path('update/<int:pk>/', OrderUpdateView.as_view(), name='update_order'),
@@ -33,6 +34,8 @@ urlpatterns = [
     # Facturation
     path('invoice/<int:pk>/', invoice_preview_view, name='invoice_preview'),
     path('invoice/<int:pk>/pdf/', invoice_pdf_view, name='invoice_pdf'),
+    path('invoices/export/', invoice_export_view, name='invoice_export'),
+    path('invoices/export/progress/', invoice_export_progress_view, name='invoice_export_progress'),
 
     # Gestion des produits
     path('products/', include('product.urls')),
@@ -47,6 +50,7 @@ urlpatterns = [
     path('ajax/search-products/<int:pk>/', ajax_search_products, name='ajax-search'),
     path('ajax/add-product/<int:pk>/<int:dk>/', ajax_add_product, name='ajax_add'),
     path('ajax/modify-product/<int:pk>/<slug:action>', ajax_modify_order_item, name='ajax_modify'),
+    path('ajax/cart-operations/<int:pk>/', ajax_apply_cart_operations, name='ajax_cart_operations'),
     path('ajax/calculate-results/', ajax_calculate_results_view, name='ajax_calculate_result'),
     path('ajax/calculate-category-results/', ajax_calculate_category_view, name='ajax_category_result'),
     
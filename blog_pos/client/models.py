@@ -1,7 +1,53 @@
+from decimal import Decimal
+import uuid
+
+from django.core.cache import cache
 from django.db import models
+from django.db.models import Count, DecimalField, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce
 import datetime
 
 
+# Version des résultats de recherche en cache, changée à chaque écriture de client ou de commande client
+CLIENT_SEARCH_VERSION_KEY = 'client:search:version'
+
+
+def invalidate_search_cache():
+    """Rend obsolètes toutes les réponses de recherche client en cache (voir client.signals)"""
+    cache.set(CLIENT_SEARCH_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+class ClientQuerySet(models.QuerySet):
+
+    def with_debt(self):
+        """Annote chaque client avec debt (reste dû total) et unpaid_orders (commandes non soldées), en un GROUP BY"""
+        unpaid = Q(orders__is_paid=False, orders__remaining_amount__gt=0)
+        return self.annotate(
+            debt=Coalesce(
+                Sum('orders__remaining_amount', filter=unpaid),
+                Value(Decimal('0.00')),
+                output_field=DecimalField(max_digits=20, decimal_places=2),
+            ),
+            unpaid_orders=Count('orders', filter=unpaid),
+        )
+
+    def debtors(self):
+        """Clients ayant au moins une commande non soldée"""
+        return self.with_debt().filter(debt__gt=0)
+
+    def with_order_summary(self):
+        """Annote chaque client avec orders_count et last_order (date de la dernière commande)"""
+        return self.annotate(orders_count=Count('orders'), last_order=Max('orders__date'))
+
+    def phone_matching(self, phone_query, partial=False):
+        """Téléphones commençant par phone_query si la saisie n'est faite que de chiffres
+        (intervalle [q, q+1[ servi par l'index unique de phone), sinon ou si partial,
+        recherche partielle (icontains, milieu de numéro compris)"""
+        if phone_query.isdigit() and not partial:
+            upper = phone_query[:-1] + chr(ord(phone_query[-1]) + 1)
+            return self.filter(phone__gte=phone_query, phone__lt=upper)
+        return self.filter(phone__icontains=phone_query)
+
 class Client(models.Model):
     """Modèle simple pour gérer les clients"""
     phone = models.CharField(max_length=15, unique=True, help_text="Numéro de téléphone (max 15 chiffres, unique)")
@@ -9,6 +55,8 @@ class Client(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True, help_text="Client actif")
+
+    objects = ClientQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
@@ -24,7 +72,6 @@ class Client(models.Model):
     
     def total_spent(self):
         """Montant total dépensé par le client"""
-        from decimal import Decimal
         total = self.orders.aggregate(models.Sum('final_value'))['final_value__sum']
         return total or Decimal('0.00')
     
@@ -35,16 +82,14 @@ class Client(models.Model):
     
     def total_unpaid_amount(self):
         """Montant total impayé du client (tenant compte des paiements échelonnés)"""
-        from decimal import Decimal
-        total_unpaid = Decimal('0.00')
-        for order in self.orders.filter(is_paid=False):
-            total_unpaid += order.remaining_amount()
-        return total_unpaid
+        return self.orders.total_balance()
     
     @classmethod
-    def search_by_phone(cls, phone_query):
-        """Recherche client par numéro de téléphone (partiel)"""
-        return cls.objects.filter(
-            phone__icontains=phone_query,
-            is_active=True
-        ).order_by('-created_at')[:10]  # Limiter à 10 résultats
\ No newline at end of file
+    def search_by_phone(cls, phone_query, limit=10, partial=False):
+        """Recherche client par numéro de téléphone (préfixe si chiffres, partiel sinon
+        ou si partial : à relancer ainsi quand la recherche par préfixe ne trouve rien).
+
+        Une seule requête : chaque client est annoté avec orders_count et last_order.
+        """
+        return cls.objects.filter(is_active=True).phone_matching(phone_query, partial=partial)\
+            .with_order_summary().order_by('-created_at')[:limit]  # Limiter à 10 résultats
\ No newline at end of file
@@ -0,0 +1,24 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from order.models import Order
+from .models import Client, invalidate_search_cache
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalider_recherche_client(sender, **kwargs):
+    """
+    Signal pour invalider les résultats de recherche client en cache après modification d'un client
+    """
+    invalidate_search_cache()
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalider_recherche_commande_client(sender, instance, **kwargs):
+    """
+    Signal pour invalider la recherche client quand une commande rattachée à un client change
+    (nombre de commandes et date de la dernière commande affichés dans l'autocomplétion)
+    """
+    if instance.client_id is not None:
+        invalidate_search_cache()
@@ -1,3 +1,34 @@
-from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from blog_pos.testing import PosTestCase
+
+from .models import Client
+
+
+class ClientPhoneSearchTests(PosTestCase):
+    """Autocomplétion par téléphone : préfixe indexé, puis recherche partielle si rien ne commence par la saisie"""
+
+    def setUp(self):
+        super().setUp()
+        Client.objects.create(name='Awa', phone='2217701234')
+        Client.objects.create(name='Moussa', phone='2217705678')
+        Client.objects.create(name='Fatou', phone='3301234567')
+
+    async def search(self, phone):
+        response = await self.async_client.get(reverse('client:ajax_search'), {'phone': phone})
+        return sorted(client['name'] for client in response.json()['clients'])
+
+    def test_prefix_uses_phone_range(self):
+        self.assertEqual(sorted(Client.search_by_phone('22177').values_list('name', flat=True)), ['Awa', 'Moussa'])
+        self.assertFalse(Client.search_by_phone('4567').exists())
+        self.assertEqual(list(Client.search_by_phone('4567', partial=True).values_list('name', flat=True)), ['Fatou'])
+
+    async def test_digits_in_the_middle_fall_back_to_partial_match(self):
+        self.assertEqual(await self.search('7701'), ['Awa'])
+
+    async def test_prefix_narrowing_then_middle_digits(self):
+        self.assertEqual(await self.search('221'), ['Awa', 'Moussa'])
+        self.assertEqual(await self.search('2217705'), ['Moussa'])
+        # Complète le cache de '221' sans commencer par la saisie : recherche partielle
+        self.assertEqual(await self.search('2215'), [])
+        self.assertEqual(await self.search('12345'), ['Fatou'])
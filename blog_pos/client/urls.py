@@ -11,6 +11,7 @@ urlpatterns = [
     path('delete/<int:pk>/', views.ClientDeleteView.as_view(), name='delete_client'),
     path('detail/<int:pk>/', views.client_detail_view, name='client_detail'),
     path('toggle-status/<int:pk>/', views.toggle_client_status, name='toggle_status'),
+    path('debtors/', views.DebtorListView.as_view(), name='debtors'),
     
     # AJAX endpoints pour gestion des clients
     path('ajax/search/', views.ajax_search_clients, name='ajax_search'),
@@ -1,4 +1,4 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, aget_object_or_404, get_object_or_404, redirect
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
@@ -6,16 +6,20 @@ from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.utils.decorators import method_decorator
 from django.contrib import messages
 from django.urls import reverse_lazy, reverse
-from django.db.models import Q, Count, Sum
+from django.db.models import Q, Count, DecimalField, Sum, Value
+from django.db.models.functions import Coalesce
+from decimal import Decimal
 from datetime import datetime
 from order.models import OrderItem
 from django_tables2 import RequestConfig
-from .models import Client
+from .models import Client, CLIENT_SEARCH_VERSION_KEY
 from users.models import AppSetting
 from .forms import ClientForm, ClientSearchForm
 import json
 from functools import wraps
 from django.core.exceptions import PermissionDenied
+from django.core.cache import cache
+import uuid
 
 
 def manager_required(view_func):
@@ -34,10 +38,75 @@ def manager_required(view_func):
     return _wrapped_view
 
 
+# Réponses d'autocomplétion en cache, par saisie (clés préfixées par la version courante)
+CLIENT_SEARCH_LIMIT = 10
+CLIENT_SEARCH_TIMEOUT = 300
+
+
+def _search_cache_prefix():
+    version = cache.get(CLIENT_SEARCH_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(CLIENT_SEARCH_VERSION_KEY, version, None)
+        version = cache.get(CLIENT_SEARCH_VERSION_KEY, version)
+    return f'client:search:{version}:'
+
+
+async def _fetch_clients_data(phone_query, partial=False):
+    """Une requête : nombre de commandes et dernière commande annotés"""
+    return [
+        {
+            'id': client.id,
+            'name': client.name,
+            'phone': client.phone,
+            'total_orders': client.orders_count,
+            'last_order': client.last_order.strftime('%d/%m/%Y') if client.last_order else 'Jamais',
+            'display': f"{client.name} ({client.phone})"
+        }
+        async for client in Client.search_by_phone(phone_query, limit=CLIENT_SEARCH_LIMIT, partial=partial)
+    ]
+
+
+async def _search_clients_data(phone_query):
+    """Clients correspondant à la saisie, au format JSON de l'autocomplétion.
+
+    Une saisie prolongeant un préfixe déjà en cache dont la liste était complète
+    (moins de CLIENT_SEARCH_LIMIT résultats) est filtrée en mémoire, sans requête.
+    Le cache (LocMemCache, en mémoire du processus) est lu directement : seule la
+    requête passe par l'ORM async.
+    """
+    prefix = _search_cache_prefix()
+    cached = cache.get(prefix + phone_query)
+    if cached is not None:
+        return cached
+
+    prefix_known_empty = False
+    if phone_query.isdigit():
+        shorter = [phone_query[:n] for n in range(len(phone_query) - 1, 1, -1)]
+        found = cache.get_many([prefix + q for q in shorter])
+        for q in shorter:
+            entry = found.get(prefix + q)
+            if entry is not None and len(entry) < CLIENT_SEARCH_LIMIT:
+                clients_data = [c for c in entry if c['phone'].startswith(phone_query)]
+                if clients_data:
+                    cache.set(prefix + phone_query, clients_data, CLIENT_SEARCH_TIMEOUT)
+                    return clients_data
+                # Aucun numéro ne commence par la saisie : recherche partielle directement
+                prefix_known_empty = True
+                break
+
+    clients_data = [] if prefix_known_empty else await _fetch_clients_data(phone_query)
+    if not clients_data and phone_query.isdigit():
+        # Chiffres saisis au milieu du numéro (sans indicatif, etc.)
+        clients_data = await _fetch_clients_data(phone_query, partial=True)
+    cache.set(prefix + phone_query, clients_data, CLIENT_SEARCH_TIMEOUT)
+    return clients_data
+
+
 @login_required
 @require_http_methods(["GET"])
-def ajax_search_clients(request):
-    """Recherche de clients par téléphone via AJAX"""
+async def ajax_search_clients(request):
+    """Recherche de clients par téléphone via AJAX (vue async, lecture seule)"""
     phone_query = request.GET.get('phone', '').strip()
     
     if len(phone_query) < 2:  # Au moins 2 caractères pour déclencher la recherche
@@ -47,20 +116,7 @@ def ajax_search_clients(request):
             'message': 'Tapez au moins 2 chiffres pour rechercher'
         })
     
-    # Rechercher les clients
-    clients = Client.search_by_phone(phone_query)
-    
-    # Préparer les données pour le JSON
-    clients_data = []
-    for client in clients:
-        clients_data.append({
-            'id': client.id,
-            'name': client.name,
-            'phone': client.phone,
-            'total_orders': client.total_orders(),
-            'last_order': client.last_order_date().strftime('%d/%m/%Y') if client.last_order_date() else 'Jamais',
-            'display': f"{client.name} ({client.phone})"
-        })
+    clients_data = await _search_clients_data(phone_query)
     
     return JsonResponse({
         'success': True,
@@ -132,10 +188,15 @@ def ajax_create_client(request):
 
 
 @login_required
-def ajax_get_client_info(request, client_id):
-    """Récupérer les informations détaillées d'un client via AJAX"""
+async def ajax_get_client_info(request, client_id):
+    """Récupérer les informations détaillées d'un client via AJAX (vue async, une requête)"""
     try:
-        client = get_object_or_404(Client, id=client_id)
+        client = await aget_object_or_404(
+            Client.objects.with_order_summary().annotate(
+                spent=Coalesce(Sum('orders__final_value'), Value(Decimal('0.00')), output_field=DecimalField(max_digits=20, decimal_places=2))
+            ),
+            id=client_id,
+        )
         
         return JsonResponse({
             'success': True,
@@ -143,9 +204,9 @@ def ajax_get_client_info(request, client_id):
                 'id': client.id,
                 'name': client.name,
                 'phone': client.phone,
-                'total_orders': client.total_orders(),
-                'total_spent': str(client.total_spent()),
-                'last_order': client.last_order_date().strftime('%d/%m/%Y') if client.last_order_date() else 'Jamais',
+                'total_orders': client.orders_count,
+                'total_spent': str(client.spent),
+                'last_order': client.last_order.strftime('%d/%m/%Y') if client.last_order else 'Jamais',
                 'created_at': client.created_at.strftime('%d/%m/%Y'),
                 'display': f"{client.name} ({client.phone})"
             }
@@ -201,6 +262,47 @@ class ClientListView(ListView):
         return context
 
 
+@method_decorator(manager_required, name='dispatch')
+class DebtorListView(ListView):
+    """Vue pour lister les clients ayant un reste à payer, triable (reste dû agrégé en un GROUP BY)"""
+    model = Client
+    template_name = 'client/debtors.html'
+    context_object_name = 'clients'
+    paginate_by = 20
+
+    # Tris autorisés : paramètre GET -> ordre SQL
+    SORTS = {
+        'debt': ('debt', 'name'),
+        '-debt': ('-debt', 'name'),
+        'name': ('name',),
+        '-name': ('-name',),
+        'unpaid_orders': ('unpaid_orders', '-debt'),
+        '-unpaid_orders': ('-unpaid_orders', '-debt'),
+    }
+
+    def get_sort(self):
+        sort = self.request.GET.get('sort', '-debt')
+        return sort if sort in self.SORTS else '-debt'
+
+    def get_queryset(self):
+        queryset = Client.objects.debtors()
+
+        search = self.request.GET.get('search', '').strip()
+        if search:
+            queryset = queryset.filter(Q(name__icontains=search) | Q(phone__icontains=search))
+
+        return queryset.order_by(*self.SORTS[self.get_sort()], 'pk')
+
+    def get_context_data(self, **kwargs):
+        from order.models import Order
+        context = super().get_context_data(**kwargs)
+        context['sort'] = self.get_sort()
+        context['search'] = self.request.GET.get('search', '').strip()
+        context['total_debt'] = Order.objects.filter(client__isnull=False).total_balance()
+        context['currency'] = AppSetting.get_currency_label()
+        return context
+
+
 @method_decorator(manager_required, name='dispatch')
 class ClientCreateView(CreateView):
     """Vue pour créer un nouveau client"""
@@ -285,9 +387,8 @@ def client_detail_view(request, pk):
     paid_orders = orders.filter(is_paid=True).count()
     unpaid_orders = orders.filter(is_paid=False).count()
     
-    # Calculer le montant impayé en tenant compte des paiements échelonnés
-    # Montant impayé tenant compte des paiements échelonnés (sur la période)
-    unpaid_amount = sum(order.remaining_amount() for order in orders.filter(is_paid=False))
+    # Montant impayé tenant compte des paiements échelonnés (sur la période), en une requête
+    unpaid_amount = orders.total_balance()
 
     # Nouveau KPI: nombre de quantité commandée (sur la période)
     total_qty_ordered = OrderItem.objects.filter(order__in=orders).aggregate(total=Sum('qty'))['total'] or 0
@@ -10,6 +10,13 @@ from datetime import datetime, timedelta
 from cryptography.fernet import Fernet
 import base64
 import platform
+import threading
+
+
+# Cache du verdict de licence partagé par le middleware et le context processor.
+# Clé: chemin du fichier -> (empreinte du fichier, statut, valable jusqu'à)
+_status_cache = {}
+_status_lock = threading.Lock()
 
 
 class LicenseManager:
@@ -112,6 +119,7 @@ class LicenseManager:
             
             with open(self.license_file, 'wb') as f:
                 f.write(encrypted_license)
+            self.clear_cached_status()
             
             return True, "Licence activée avec succès"
             
@@ -144,7 +152,10 @@ class LicenseManager:
     def get_license_status(self):
         """Retourne le statut détaillé de la licence"""
         license_data, message = self.get_current_license()
-        
+        return self._build_status(license_data, message)
+
+    def _build_status(self, license_data, message):
+        """Construit le dictionnaire de statut à partir des données de licence déchiffrées"""
         if not license_data:
             return {
                 'is_valid': False,
@@ -166,8 +177,46 @@ class LicenseManager:
             'features': license_data.get('features', [])
         }
     
+    def _file_fingerprint(self):
+        """Empreinte (mtime, inode, taille) du fichier de licence, None s'il n'existe pas"""
+        try:
+            st = os.stat(self.license_file)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def get_cached_license_status(self):
+        """
+        Retourne le statut de licence en évitant lecture + déchiffrement à chaque appel.
+        Le verdict est recalculé seulement si le fichier change (mtime/inode/taille)
+        ou si une échéance est franchie (changement de days_remaining, expiration).
+        """
+        fingerprint = self._file_fingerprint()
+        now = datetime.now()
+        cached = _status_cache.get(self.license_file)
+        if cached and cached[0] == fingerprint and (cached[2] is None or now < cached[2]):
+            return cached[1]
+
+        with _status_lock:
+            license_data, message = self.get_current_license()
+            status = self._build_status(license_data, message)
+            valid_until = None
+            if status['is_valid']:
+                # Prochaine échéance : quand days_remaining diminue d'une unité (au plus tard l'expiration)
+                expiry_date = datetime.fromisoformat(license_data['expiry_date'])
+                valid_until = expiry_date - timedelta(days=status['days_remaining'])
+                if valid_until <= now:
+                    valid_until = expiry_date
+            _status_cache[self.license_file] = (fingerprint, status, valid_until)
+        return status
+
+    def clear_cached_status(self):
+        """Oublie le verdict en cache (après activation ou suppression)"""
+        _status_cache.pop(self.license_file, None)
+
     def remove_license(self):
         """Supprime la licence (pour debugging)"""
+        self.clear_cached_status()
         if os.path.exists(self.license_file):
             os.remove(self.license_file)
             return True
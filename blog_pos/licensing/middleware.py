@@ -2,6 +2,7 @@
 Middleware pour vérifier la licence WELTO à chaque requête
 """
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.contrib import messages
@@ -9,10 +10,14 @@ from .license_manager import LicenseManager
 
 
 class LicenseMiddleware:
-    """Middleware pour contrôler l'accès selon la licence"""
+    """Middleware pour contrôler l'accès selon la licence (modes synchrone et asynchrone)"""
+    sync_capable = True
+    async_capable = True
     
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
         self.license_manager = LicenseManager()
         
         # URLs qui ne nécessitent pas de licence
@@ -27,22 +32,23 @@ class LicenseMiddleware:
             # ⚠️ /users/setup/ retiré → nécessite licence active
         ]
     
-    def __call__(self, request):
+    def _check(self, request):
+        """Redirection vers l'activation si la licence est invalide, sinon None"""
         # Vérifier si l’URL est exemptée
         if any(request.path.startswith(url) for url in self.exempt_urls):
-            return self.get_response(request)
+            return None
         
         # Éviter la boucle de redirection vers /activate-license/
         try:
             activate_url = reverse('activate_license')
             if request.path == activate_url:
-                return self.get_response(request)
+                return None
         except Exception:
             # Si l’URL n’existe pas encore, on ignore
             pass
         
-        # Vérifier la licence
-        license_status = self.license_manager.get_license_status()
+        # Vérifier la licence (verdict en cache tant que le fichier et l'échéance ne changent pas)
+        license_status = self.license_manager.get_cached_license_status()
         
         if not license_status['is_valid']:
             # Rediriger vers la page d’activation
@@ -51,8 +57,19 @@ class LicenseMiddleware:
         
         # Ajouter le statut licence au contexte
         request.license_status = license_status
-        
-        return self.get_response(request)
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._check(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        # Pas de base de données ici : le verdict en cache ne coûte qu'un stat() du fichier de licence
+        response = self._check(request)
+        if response is not None:
+            return response
+        return await self.get_response(request)
 
 
 # Context processor pour avoir les infos de licence dans tous les templates
@@ -63,8 +80,8 @@ def license_context_processor(request):
             'license_status': request.license_status
         }
     
-    # Fallback si pas de middleware
+    # Fallback si pas de middleware : même verdict en cache que le middleware
     license_manager = LicenseManager()
     return {
-        'license_status': license_manager.get_license_status()
+        'license_status': license_manager.get_cached_license_status()
     }
@@ -56,7 +56,7 @@ def license_status_view(request):
 def license_status_api(request):
     """API pour récupérer le statut de licence (pour Electron)"""
     license_manager = LicenseManager()
-    license_status = license_manager.get_license_status()
+    license_status = license_manager.get_cached_license_status()
     
     return JsonResponse(license_status)
 
@@ -0,0 +1,142 @@
+"""
+Export groupé des factures d'une sélection de commandes (ZIP ou PDF fusionné).
+
+Les factures sont produites par order.invoices (cache sur disque) : celles déjà
+à jour ne sont pas recalculées. La commande export_invoices rend les autres en
+parallèle dans un pool de processus (pisa est limité par le GIL), avec au plus 2
+rendus par processus en attente à la fois ; la vue web les rend dans son propre
+processus (workers=1) : l'application est livrée gelée par PyInstaller, où chaque
+processus lancé depuis une requête redémarrerait l'exécutable du serveur.
+L'archive est émise morceau par morceau à partir des fichiers sur disque : la
+mémoire reste bornée quel que soit le nombre de commandes.
+
+Le PDF fusionné doit être assemblé en entier avant d'être envoyé (table des
+objets en fin de fichier) : il est construit dans un fichier temporaire et
+limité à MAX_MERGED_ORDERS commandes, au-delà il faut utiliser le ZIP.
+"""
+
+import os
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from blog_pos.exports import ChunkBuffer
+
+CHUNK_SIZE = 64 * 1024
+MAX_MERGED_ORDERS = 500
+EXPORT_FORMATS = ('zip', 'pdf')
+
+
+def default_workers():
+    return max(1, min(4, (os.cpu_count() or 1) - 1))
+
+
+def _init_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _render_one(order_id):
+    """Rend (ou retrouve en cache) la facture d'une commande ; retourne (id, titre, chemin ou None)"""
+    from .invoices import get_invoice_path
+    from .models import Order
+    order = Order.objects.for_display().filter(pk=order_id).first()
+    if order is None:
+        return order_id, None, None
+    path = get_invoice_path(order)
+    return order_id, order.title, str(path) if path else None
+
+
+def render_invoices(order_ids, workers=None):
+    """Génère (id, titre, chemin) dans l'ordre des order_ids.
+
+    Avec plus d'un worker, les rendus sont faits dans des processus séparés,
+    avec au plus 2 * workers commandes en cours.
+    """
+    order_ids = list(order_ids)
+    workers = default_workers() if workers is None else workers
+    if workers <= 1 or len(order_ids) <= 1:
+        for order_id in order_ids:
+            yield _render_one(order_id)
+        return
+
+    executor = ProcessPoolExecutor(
+        max_workers=min(workers, len(order_ids)),
+        mp_context=get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'blog_pos.settings'),),
+    )
+    try:
+        pending = deque()
+        remaining = iter(order_ids)
+        for order_id in remaining:
+            pending.append(executor.submit(_render_one, order_id))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            yield pending.popleft().result()
+            next_id = next(remaining, None)
+            if next_id is not None:
+                pending.append(executor.submit(_render_one, next_id))
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _archive_name(order_id, title, used):
+    name = f"Facture-{title or order_id}.pdf".replace('/', '-')
+    if name in used:
+        name = f"Facture-{title or order_id}-{order_id}.pdf".replace('/', '-')
+    used.add(name)
+    return name
+
+
+def stream_zip(order_ids, workers=None, progress=None):
+    """Archive ZIP des factures, émise par morceaux (les PDF ne sont pas recompressés)"""
+    total = len(order_ids)
+    buffer = ChunkBuffer()
+    used = set()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for done, (order_id, title, path) in enumerate(render_invoices(order_ids, workers), start=1):
+            if path is not None and not os.path.exists(path):
+                # Facture modifiée depuis son rendu (ancienne version supprimée) : nouveau rendu
+                order_id, title, path = _render_one(order_id)
+            if path is not None:
+                with open(path, 'rb') as source, archive.open(_archive_name(order_id, title, used), 'w') as dest:
+                    for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                        dest.write(chunk)
+                        data = buffer.drain()
+                        if data:
+                            yield data
+            if progress is not None:
+                progress(done, total)
+    yield buffer.drain()
+
+
+def stream_merged_pdf(order_ids, workers=None, progress=None):
+    """Un seul PDF contenant toutes les factures, assemblé dans un fichier temporaire puis émis"""
+    from pypdf import PdfWriter
+
+    total = len(order_ids)
+    writer = PdfWriter()
+    with tempfile.TemporaryFile() as merged:
+        for done, (_order_id, _title, path) in enumerate(render_invoices(order_ids, workers), start=1):
+            if path is not None and not os.path.exists(path):
+                _order_id, _title, path = _render_one(_order_id)
+            if path is not None:
+                writer.append(path)
+            if progress is not None:
+                progress(done, total)
+        writer.write(merged)
+        writer.close()
+        merged.seek(0)
+        for chunk in iter(lambda: merged.read(CHUNK_SIZE), b''):
+            yield chunk
+
+
+def stream_export(order_ids, export_format='zip', workers=None, progress=None):
+    if export_format == 'pdf':
+        return stream_merged_pdf(order_ids, workers, progress)
+    return stream_zip(order_ids, workers, progress)
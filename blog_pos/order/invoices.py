@@ -0,0 +1,253 @@
+"""
+Rendu des factures PDF avec cache sur disque.
+
+Chaque PDF est rangé sous MEDIA_ROOT/invoices/<id commande>/<empreinte>.pdf, où
+l'empreinte (sha256) couvre tout ce qui est imprimé : la commande, ses lignes,
+ses paiements, le client, la devise et les paramètres de l'entreprise. Toute
+modification produit donc un autre fichier ; un téléchargement dont l'empreinte
+est déjà sur disque est servi tel quel (FileResponse), sans passer par pisa.
+
+done_order_view lance le rendu dans un thread dès la finalisation de la commande
+(prerender_invoice), de sorte que le PDF est en général prêt avant le clic.
+
+Les images de l'entreprise (logo, cachet, signature) sont réduites une fois à
+leur taille d'impression dans MEDIA_ROOT/invoices/branding/ et ces copies sont
+réutilisées par tous les rendus, au lieu de décoder l'original à chaque facture.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.template.loader import render_to_string
+
+from .models import Order, get_currency_label
+
+logger = logging.getLogger(__name__)
+
+try:
+    from xhtml2pdf import pisa
+    PDF_AVAILABLE = True
+except ImportError:
+    pisa = None
+    PDF_AVAILABLE = False
+
+try:
+    # xhtml2pdf récent : lectures locales limitées au dossier courant par défaut
+    from xhtml2pdf.config.resources import ResourceAccessPolicy
+except ImportError:
+    ResourceAccessPolicy = None
+
+INVOICE_TEMPLATE = 'invoice/order_invoice_pdf.html'
+
+# Taille d'impression des images (points, voir order_invoice_pdf.html), rendues à 4x pour la netteté
+BRANDING_SIZES = {
+    'company_logo': (80, 45),
+    'stamp_image': (55, 55),
+    'signature_image': (90, 40),
+}
+BRANDING_SCALE = 4
+
+# Paramètres d'entreprise qui n'apparaissent pas sur la facture
+SETTINGS_IGNORED_FIELDS = {'id', 'updated_at', 'created_at'}
+
+# Verrous par commande (répartis sur un nombre fixe de verrous)
+_order_locks = [threading.Lock() for _ in range(32)]
+_branding_cache = {}
+_branding_lock = threading.Lock()
+
+
+def invoices_dir():
+    return Path(settings.MEDIA_ROOT) / 'invoices'
+
+
+def _order_lock(order_id):
+    return _order_locks[order_id % len(_order_locks)]
+
+
+def _app_settings():
+    try:
+        from users.models import AppSetting
+        return AppSetting.get_solo()
+    except Exception:
+        return None
+
+
+def branding_image(field_file, size):
+    """Chemin d'une copie PNG de l'image réduite à size (x BRANDING_SCALE), créée une seule fois.
+
+    Retourne le chemin de l'original si l'image ne peut pas être réduite.
+    """
+    try:
+        source = field_file.path
+        stat = os.stat(source)
+    except (ValueError, OSError):
+        return None
+    key = (source, stat.st_mtime_ns, stat.st_size, size)
+    with _branding_lock:
+        cached = _branding_cache.get(key)
+        if cached is not None and os.path.exists(cached):
+            return cached
+
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+        target = invoices_dir() / 'branding' / f'{digest}.png'
+        if not target.exists():
+            try:
+                from PIL import Image
+                with Image.open(source) as image:
+                    image = image.convert('RGBA')
+                    image.thumbnail((size[0] * BRANDING_SCALE, size[1] * BRANDING_SCALE))
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    _write_atomic(target, lambda f: image.save(f, format='PNG', optimize=True))
+            except Exception:
+                logger.warning("Réduction impossible pour %s, utilisation de l'original", source, exc_info=True)
+                return source
+        _branding_cache[key] = str(target)
+        return str(target)
+
+
+def invoice_issued_on(order, payments):
+    """Date imprimée sur la facture : dernier changement de ce qu'elle montre (date de la
+    commande ou du dernier paiement), jamais l'heure du rendu qui figerait le PDF en cache"""
+    return max([order.date] + [payment.date for payment in payments])
+
+
+def invoice_context(order, app_settings=None):
+    """Contexte du gabarit PDF ; lignes et paiements chargés une fois (réutilisés pour l'empreinte)"""
+    if app_settings is None:
+        app_settings = _app_settings()
+    branding = {}
+    if app_settings is not None:
+        for field_name, size in BRANDING_SIZES.items():
+            field_file = getattr(app_settings, field_name, None)
+            branding[field_name] = branding_image(field_file, size) if field_file else None
+    payments = list(order.payments.all())
+    return {
+        'order': order,
+        'items': list(order.order_items.select_related('product').order_by('pk')),
+        'payments': payments,
+        'issued_on': invoice_issued_on(order, payments),
+        'currency': get_currency_label(),
+        'total_payments': order.amount_paid,
+        'remaining_amount': order.remaining_amount,
+        'client': order.client,
+        'app_settings': app_settings,
+        'branding': branding,
+    }
+
+
+def invoice_fingerprint(context):
+    """Empreinte sha256 de tout ce qui est imprimé sur la facture"""
+    order = context['order']
+    client = context['client']
+    app_settings = context['app_settings']
+    parts = [
+        ('order', order.pk, order.title, str(order.date), str(order.value), str(order.discount),
+         str(order.final_value), str(order.amount_paid), order.is_paid),
+        ('client', client.name, client.phone) if client else ('client', None),
+        ('currency', context['currency']),
+        ('issued_on', str(context['issued_on'])),
+    ]
+    parts += [
+        ('item', it.pk, it.product.title, it.qty, str(it.final_price), str(it.total_price))
+        for it in context['items']
+    ]
+    parts += [
+        ('payment', p.pk, str(p.date), p.method, str(p.amount), p.note)
+        for p in context['payments']
+    ]
+    if app_settings is not None:
+        parts += [
+            ('setting', field.attname, str(getattr(app_settings, field.attname)))
+            for field in app_settings._meta.concrete_fields
+            if field.attname not in SETTINGS_IGNORED_FIELDS
+        ]
+        parts += [('branding', sorted((k, v or '') for k, v in context['branding'].items()))]
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _write_atomic(target, write):
+    """Écrit via un fichier temporaire du même dossier puis le renomme : jamais de fichier partiel"""
+    fd, tmp = tempfile.mkstemp(dir=target.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp, target)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def render_invoice_pdf(context):
+    """PDF de la facture (bytes), ou None si xhtml2pdf est absent ou en erreur"""
+    if not PDF_AVAILABLE:
+        return None
+    html = render_to_string(INVOICE_TEMPLATE, context)
+    result = BytesIO()
+    kwargs = {}
+    if ResourceAccessPolicy is not None:
+        # Les images de l'entreprise sont sous MEDIA_ROOT (dossier userData en mode application)
+        kwargs['resource_policy'] = ResourceAccessPolicy(
+            base_dir=Path(settings.MEDIA_ROOT), extra_roots=(Path(settings.BASE_DIR),)
+        )
+    pdf = pisa.CreatePDF(src=html, dest=result, **kwargs)
+    if pdf.err:
+        return None
+    return result.getvalue()
+
+
+def get_invoice_path(order):
+    """Chemin du PDF à jour de la commande, rendu et mis en cache si nécessaire (None si échec)"""
+    context = invoice_context(order)
+    fingerprint = invoice_fingerprint(context)
+    directory = invoices_dir() / str(order.pk)
+    target = directory / f'{fingerprint}.pdf'
+
+    # Un seul rendu à la fois par commande : un téléchargement attend le pré-rendu en cours
+    with _order_lock(order.pk):
+        if target.exists():
+            return target
+        content = render_invoice_pdf(context)
+        if content is None:
+            return None
+        directory.mkdir(parents=True, exist_ok=True)
+        _write_atomic(target, lambda f: f.write(content))
+        # Les versions précédentes de la facture ne servent plus
+        for old in directory.glob('*.pdf'):
+            if old != target:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+    return target
+
+
+def _prerender(order_id):
+    try:
+        order = Order.objects.for_display().filter(pk=order_id).first()
+        if order is not None:
+            get_invoice_path(order)
+    except Exception:
+        logger.exception("Pré-rendu de la facture %s impossible", order_id)
+    finally:
+        connection.close()
+
+
+def prerender_invoice(order_id):
+    """Lance le rendu de la facture dans un thread, après validation de la transaction en cours"""
+    if not PDF_AVAILABLE:
+        return
+
+    def start():
+        threading.Thread(target=_prerender, args=(order_id,), name=f'invoice-{order_id}', daemon=True).start()
+
+    transaction.on_commit(start)
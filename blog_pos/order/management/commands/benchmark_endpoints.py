@@ -0,0 +1,288 @@
+"""
+Mesure la latence et le nombre de requêtes SQL des pages et appels AJAX les plus
+sollicités, au travers du client de test de Django (middlewares, session, licence et
+rendu compris) : ajout au panier, recherche de produits, ancien tableau de bord,
+analytique, fiche client et facture PDF.
+
+Tout s'exécute dans une transaction annulée à la fin (utilisateur de mesure, commande
+de caisse, lignes ajoutées) ; les callbacks on_commit de chaque requête (journal des
+mouvements, statistiques) sont exécutés et comptés avec elle. Les factures sont rendues
+à froid (PDF en cache supprimé avant la requête) dans un MEDIA_ROOT temporaire où sont
+copiées les images de l'entreprise : le cache réel des factures n'est jamais touché.
+Les URLs sont tirées avec une graine fixe : deux exécutions sur les mêmes données sont
+comparables.
+
+Le résultat JSON (--sortie) sert de référence pour comparer deux commits (--comparer).
+Données de mesure : python manage.py generate_shop_data
+
+Usage:
+    python manage.py benchmark_endpoints
+    python manage.py benchmark_endpoints --repetitions 50 --sortie bench-avant.json
+    python manage.py benchmark_endpoints --sortie bench-apres.json --comparer bench-avant.json
+    python manage.py benchmark_endpoints --endpoint ajax_search_products --endpoint invoice_pdf_view
+"""
+
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import uuid
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client as TestClient, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from blog_pos.querybudget import percentile
+from client.models import Client
+from licensing.license_manager import LicenseManager
+from order.invoices import BRANDING_SIZES, PDF_AVAILABLE, invoices_dir
+from order.models import Order
+from product.models import Product
+from users.models import AppSetting, User
+
+ENDPOINTS = (
+    'ajax_add_product', 'ajax_search_products', 'HomepageView',
+    'analytics_dashboard', 'client_detail_view', 'invoice_pdf_view',
+)
+# Lignes ajoutées à une commande de caisse avant d'en ouvrir une nouvelle
+ARTICLES_PAR_PANIER = 10
+
+
+class Scenario:
+    """Choisit, pour chaque endpoint, l'URL de la prochaine requête (tirage reproductible)"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        produits = Product.objects.filter(active=True, qty__gte=ARTICLES_PAR_PANIER).order_by('pk')
+        self.produits = list(produits.values_list('pk', flat=True)[:500])
+        titres = Product.objects.filter(active=True).order_by('pk').values_list('title', flat=True)[:500]
+        mots = sorted({mot.lower() for titre in titres for mot in titre.split() if len(mot) >= 3})
+        # Recherche au fil de la frappe : préfixes de 2 à 5 lettres et mots complets
+        self.termes = sorted({mot[:taille] for mot in mots for taille in (2, 3, 5)} | set(mots))
+        self.clients = list(
+            Client.objects.annotate(nombre=Count('orders')).order_by('-nombre', 'pk').values_list('pk', flat=True)[:50]
+        )
+        self.commandes = list(
+            Order.objects.filter(value__gt=0).order_by('-date', '-pk').values_list('pk', flat=True)[:500]
+        )
+        if not self.produits or not self.commandes:
+            raise CommandError("Pas assez de données : lancez d'abord python manage.py generate_shop_data")
+        self.panier = None
+        self.version = None
+        self.articles = 0
+
+    def url(self, endpoint):
+        return getattr(self, endpoint)()
+
+    def ajax_add_product(self):
+        if self.panier is None or self.articles >= ARTICLES_PAR_PANIER:
+            self.panier = Order.objects.create()
+            self.version = self.panier.cart_version
+            self.articles = 0
+        self.articles += 1
+        url = reverse('ajax_add', args=[self.panier.pk, self.rng.choice(self.produits)])
+        return f"{url}?qty=1&mode=delta&version={self.version}"
+
+    def ajax_search_products(self):
+        commande = self.panier.pk if self.panier else self.commandes[0]
+        return f"{reverse('ajax-search', args=[commande])}?q={self.rng.choice(self.termes)}"
+
+    def HomepageView(self):
+        return reverse('homepage')
+
+    def analytics_dashboard(self):
+        return reverse('aprovision:analytics_dashboard')
+
+    def client_detail_view(self):
+        if not self.clients:
+            return None
+        return reverse('client:client_detail', args=[self.rng.choice(self.clients)])
+
+    def invoice_pdf_view(self):
+        commande = self.rng.choice(self.commandes)
+        # Rendu à froid : sans le PDF déjà en cache, les mesures restent comparables d'une exécution à l'autre
+        shutil.rmtree(invoices_dir() / str(commande), ignore_errors=True)
+        return reverse('invoice_pdf', args=[commande])
+
+    def apres(self, endpoint, response):
+        """Suivi de la version du panier renvoyée par l'ajout (comme le fait l'écran de caisse)"""
+        if endpoint == 'ajax_add_product' and response.status_code == 200:
+            self.version = json.loads(response.content).get('version', self.version)
+
+
+def _copier_images_entreprise(media_root):
+    """Copie sous media_root les images imprimées sur les factures (logo, cachet, signature)"""
+    reglages = AppSetting.objects.filter(id=1).first()
+    if reglages is None:
+        return
+    for champ in BRANDING_SIZES:
+        fichier = getattr(reglages, champ)
+        if not fichier or not os.path.exists(fichier.path):
+            continue
+        cible = os.path.join(media_root, fichier.name)
+        os.makedirs(os.path.dirname(cible), exist_ok=True)
+        shutil.copy2(fichier.path, cible)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _statistiques(valeurs):
+    valeurs = sorted(valeurs)
+    return {
+        'p50': percentile(valeurs, 50),
+        'p90': percentile(valeurs, 90),
+        'p95': percentile(valeurs, 95),
+        'p99': percentile(valeurs, 99),
+        'max': valeurs[-1],
+        'mean': sum(valeurs) / len(valeurs),
+    }
+
+
+class Command(BaseCommand):
+    help = "Mesure latence (percentiles) et requêtes SQL des endpoints critiques, résultat en JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repetitions', type=int, default=30, help="Requêtes mesurées par endpoint (défaut : 30)")
+        parser.add_argument('--echauffement', type=int, default=3, help="Requêtes non mesurées avant la mesure (défaut : 3)")
+        parser.add_argument('--endpoint', action='append', choices=ENDPOINTS, help="Limiter à cet endpoint (répétable)")
+        parser.add_argument('--seed', type=int, default=1, help="Graine du tirage des URLs")
+        parser.add_argument('--sortie', metavar='FICHIER', help="Écrit le résultat JSON dans ce fichier")
+        parser.add_argument('--comparer', metavar='FICHIER', help="Résultat JSON de référence (autre commit)")
+        parser.add_argument('--seuil', type=float, default=20.0, help="Hausse du p95 signalée comme régression, en %% (défaut : 20)")
+
+    def handle(self, *args, **options):
+        if not LicenseManager().get_cached_license_status()['is_valid']:
+            raise CommandError("Licence invalide : les pages mesurées seraient redirigées vers l'activation")
+        endpoints = options['endpoint'] or list(ENDPOINTS)
+        if 'invoice_pdf_view' in endpoints and not PDF_AVAILABLE:
+            self.stdout.write(self.style.WARNING("xhtml2pdf n'est pas installé : invoice_pdf_view ignoré"))
+            endpoints.remove('invoice_pdf_view')
+        reference = None
+        if options['comparer']:
+            with open(options['comparer'], encoding='utf-8') as source:
+                reference = json.load(source)
+
+        resultats = {
+            'meta': {
+                'commit': _git_commit(),
+                'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'repetitions': options['repetitions'],
+                'seed': options['seed'],
+                'data': {
+                    'products': Product.objects.count(),
+                    'orders': Order.objects.count(),
+                    'clients': Client.objects.count(),
+                },
+            },
+            'endpoints': {},
+        }
+
+        # Factures rendues et supprimées dans un dossier temporaire, pas dans le vrai MEDIA_ROOT
+        with tempfile.TemporaryDirectory(prefix='benchmark-media-') as media_root:
+            _copier_images_entreprise(media_root)
+            with override_settings(MEDIA_ROOT=media_root):
+                self._executer(resultats, endpoints, options)
+
+        self._afficher(resultats, reference, options['seuil'])
+        if options['sortie']:
+            with open(options['sortie'], 'w', encoding='utf-8') as destination:
+                json.dump(resultats, destination, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Résultat écrit dans {options['sortie']}"))
+
+    def _executer(self, resultats, endpoints, options):
+        with transaction.atomic():
+            user = User.objects.create_superuser(f'benchmark-{uuid.uuid4().hex[:8]}', password=None, role='manager')
+            client = TestClient(HTTP_HOST='localhost')
+            client.force_login(user)
+            scenario = Scenario(random.Random(options['seed']))
+            for endpoint in endpoints:
+                mesure = self._mesurer(client, scenario, endpoint, options['echauffement'], options['repetitions'])
+                if mesure is not None:
+                    resultats['endpoints'][endpoint] = mesure
+            transaction.set_rollback(True)
+
+    def _mesurer(self, client, scenario, endpoint, echauffement, repetitions):
+        durees, requetes, statuts = [], [], {}
+        for rang in range(echauffement + max(1, repetitions)):
+            url = scenario.url(endpoint)
+            if url is None:
+                self.stdout.write(self.style.WARNING(f"{endpoint} : aucune donnée à mesurer, ignoré"))
+                return None
+            with CaptureQueriesContext(connection) as capture:
+                debut = time.perf_counter()
+                with TestCase.captureOnCommitCallbacks(execute=True):
+                    response = client.get(url)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                duree = (time.perf_counter() - debut) * 1000
+            scenario.apres(endpoint, response)
+            if rang < echauffement:
+                continue
+            durees.append(duree)
+            requetes.append(len(capture.captured_queries))
+            statuts[str(response.status_code)] = statuts.get(str(response.status_code), 0) + 1
+        return {
+            'requests': len(durees),
+            'status': statuts,
+            'latency_ms': _statistiques(durees),
+            'queries': {'min': min(requetes), 'p50': percentile(sorted(requetes), 50), 'max': max(requetes)},
+        }
+
+    def _afficher(self, resultats, reference, seuil):
+        meta = resultats['meta']
+        self.stdout.write(
+            f"Commit {meta['commit'] or '?'} - {meta['data']['products']} produits, {meta['data']['orders']} commandes, "
+            f"{meta['data']['clients']} clients - {meta['repetitions']} requêtes par endpoint"
+        )
+        self.stdout.write(
+            f"{'Endpoint':<22} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'SQL p50':>8} {'SQL max':>8}  statuts"
+        )
+        for endpoint, mesure in resultats['endpoints'].items():
+            latence, sql = mesure['latency_ms'], mesure['queries']
+            ligne = (
+                f"{endpoint:<22} {latence['p50']:>8.1f} {latence['p95']:>8.1f} {latence['max']:>8.1f} "
+                f"{sql['p50']:>8} {sql['max']:>8}  {mesure['status']}"
+            )
+            if set(mesure['status']) - {'200'}:
+                ligne = self.style.WARNING(ligne)
+            self.stdout.write(ligne)
+
+        if reference is None:
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\nComparaison avec {reference.get('meta', {}).get('commit') or 'la référence'}"
+        ))
+        for endpoint, mesure in resultats['endpoints'].items():
+            avant = reference.get('endpoints', {}).get(endpoint)
+            if avant is None:
+                self.stdout.write(f"{endpoint:<22} absent de la référence")
+                continue
+            p95_avant, p95 = avant['latency_ms']['p95'], mesure['latency_ms']['p95']
+            ecart = (p95 - p95_avant) / p95_avant * 100 if p95_avant else 0.0
+            sql_avant, sql = avant['queries']['max'], mesure['queries']['max']
+            ligne = f"{endpoint:<22} p95 {p95_avant:>8.1f} -> {p95:>8.1f} ms ({ecart:+.0f} %)   SQL max {sql_avant} -> {sql}"
+            if ecart > seuil or sql > sql_avant:
+                ligne = self.style.ERROR(ligne + "  régression")
+            elif ecart < -seuil or sql < sql_avant:
+                ligne = self.style.SUCCESS(ligne)
+            self.stdout.write(ligne)
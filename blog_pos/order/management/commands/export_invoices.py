@@ -0,0 +1,57 @@
+"""
+Exporte les factures d'une sélection de commandes dans une archive ZIP ou un PDF unique.
+
+Usage:
+    python manage.py export_invoices factures.zip --date-start 2024-01-01 --date-end 2024-01-31
+    python manage.py export_invoices impayees.pdf --format pdf --is-paid False
+    python manage.py export_invoices toutes.zip --workers 4
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from order.invoice_export import EXPORT_FORMATS, MAX_MERGED_ORDERS, stream_export
+from order.invoices import PDF_AVAILABLE
+from order.models import Order
+
+
+class Command(BaseCommand):
+    help = "Exporte les factures des commandes filtrées (mêmes filtres que la liste des commandes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Fichier à écrire (.zip ou .pdf)")
+        parser.add_argument('--format', choices=EXPORT_FORMATS, help="zip ou pdf (par défaut : extension du fichier)")
+        parser.add_argument('--date-start', help="Première date (AAAA-MM-JJ)")
+        parser.add_argument('--date-end', help="Dernière date (AAAA-MM-JJ)")
+        parser.add_argument('--is-paid', choices=['True', 'False'], help="Filtrer sur le statut de paiement")
+        parser.add_argument('--search', help="Texte contenu dans le numéro de commande")
+        parser.add_argument('--workers', type=int, help="Nombre de processus de rendu (1 = sans pool)")
+
+    def handle(self, *args, **options):
+        if not PDF_AVAILABLE:
+            raise CommandError("xhtml2pdf n'est pas installé")
+
+        output = options['output']
+        export_format = options['format'] or ('pdf' if output.lower().endswith('.pdf') else 'zip')
+        params = {
+            'search_name': options['search'],
+            'date_start': options['date_start'],
+            'date_end': options['date_end'],
+            'is_paid': options['is_paid'],
+        }
+        order_ids = list(
+            Order.filter_params(params, Order.objects.all()).order_by('date', 'pk').values_list('pk', flat=True)
+        )
+        if not order_ids:
+            raise CommandError("Aucune commande ne correspond aux filtres")
+        if export_format == 'pdf' and len(order_ids) > MAX_MERGED_ORDERS:
+            raise CommandError(f"Trop de commandes pour un PDF unique ({len(order_ids)} > {MAX_MERGED_ORDERS}) : utilisez --format zip")
+
+        def progress(done, total):
+            self.stdout.write(f"\r{done}/{total} facture(s)", ending='')
+            self.stdout.flush()
+
+        with open(output, 'wb') as destination:
+            for chunk in stream_export(order_ids, export_format, workers=options['workers'], progress=progress):
+                destination.write(chunk)
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f"{len(order_ids)} facture(s) exportée(s) dans {output}"))
@@ -0,0 +1,327 @@
+"""
+Génère un jeu de données réaliste pour les mesures de performance : catalogue par
+catégories, clients, plusieurs années de commandes avec leurs lignes, paiements
+(complets, partiels ou absents), mouvements de stock (ventes, approvisionnements,
+pertes) et dépenses. Tout est écrit par bulk_create, mois par mois.
+
+Les signaux n'étant pas déclenchés par bulk_create, les données dérivées sont écrites
+directement (totaux et paiements des commandes, stock des produits, numérotation du
+jour) puis l'index de recherche et les statistiques journalières sont reconstruits.
+
+À lancer sur une base de test : les données s'ajoutent à celles existantes.
+
+Usage:
+    python manage.py generate_shop_data
+    python manage.py generate_shop_data --produits 2000 --clients 1000 --jours 1095 --commandes-par-jour 60
+    python manage.py generate_shop_data --seed 7 --force
+"""
+
+import datetime
+import random
+import uuid
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from aprovision.models import Depense, MouvementStock, TypeDepense, TypeMouvement
+from aprovision.rollup import reconstruire
+from client.models import Client, invalidate_search_cache
+from order.models import Order, OrderItem, OrderSequence, Payment
+from product.catalog import CATALOG_VERSION_KEY
+from product.models import Category, Product
+from product.search import index_products
+
+BATCH_SIZE = 2000
+
+CATALOGUE = {
+    'Boissons': ['Eau minérale', 'Jus de bissap', 'Jus de gingembre', 'Soda cola', 'Soda orange', 'Thé vert', 'Café soluble'],
+    'Épicerie': ['Riz parfumé', 'Riz brisé', 'Huile végétale', 'Sucre', 'Farine de blé', 'Lait en poudre', 'Pâtes', 'Tomate concentrée'],
+    'Produits frais': ['Oignons', 'Pommes de terre', 'Œufs', 'Beurre', 'Fromage fondu', 'Yaourt'],
+    'Hygiène': ['Savon', 'Dentifrice', 'Shampoing', 'Lessive', 'Eau de javel', 'Papier toilette'],
+    'Quincaillerie': ['Ampoule LED', 'Pile', 'Rallonge électrique', 'Cadenas', 'Seau'],
+    'Téléphonie': ['Recharge crédit', 'Câble USB', 'Chargeur', 'Écouteurs', 'Carte mémoire'],
+    'Papeterie': ['Cahier', 'Stylo', 'Crayon', 'Ramette de papier', 'Enveloppes'],
+    'Bébé': ['Couches', 'Lait infantile', 'Lingettes', 'Biberon'],
+}
+FORMATS = ['petit format', 'moyen format', 'grand format', 'lot de 3', 'lot de 6', 'carton']
+MARQUES = ['Dama', 'Sahel', 'Kairaba', 'Gambia Best', 'Atlantic', 'Baobab', 'Teranga', 'Kombo']
+PRENOMS = ['Awa', 'Fatou', 'Mariama', 'Aminata', 'Isatou', 'Binta', 'Lamin', 'Ousman', 'Modou', 'Ebrima', 'Musa', 'Alieu', 'Saikou', 'Omar']
+NOMS = ['Jallow', 'Ceesay', 'Touray', 'Sowe', 'Bah', 'Njie', 'Camara', 'Sanneh', 'Darboe', 'Jammeh', 'Manneh', 'Diallo']
+TYPES_DEPENSE = {
+    'Approvisionnement': "Achats de marchandises",
+    'Loyer': "Loyer mensuel de la boutique",
+    'Électricité': "Factures d'électricité",
+    'Salaires': "Salaires du personnel",
+    'Transport': "Livraisons et déplacements",
+}
+# (méthode, poids) des paiements
+METHODES = [('cash', 60), ('wave', 20), ('mobile', 10), ('card', 5), ('credit', 5)]
+
+
+def _cumuls(poids):
+    """Poids cumulés pour random.choices(cum_weights=...), calculés une seule fois"""
+    cumuls, total = [], 0
+    for valeur in poids:
+        total += valeur
+        cumuls.append(total)
+    return cumuls
+
+
+class Command(BaseCommand):
+    help = "Génère des produits, clients, commandes, paiements, mouvements et dépenses pour les benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produits', type=int, default=500, help="Nombre de produits (défaut : 500)")
+        parser.add_argument('--clients', type=int, default=300, help="Nombre de clients (défaut : 300)")
+        parser.add_argument('--jours', type=int, default=730, help="Historique en jours jusqu'à aujourd'hui (défaut : 730)")
+        parser.add_argument('--commandes-par-jour', type=int, default=30, help="Commandes par jour en moyenne (défaut : 30)")
+        parser.add_argument('--seed', type=int, default=42, help="Graine aléatoire (même graine, mêmes données)")
+        parser.add_argument('--force', action='store_true', help="Ajouter même si la base contient déjà des commandes")
+
+    def handle(self, *args, **options):
+        existantes = Order.objects.count()
+        if existantes and not options['force']:
+            raise CommandError(f"La base contient déjà {existantes} commande(s) : utilisez --force pour ajouter quand même")
+
+        self.rng = random.Random(options['seed'])
+        fin = timezone.localdate()
+        debut = fin - datetime.timedelta(days=max(1, options['jours']) - 1)
+
+        with transaction.atomic():
+            produits = self._creer_catalogue(options['produits'])
+            clients = self._creer_clients(options['clients'])
+            types = self._types_depense()
+            self.stdout.write(f"{len(produits)} produit(s), {len(clients)} client(s)")
+
+            # Stock de chaque produit, suivi jour après jour (ventes, réassorts, pertes)
+            self.stock = {produit.pk: produit.qty for produit in produits}
+            self.poids_clients = _cumuls(1 / (rang + 1) for rang in range(len(clients)))
+            sequences = dict(
+                OrderSequence.objects.filter(day__range=(debut, fin)).values_list('day', 'last_value')
+            )
+            totaux = {'commandes': 0, 'lignes': 0, 'paiements': 0, 'mouvements': 0, 'depenses': 0}
+
+            jour = debut
+            while jour <= fin:
+                mois_fin = min(fin, (jour.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - datetime.timedelta(days=1))
+                self._generer_periode(jour, mois_fin, produits, clients, types, sequences, options['commandes_par_jour'], totaux)
+                self.stdout.write(f"\r{mois_fin:%Y-%m} : {totaux['commandes']} commande(s)", ending='')
+                self.stdout.flush()
+                jour = mois_fin + datetime.timedelta(days=1)
+            self.stdout.write('')
+
+            for produit in produits:
+                produit.qty = self.stock[produit.pk]
+            Product.objects.bulk_update(produits, ['qty'], batch_size=BATCH_SIZE)
+            OrderSequence.objects.bulk_create(
+                [OrderSequence(day=day, last_value=value) for day, value in sequences.items()],
+                update_conflicts=True, unique_fields=['day'], update_fields=['last_value'],
+                batch_size=BATCH_SIZE,
+            )
+
+            index_products([produit.pk for produit in produits])
+            jours = reconstruire(debut, fin)
+
+        # Instantanés en cache (catalogue, recherche client) écrits avant les données
+        cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+        invalidate_search_cache()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{totaux['commandes']} commande(s), {totaux['lignes']} ligne(s), {totaux['paiements']} paiement(s), "
+            f"{totaux['mouvements']} mouvement(s), {totaux['depenses']} dépense(s) du {debut} au {fin} "
+            f"({jours} jour(s) de statistiques)"
+        ))
+
+    # --- Référentiels ---
+
+    def _creer_catalogue(self, nombre):
+        categories = {}
+        for titre in CATALOGUE:
+            categories[titre], _ = Category.objects.get_or_create(title=titre)
+
+        pris = set(Product.objects.values_list('title', flat=True))
+        combinaisons = [
+            (categorie, f"{base} {marque} {format_}")
+            for categorie, bases in CATALOGUE.items() for base in bases
+            for marque in MARQUES for format_ in FORMATS
+        ]
+        self.rng.shuffle(combinaisons)
+        produits = []
+        for index in range(nombre):
+            categorie, titre = combinaisons[index % len(combinaisons)]
+            if index >= len(combinaisons):
+                titre = f"{titre} {index // len(combinaisons) + 1}"
+            if titre in pris:
+                continue
+            pris.add(titre)
+            prix = Decimal(self.rng.choice([25, 50, 75, 100, 150, 200, 250, 350, 500, 750, 1000, 1500, 2500]))
+            remise = (prix * Decimal('0.9')).quantize(Decimal('1')) if self.rng.random() < 0.1 else Decimal('0')
+            produits.append(Product(
+                title=titre,
+                category=categories[categorie],
+                value=prix,
+                discount_value=remise,
+                final_value=remise if remise > 0 else prix,
+                prix_achat=(prix * Decimal(self.rng.uniform(0.55, 0.8))).quantize(Decimal('0.01')),
+                qty=self.rng.randint(20, 200),
+                active=self.rng.random() > 0.03,
+            ))
+        return Product.objects.bulk_create(produits, batch_size=BATCH_SIZE)
+
+    def _creer_clients(self, nombre):
+        pris = set(Client.objects.values_list('phone', flat=True))
+        clients = []
+        numero = 0
+        while len(clients) < nombre:
+            numero += 1
+            telephone = f"7{numero:07d}"
+            if telephone in pris:
+                continue
+            clients.append(Client(
+                phone=telephone,
+                name=f"{self.rng.choice(PRENOMS)} {self.rng.choice(NOMS)}",
+                is_active=self.rng.random() > 0.05,
+            ))
+        return Client.objects.bulk_create(clients, batch_size=BATCH_SIZE)
+
+    def _types_depense(self):
+        types = {}
+        for nom, description in TYPES_DEPENSE.items():
+            types[nom], _ = TypeDepense.objects.get_or_create(nom=nom, defaults={'description': description})
+        return types
+
+    # --- Activité ---
+
+    def _moment(self, jour, heure_min=8, heure_max=21):
+        """Date et heure locales aléatoires du jour, converties en datetime conscient"""
+        naif = datetime.datetime.combine(jour, datetime.time(self.rng.randint(heure_min, heure_max - 1), self.rng.randint(0, 59)))
+        return timezone.make_aware(naif)
+
+    def _generer_periode(self, debut, fin, produits, clients, types, sequences, par_jour, totaux):
+        commandes, lignes, paiements, mouvements, depenses = [], [], [], [], []
+        vendables = [produit for produit in produits if produit.active]
+        poids_produits = _cumuls(1 / (rang + 1) ** 0.8 for rang in range(len(vendables)))
+
+        jour = debut
+        while jour <= fin:
+            # Plus d'activité le samedi, moins le dimanche
+            facteur = {5: 1.3, 6: 0.6}.get(jour.weekday(), 1.0)
+            nombre = max(0, int(self.rng.gauss(par_jour * facteur, par_jour * 0.2)))
+            moments = sorted(self._moment(jour) for _ in range(nombre))
+            sequence = sequences.get(jour, 0)
+
+            for moment in moments:
+                sequence += 1
+                commande = Order(
+                    date=jour,
+                    title=f"CMD-{jour:%Y%m%d}-{timezone.localtime(moment):%H%M}-{sequence:03d}",
+                    client=self.rng.choices(clients, cum_weights=self.poids_clients)[0] if clients and self.rng.random() < 0.4 else None,
+                )
+                total = Decimal('0.00')
+                for produit in set(self.rng.choices(vendables, cum_weights=poids_produits, k=self.rng.randint(1, 5))):
+                    qty = self.rng.choices([1, 2, 3, 5, 10], weights=[60, 20, 10, 7, 3])[0]
+                    if self.stock[produit.pk] < qty:
+                        mouvements.append(self._approvisionner(produit, moment, types, depenses))
+                    avant = self.stock[produit.pk]
+                    self.stock[produit.pk] -= qty
+                    ligne = OrderItem(
+                        order=commande, product=produit, qty=qty, price=produit.final_value,
+                        final_price=produit.final_value, total_price=produit.final_value * qty,
+                    )
+                    lignes.append(ligne)
+                    total += ligne.total_price
+                    mouvements.append(MouvementStock(
+                        produit=produit, type_mouvement=TypeMouvement.SORTIE_VENTE, quantite=-qty,
+                        stock_avant=avant, stock_apres=self.stock[produit.pk], reference_commande=commande,
+                        description="Vente", date_mouvement=moment,
+                    ))
+
+                commande.value = total
+                commande.discount = Decimal('0.00')
+                if self.rng.random() < 0.08:
+                    commande.discount = (total * Decimal('0.05')).quantize(Decimal('1'))
+                commande.final_value = total - commande.discount
+                commande.amount_paid = self._payer(commande, jour, fin, paiements)
+                commande.is_paid = commande.final_value > 0 and commande.amount_paid >= commande.final_value
+                commandes.append(commande)
+
+            if sequence:
+                sequences[jour] = sequence
+            self._depenses_du_jour(jour, types, depenses)
+            if self.rng.random() < 0.05 and vendables:
+                produit = self.rng.choice(vendables)
+                if self.stock[produit.pk] > 0:
+                    avant = self.stock[produit.pk]
+                    self.stock[produit.pk] -= 1
+                    mouvements.append(MouvementStock(
+                        produit=produit, type_mouvement=TypeMouvement.SORTIE_PERTE, quantite=-1,
+                        stock_avant=avant, stock_apres=avant - 1, description="Casse",
+                        date_mouvement=self._moment(jour),
+                    ))
+            jour += datetime.timedelta(days=1)
+
+        # Parents d'abord : bulk_create renseigne leurs clés, reprises par les lignes
+        Order.objects.bulk_create(commandes, batch_size=BATCH_SIZE)
+        Depense.objects.bulk_create(depenses, batch_size=BATCH_SIZE)
+        OrderItem.objects.bulk_create(lignes, batch_size=BATCH_SIZE)
+        Payment.objects.bulk_create(paiements, batch_size=BATCH_SIZE)
+        MouvementStock.objects.bulk_create(mouvements, batch_size=BATCH_SIZE)
+        totaux['commandes'] += len(commandes)
+        totaux['lignes'] += len(lignes)
+        totaux['paiements'] += len(paiements)
+        totaux['mouvements'] += len(mouvements)
+        totaux['depenses'] += len(depenses)
+
+    def _payer(self, commande, jour, fin, paiements):
+        """Paiements de la commande : 75 % payées en une fois, 15 % en partie, 10 % pas encore"""
+        tirage = self.rng.random()
+        if tirage >= 0.9 or commande.final_value <= 0:
+            return Decimal('0.00')
+        methode = lambda: self.rng.choices([m for m, _ in METHODES], weights=[p for _, p in METHODES])[0]
+        if tirage < 0.75:
+            montants = [commande.final_value]
+        else:
+            acompte = (commande.final_value * Decimal(self.rng.uniform(0.2, 0.6))).quantize(Decimal('1'))
+            montants = [acompte]
+            if self.rng.random() < 0.5:
+                montants.append(((commande.final_value - acompte) / 2).quantize(Decimal('0.01')))
+        for rang, montant in enumerate(montants):
+            date = min(fin, jour + datetime.timedelta(days=rang * self.rng.randint(1, 20)))
+            paiements.append(Payment(order=commande, amount=montant, date=date, method=methode()))
+        return sum(montants, Decimal('0.00'))
+
+    def _approvisionner(self, produit, moment, types, depenses):
+        """Entrée de stock (et dépense d'approvisionnement) juste avant la vente qui l'épuiserait"""
+        quantite = self.rng.choice([24, 48, 60, 100])
+        depense = Depense(
+            type_depense=types['Approvisionnement'],
+            description=f"Réassort {produit.title}"[:200],
+            montant=produit.prix_achat * quantite,
+            date_depense=timezone.localtime(moment).date(),
+            fournisseur=self.rng.choice(MARQUES),
+        )
+        depenses.append(depense)
+        avant = self.stock[produit.pk]
+        self.stock[produit.pk] += quantite
+        mouvement = MouvementStock(
+            produit=produit, type_mouvement=TypeMouvement.ENTREE, quantite=quantite,
+            stock_avant=avant, stock_apres=self.stock[produit.pk],
+            prix_achat_unitaire=produit.prix_achat, reference_depense=depense,
+            description="Approvisionnement", date_mouvement=moment - datetime.timedelta(minutes=30),
+        )
+        mouvement.calculer_cout_total()
+        return mouvement
+
+    def _depenses_du_jour(self, jour, types, depenses):
+        if jour.day == 1:
+            depenses.append(Depense(type_depense=types['Loyer'], description="Loyer", montant=Decimal('15000'), date_depense=jour))
+            depenses.append(Depense(type_depense=types['Salaires'], description="Salaires", montant=Decimal('24000'), date_depense=jour))
+        if jour.day == 10:
+            montant = Decimal(self.rng.randint(1500, 4000))
+            depenses.append(Depense(type_depense=types['Électricité'], description="Facture électricité", montant=montant, date_depense=jour))
+        if self.rng.random() < 0.3:
+            montant = Decimal(self.rng.randint(50, 600))
+            depenses.append(Depense(type_depense=types['Transport'], description="Transport marchandises", montant=montant, date_depense=jour))
@@ -0,0 +1,82 @@
+"""
+Rapport du budget de requêtes par vue (échantillons enregistrés par QueryBudgetMiddleware
+quand WELTO_QUERY_BUDGET=true) : nombre de requêtes SQL, temps en base, dans les
+templates et en Python (p50 / p95 / max), puis les requêtes répétées de chaque vue.
+
+Usage:
+    python manage.py query_budget
+    python manage.py query_budget --tri requetes --repetees 10
+    python manage.py query_budget --json budget.json
+    python manage.py query_budget --reset
+"""
+
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog_pos.querybudget import get_store
+
+TRIS = {'total': 'total_ms', 'requetes': 'queries', 'base': 'db_ms', 'templates': 'template_ms', 'python': 'python_ms'}
+
+
+class Command(BaseCommand):
+    help = "Affiche, vue par vue, les percentiles du nombre de requêtes et des temps (base, templates, Python)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tri', choices=TRIS, default='total', help="Colonne de tri, par p95 décroissant (défaut : total)")
+        parser.add_argument('--repetees', type=int, default=3, help="Requêtes répétées affichées par vue (0 pour aucune)")
+        parser.add_argument('--json', metavar='FICHIER', help="Écrit aussi le rapport complet dans un fichier JSON")
+        parser.add_argument('--reset', action='store_true', help="Efface les échantillons enregistrés")
+
+    def handle(self, *args, **options):
+        store = get_store()
+        if options['reset']:
+            store.reset()
+            self.stdout.write(self.style.SUCCESS(f"Échantillons effacés ({store.path})"))
+            return
+
+        rapport = store.report()
+        if not settings.QUERY_BUDGET_ENABLED:
+            self.stdout.write(self.style.WARNING("Mesure désactivée : lancez le serveur avec WELTO_QUERY_BUDGET=true"))
+        if not rapport:
+            self.stdout.write(f"Aucun échantillon dans {store.path}")
+            return
+
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as destination:
+                json.dump(rapport, destination, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Rapport écrit dans {options['json']}"))
+
+        cle = TRIS[options['tri']]
+        vues = sorted(rapport.items(), key=lambda item: item[1][cle]['p95'], reverse=True)
+        largeur = max(len('Vue'), *(len(vue) for vue, _ in vues))
+        self.stdout.write(
+            f"{'Vue':<{largeur}}  {'n':>5}  {'requêtes p50/p95/max':>22}  {'base ms p50/p95':>16}  "
+            f"{'tpl ms p50/p95':>16}  {'python ms p50/p95':>18}  {'total ms p50/p95':>17}"
+        )
+        for vue, mesures in vues:
+            requetes = mesures['queries']
+            ligne = (
+                f"{vue:<{largeur}}  {mesures['samples']:>5}  "
+                f"{requetes['p50']:>6} / {requetes['p95']:>5} / {requetes['max']:>5}  "
+                + '  '.join(
+                    f"{mesures[champ]['p50']:>{taille}.1f} / {mesures[champ]['p95']:>{taille}.1f}"
+                    for champ, taille in (('db_ms', 6), ('template_ms', 6), ('python_ms', 7), ('total_ms', 7))
+                )
+            )
+            if requetes['p95'] > settings.QUERY_BUDGET_MAX_QUERIES or mesures['duplicates']:
+                ligne = self.style.WARNING(ligne)
+            self.stdout.write(ligne)
+
+        if options['repetees'] <= 0:
+            return
+        for vue, mesures in vues:
+            if not mesures['duplicates']:
+                continue
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{vue} : requêtes répétées"))
+            for repetee in mesures['duplicates'][:options['repetees']]:
+                self.stdout.write(
+                    f"  {repetee['max_per_request']:>4} x / requête ({repetee['requests']} requête(s)) "
+                    f"{repetee['signature'][:160]}"
+                )
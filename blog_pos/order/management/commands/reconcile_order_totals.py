@@ -0,0 +1,77 @@
+"""
+Vérifie que les totaux incrémentaux des commandes (value / final_value)
+correspondent à la somme complète de leurs lignes.
+
+Usage:
+    python manage.py reconcile_order_totals          # rapport seulement
+    python manage.py reconcile_order_totals --fix    # corrige les écarts
+"""
+
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from order.models import Order, OrderItem
+
+# Les statistiques journalières dépendent des totaux corrigés
+try:
+    from aprovision.rollup import rafraichir_jours
+except ImportError:
+    rafraichir_jours = None
+
+
+class Command(BaseCommand):
+    help = "Contrôle (et corrige avec --fix) la dérive des totaux de commandes par rapport à SUM(total_price)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Réécrire value/final_value pour les commandes en écart")
+        parser.add_argument('--limit', type=int, default=50, help="Nombre maximum d'écarts affichés")
+
+    def handle(self, *args, **options):
+        items_total = (
+            OrderItem.objects.filter(order=OuterRef('pk'))
+            .order_by()
+            .values('order')
+            .annotate(total=Sum('total_price'))
+            .values('total')
+        )
+        orders = Order.objects.annotate(
+            items_total=Coalesce(
+                Subquery(items_total, output_field=DecimalField(max_digits=20, decimal_places=2)),
+                Value(Decimal('0.00')),
+                output_field=DecimalField(max_digits=20, decimal_places=2),
+            )
+        ).values_list('id', 'title', 'date', 'value', 'discount', 'final_value', 'items_total')
+
+        drifts = []
+        checked = 0
+        for order_id, title, date, value, discount, final_value, items_total in orders.iterator(chunk_size=2000):
+            checked += 1
+            expected_final = Decimal(items_total) - Decimal(discount)
+            if Decimal(value) != Decimal(items_total) or Decimal(final_value) != expected_final:
+                drifts.append((order_id, title, date, value, final_value, items_total, expected_final))
+
+        for order_id, title, _, value, final_value, items_total, expected_final in drifts[:options['limit']]:
+            self.stdout.write(
+                f"#{order_id} {title}: value={value} (attendu {items_total}), "
+                f"final_value={final_value} (attendu {expected_final})"
+            )
+        if len(drifts) > options['limit']:
+            self.stdout.write(f"... {len(drifts) - options['limit']} autre(s) écart(s) non affiché(s)")
+
+        if drifts and options['fix']:
+            with transaction.atomic():
+                for order_id, _, _, _, _, items_total, expected_final in drifts:
+                    Order.objects.filter(pk=order_id).update(value=items_total, final_value=expected_final)
+            if rafraichir_jours is not None:
+                rafraichir_jours({date for _, _, date, _, _, _, _ in drifts})
+            self.stdout.write(self.style.SUCCESS(f"{len(drifts)} commande(s) corrigée(s) sur {checked} vérifiée(s)"))
+        elif drifts:
+            self.stdout.write(self.style.WARNING(
+                f"{len(drifts)} écart(s) sur {checked} commande(s). Relancer avec --fix pour corriger."
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Aucun écart sur {checked} commande(s)"))
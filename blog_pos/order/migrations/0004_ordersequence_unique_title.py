@@ -0,0 +1,74 @@
+# Generated by Django 5.2.4 on 2026-10-17 12:27
+
+import datetime
+
+from django.db import migrations, models
+
+
+def _free_title(base, order_id, taken, max_length=150):
+    """Premier titre "<base> - <id>" (puis "-2", "-3"...) absent de taken, qui est complété"""
+    attempt = 1
+    while True:
+        suffix = f" - {order_id}" if attempt == 1 else f" - {order_id}-{attempt}"
+        candidate = base[:max_length - len(suffix)] + suffix
+        if candidate not in taken:
+            taken.add(candidate)
+            return candidate
+        attempt += 1
+
+
+def dedupe_titles_and_seed_sequences(apps, schema_editor):
+    """Rend les titres uniques avant l'index et initialise les compteurs journaliers"""
+    Order = apps.get_model('order', 'Order')
+    OrderSequence = apps.get_model('order', 'OrderSequence')
+
+    # Titres existants réservés : un titre de remplacement ne doit reprendre aucun d'eux
+    taken = set(Order.objects.values_list('title', flat=True).distinct())
+    seen = set()
+    max_sequences = {}
+    for order_id, title in Order.objects.order_by('id').values_list('id', 'title').iterator():
+        new_title = title
+        if not new_title or new_title in seen:
+            new_title = _free_title(title or 'Order', order_id, taken)
+            Order.objects.filter(pk=order_id).update(title=new_title)
+        seen.add(new_title)
+
+        parts = new_title.split('-')
+        if len(parts) == 4 and parts[0] == 'CMD' and parts[3].isdigit():
+            try:
+                day = datetime.datetime.strptime(parts[1], '%Y%m%d').date()
+            except ValueError:
+                continue
+            max_sequences[day] = max(max_sequences.get(day, 0), int(parts[3]))
+
+    OrderSequence.objects.bulk_create([
+        OrderSequence(day=day, last_value=last_value) for day, last_value in max_sequences.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0003_alter_payment_method'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Séquence de commandes',
+                'verbose_name_plural': 'Séquences de commandes',
+            },
+        ),
+        migrations.RunPython(dedupe_titles_and_seed_sequences, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='title',
+            field=models.CharField(blank=True, max_length=150, unique=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-17 12:39
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def fill_amount_paid(apps, schema_editor):
+    """Initialise amount_paid à partir des paiements existants"""
+    from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+    from django.db.models.functions import Coalesce
+
+    Order = apps.get_model('order', 'Order')
+    Payment = apps.get_model('order', 'Payment')
+    paid = Subquery(
+        Payment.objects.filter(order=OuterRef('pk')).order_by().values('order')
+        .annotate(total=Sum('amount')).values('total'),
+        output_field=DecimalField(max_digits=20, decimal_places=2),
+    )
+    Order.objects.update(amount_paid=Coalesce(paid, Value(Decimal('0.00')), output_field=DecimalField(max_digits=20, decimal_places=2)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('client', '0001_initial'),
+        ('order', '0004_ordersequence_unique_title'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='amount_paid',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=20),
+        ),
+        migrations.RunPython(fill_amount_paid, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='order',
+            name='remaining_amount',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.Greatest(django.db.models.expressions.CombinedExpression(models.F('final_value'), '-', models.F('amount_paid')), models.Value(Decimal('0.00'))), output_field=models.DecimalField(decimal_places=2, max_digits=20)),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['is_paid', 'remaining_amount'], name='order_unpaid_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0005_order_amount_paid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='cart_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
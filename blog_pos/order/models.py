@@ -1,5 +1,7 @@
-from django.db import models
-from django.db.models import Sum
+from django.db import models, connection, transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.lookups import GreaterThanOrEqual
 from django.conf import settings
 try:
     from users.models import AppSetting
@@ -9,7 +11,9 @@ from django.urls import reverse
 from django.dispatch import receiver
 from django.db.models.signals import post_delete
 import datetime
+import functools
 from product.models import Product
+from blog_pos.tracking import LoadedValuesMixin
 
 from decimal import Decimal
 def get_currency_label():
@@ -21,27 +25,180 @@ def get_currency_label():
     return settings.CURRENCY
 
 
+def memoized(method):
+    """Mémorise le résultat d'une méthode sans argument sur l'instance.
+
+    Un gabarit qui affiche plusieurs fois order.tag_remaining_amount ne recalcule (et ne
+    relit la devise) qu'une fois par instance, donc par requête HTTP. La méthode reste
+    appelable normalement ; la mémoire est vidée par Order.save() et refresh_from_db(), et
+    quand une ligne ou un paiement écrit sur une commande déjà chargée (apply_cached_delta).
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self):
+        memo = self.__dict__.setdefault('_memo', {})
+        if name not in memo:
+            memo[name] = method(self)
+        return memo[name]
+    return wrapper
+
+
 class OrderManager(models.Manager):
 
     def active(self):
         return self.filter(active=True)
 
 
-class Order(models.Model):
+def payments_total_subquery():
+    """SUM(payments.amount) de la commande courante (OuterRef('pk')), 0 si aucun paiement"""
+    return Coalesce(
+        Subquery(
+            Payment.objects.filter(order=OuterRef('pk')).order_by().values('order')
+            .annotate(total=Sum('amount')).values('total'),
+            output_field=DecimalField(max_digits=20, decimal_places=2),
+        ),
+        Value(Decimal('0.00')),
+        output_field=DecimalField(max_digits=20, decimal_places=2),
+    )
+
+
+def items_total_subquery():
+    """SUM(order_items.total_price) de la commande courante (OuterRef('pk')), 0 si aucune ligne"""
+    return Coalesce(
+        Subquery(
+            OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+            .annotate(total=Sum('total_price')).values('total'),
+            output_field=DecimalField(max_digits=20, decimal_places=2),
+        ),
+        Value(Decimal('0.00')),
+        output_field=DecimalField(max_digits=20, decimal_places=2),
+    )
+
+
+# Champs de Order tenus à jour en SQL (lignes et paiements), jamais réécrits par Order.save()
+DB_MAINTAINED_FIELDS = ('value', 'final_value', 'amount_paid', 'cart_version')
+
+# Débuts des numéros de commande (generate_order_number, auto_create_order_view)
+ORDER_TITLE_PREFIXES = ('CMD-', 'Order - ')
+
+
+class OrderQuerySet(models.QuerySet):
+
+    def with_balance(self):
+        """Annote chaque commande avec paid_total (somme des paiements) et balance (reste dû), sans requête par commande"""
+        paid = payments_total_subquery()
+        return self.annotate(
+            paid_total=paid,
+            balance=Greatest(
+                F('final_value') - paid, Value(Decimal('0.00')),
+                output_field=DecimalField(max_digits=20, decimal_places=2),
+            ),
+        )
+
+    def unpaid(self):
+        """Commandes non soldées (reste à payer strictement positif)"""
+        return self.filter(is_paid=False, remaining_amount__gt=0)
+
+    def total_balance(self):
+        """Somme des restes à payer des commandes non soldées, en une requête"""
+        return self.unpaid().aggregate(total=Sum('remaining_amount'))['total'] or Decimal('0.00')
+
+    def for_display(self):
+        """Commandes à afficher en liste : client chargé par jointure (client_display sans requête).
+
+        Les paiements n'ont pas à être annotés : amount_paid et remaining_amount sont des colonnes.
+        """
+        return self.select_related('client')
+
+    def title_matching(self, search):
+        """Commandes dont le numéro contient search.
+
+        Pour un début de numéro (CMD-AAAAMMJJ..., Order - N) le texte ne peut figurer
+        qu'en tête : la recherche devient l'intervalle [q, q+1[ servi par l'index
+        unique de title, au lieu d'un LIKE '%q%' qui parcourt toute la table.
+        """
+        for prefix in ORDER_TITLE_PREFIXES:
+            head, rest = search[:len(prefix)], search[len(prefix):]
+            if head.lower() == prefix.lower() and all(c.isdigit() or c == '-' for c in rest):
+                lower = prefix + rest
+                upper = lower[:-1] + chr(ord(lower[-1]) + 1)
+                return self.filter(title__gte=lower, title__lt=upper)
+        return self.filter(title__contains=search)
+
+
+class OrderSequence(models.Model):
+    """Compteur journalier des numéros de commande (une ligne par jour)"""
+    day = models.DateField(unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Séquence de commandes'
+        verbose_name_plural = 'Séquences de commandes'
+
+    def __str__(self):
+        return f'{self.day} : {self.last_value}'
+
+    @classmethod
+    def next_value(cls, day):
+        """Incrémente atomiquement le compteur du jour et retourne la nouvelle valeur.
+
+        Un seul INSERT ... ON CONFLICT DO UPDATE ... RETURNING quand la base le permet
+        (SQLite >= 3.35, PostgreSQL), sinon UPDATE + SELECT dans la même transaction.
+        """
+        if isinstance(day, datetime.datetime):
+            day = day.date()
+        if connection.features.can_return_columns_from_insert:
+            table = connection.ops.quote_name(cls._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {table} ("day", "last_value") VALUES (%s, 1) '
+                    f'ON CONFLICT ("day") DO UPDATE SET "last_value" = {table}."last_value" + 1 '
+                    f'RETURNING "last_value"',
+                    [connection.ops.adapt_datefield_value(day)],
+                )
+                return cursor.fetchone()[0]
+
+        with transaction.atomic():
+            sequence, _ = cls.objects.get_or_create(day=day)
+            cls.objects.filter(pk=sequence.pk).update(last_value=F('last_value') + 1)
+            return cls.objects.filter(pk=sequence.pk).values_list('last_value', flat=True).get()
+
+
+class Order(LoadedValuesMixin, models.Model):
+    # Jour et remise chargés : variations des statistiques journalières au save() suivant
+    loaded_fields = ('date', 'discount')
+
     date = models.DateField(default=datetime.date.today)
-    title = models.CharField(blank=True, max_length=150)
+    title = models.CharField(blank=True, max_length=150, unique=True)
     timestamp = models.DateField(auto_now_add=True)
     value = models.DecimalField(default=0.00, decimal_places=2, max_digits=20)
     discount = models.DecimalField(default=0.00, decimal_places=2, max_digits=20)
     final_value = models.DecimalField(default=0.00, decimal_places=2, max_digits=20)
     is_paid = models.BooleanField(default=False)
+    # Paiements cumulés, maintenus par les signaux de Payment (jamais écrits par save())
+    amount_paid = models.DecimalField(default=0.00, decimal_places=2, max_digits=20)
+    # Reste à payer calculé par la base à chaque écriture de final_value ou amount_paid
+    remaining_amount = models.GeneratedField(
+        expression=Greatest(F('final_value') - F('amount_paid'), Value(Decimal('0.00'))),
+        output_field=models.DecimalField(decimal_places=2, max_digits=20),
+        db_persist=True,
+    )
+    # Incrémenté à chaque modification des lignes (voir apply_total_delta) : permet à l'écran
+    # de caisse de vérifier qu'une mise à jour partielle s'applique bien à son état courant
+    cart_version = models.PositiveIntegerField(default=0)
     # Relation optionnelle vers le client (ajout non-intrusif)
     client = models.ForeignKey('client.Client', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders', help_text="Client associé (optionnel)")
-    objects = models.Manager()
+    objects = OrderQuerySet.as_manager()
     browser = OrderManager()
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['is_paid', 'remaining_amount'], name='order_unpaid_idx'),
+            models.Index(fields=['date', 'is_paid'], name='order_date_paid_idx'),
+            models.Index(fields=['client', 'date'], name='order_client_date_idx'),
+        ]
 
     def generate_order_number(self):
         """Génère un numéro de commande automatique basé sur la date et l'heure"""
@@ -55,49 +212,75 @@ class Order(models.Model):
         date_part = self.date.strftime('%Y%m%d')
         time_part = now.strftime('%H%M')
         
-        # Compter les commandes avec des numéros générés aujourd'hui pour éviter les doublons
-        today_orders_count = Order.objects.filter(
-            date=self.date,
-            title__startswith=f"CMD-{date_part}-"
-        ).count()
-        
-        # Générer un numéro unique en incrémentant jusqu'à trouver un disponible
-        sequence = today_orders_count + 1
-        while True:
-            order_number = f"CMD-{date_part}-{time_part}-{sequence:03d}"
-            
-            # Vérifier si ce numéro existe déjà (exclure la commande actuelle si modification)
-            existing = Order.objects.filter(title=order_number)
-            if self.pk:  # Si c'est une modification, exclure la commande actuelle
-                existing = existing.exclude(pk=self.pk)
-            
-            if not existing.exists():
-                return order_number
-            
-            sequence += 1
-            
-            # Sécurité : éviter une boucle infinie
-            if sequence > 999:
-                # Fallback avec timestamp plus précis
-                microsecond_part = now.strftime('%f')[:3]  # 3 premiers chiffres des microsecondes
-                return f"CMD-{date_part}-{time_part}-{microsecond_part}"
+        # Le compteur du jour garantit l'unicité sans sonder la table des commandes
+        sequence = OrderSequence.next_value(self.date)
+        return f"CMD-{date_part}-{time_part}-{sequence:03d}"
     
     def save(self, *args, **kwargs):
-        # Générer automatiquement le numéro de commande si title est vide
+        self.__dict__.pop('_memo', None)
+        # value est maintenu en SQL par les lignes (apply_total_delta), amount_paid par les
+        # signaux de Payment et cart_version par les lignes : une instance chargée avant ne
+        # doit pas réécrire ces valeurs. final_value est dérivé par la base de value et de la
+        # remise écrite, dans le même UPDATE
+        updating = not self._state.adding and self.pk is not None and kwargs.get('update_fields') is None
+        if updating:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and not field.generated
+                and field.name not in DB_MAINTAINED_FIELDS
+            ] + ['final_value']
+            self.final_value = F('value') - Value(Decimal(self.discount), output_field=self._meta.get_field('discount'))
+        else:
+            self.final_value = Decimal(self.value) - Decimal(self.discount)
+
+        # Générer automatiquement le numéro de commande si title est vide,
+        # dans la même transaction que l'écriture de la commande
         if not self.title or self.title.strip() == '':
-            self.title = self.generate_order_number()
-        
-        # Sauvegarder d'abord l'instance pour qu'elle ait une clé primaire
-        super().save(*args, **kwargs)
-        
-        # Maintenant on peut accéder aux relations
-        order_items = self.order_items.all()
-        self.value = order_items.aggregate(Sum('total_price'))['total_price__sum'] if order_items.exists() else 0.00
-        self.final_value = Decimal(self.value) - Decimal(self.discount)
-        
-        # Sauvegarder à nouveau avec les valeurs calculées
-        if order_items.exists():
+            with transaction.atomic():
+                self.title = self.generate_order_number()
+                super().save(*args, **kwargs)
+        else:
             super().save(*args, **kwargs)
+        if updating:
+            # Valeurs de la base (totaux dérivés par l'UPDATE, paiements et lignes à jour)
+            self.refresh_from_db(fields=list(DB_MAINTAINED_FIELDS) + ['remaining_amount'])
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.__dict__.pop('_memo', None)
+        super().refresh_from_db(*args, **kwargs)
+
+    @classmethod
+    def apply_total_delta(cls, order_id, delta):
+        """Applique une variation de montant (delta d'un OrderItem) aux totaux de la commande
+        et incrémente cart_version (même si delta est nul : la quantité a pu changer).
+
+        Un seul UPDATE, sans relire les lignes de la commande.
+        Retourne le nombre de lignes modifiées.
+        """
+        delta = Decimal(delta)
+        # final_value recalculé par la base à partir de la remise enregistrée
+        return cls.objects.filter(pk=order_id).update(
+            value=F('value') + delta,
+            final_value=F('value') + delta - F('discount'),
+            cart_version=F('cart_version') + 1,
+        )
+
+    def apply_cached_delta(self, delta):
+        """Reporte sur cette instance (déjà chargée) ce que apply_total_delta a écrit en base,
+        sans la relire : totaux, reste à payer, version du panier ; vide la mémoire des tag_*"""
+        self.__dict__.pop('_memo', None)
+        self.value = Decimal(self.value) + Decimal(delta)
+        self.final_value = self.value - Decimal(self.discount)
+        self.remaining_amount = max(self.final_value - Decimal(self.amount_paid), Decimal('0.00'))
+        self.cart_version += 1
+
+    def recalculate_totals(self):
+        """Réécrit value/final_value à partir de la somme complète des lignes (réconciliation),
+        en un seul UPDATE, puis relit les totaux de l'instance"""
+        items_total = items_total_subquery()
+        Order.objects.filter(pk=self.pk).update(value=items_total, final_value=items_total - F('discount'))
+        self.refresh_from_db(fields=['value', 'final_value', 'remaining_amount'])
+        return self.value
 
     def __str__(self):
         return self.title if self.title else 'New Order'
@@ -108,48 +291,53 @@ class Order(models.Model):
     def get_delete_url(self):
         return reverse('delete_order', kwargs={'pk': self.id})
 
+    @memoized
     def tag_final_value(self):
         return f'{self.final_value} {get_currency_label()}'
 
+    @memoized
     def tag_discount(self):
         return f'{self.discount} {get_currency_label()}'
 
+    @memoized
     def tag_value(self):
         return f'{self.value} {get_currency_label()}'
     
     def total_payments(self):
-        """Calcule le total des paiements reçus"""
-        return self.payments.aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
-    
-    def remaining_amount(self):
-        """Calcule le montant restant à payer"""
-        return max(Decimal('0.00'), self.final_value - self.total_payments())
+        """Total des paiements reçus (colonne amount_paid)"""
+        return self.amount_paid
     
+    @memoized
     def payment_percentage(self):
         """Calcule le pourcentage payé"""
         if self.final_value <= 0:
             return 100
-        return min(100, (self.total_payments() / self.final_value) * 100)
+        return min(100, (Decimal(self.amount_paid) / Decimal(self.final_value)) * 100)
     
+    @memoized
     def is_fully_paid(self):
         """Vérifie si la commande est entièrement payée"""
         # Une commande sans montant n'est pas considérée comme payée
         if self.final_value <= Decimal('0.00'):
             return False
-        return self.remaining_amount() <= Decimal('0.00')
+        return Decimal(self.amount_paid) >= Decimal(self.final_value)
     
+    @memoized
     def tag_total_payments(self):
-        return f'{self.total_payments()} {get_currency_label()}'
+        return f'{self.amount_paid} {get_currency_label()}'
     
+    @memoized
     def tag_remaining_amount(self):
-        return f'{self.remaining_amount()} {get_currency_label()}'
+        return f'{self.remaining_amount} {get_currency_label()}'
     
+    @memoized
     def client_display(self):
         """Affichage du client pour les templates"""
         if self.client:
             return f"{self.client.name} ({self.client.phone})"
         return self.title if self.title else f"Commande #{self.id}"
     
+    @memoized
     def order_number_display(self):
         """Affichage formaté du numéro de commande"""
         if self.title and self.title.startswith('CMD-'):
@@ -175,16 +363,20 @@ class Order(models.Model):
 
     @staticmethod
     def filter_data(request, queryset):
-        search_name = request.GET.get('search_name', None)
-        date_start = request.GET.get('date_start', None)
-        date_end = request.GET.get('date_end', None)
-        is_paid = request.GET.get('is_paid', None)
-        queryset = queryset.filter(title__contains=search_name) if search_name else queryset
-        if date_end and date_start and date_end >= date_start:
-            date_start = datetime.datetime.strptime(date_start, '%m/%d/%Y').strftime('%Y-%m-%d')
-            date_end = datetime.datetime.strptime(date_end, '%m/%d/%Y').strftime('%Y-%m-%d')
-            print(date_start, date_end)
-            queryset = queryset.filter(date__range=[date_start, date_end])
+        return Order.filter_params(request.GET, queryset)
+
+    @staticmethod
+    def filter_params(params, queryset):
+        """Filtres de la liste des commandes (search_name, date_start, date_end, is_paid) à partir d'un dict de paramètres"""
+        search_name = params.get('search_name', None)
+        date_start = params.get('date_start', None)
+        date_end = params.get('date_end', None)
+        is_paid = params.get('is_paid', None)
+        queryset = queryset.title_matching(search_name) if search_name else queryset
+        if date_end and date_start:
+            date_start, date_end = Order._parse_filter_date(date_start), Order._parse_filter_date(date_end)
+            if date_start and date_end and date_end >= date_start:
+                queryset = queryset.filter(date__range=[date_start, date_end])
         
         # Filtrer par statut de paiement
         if is_paid == "True":
@@ -195,6 +387,16 @@ class Order(models.Model):
         
         return queryset
 
+    @staticmethod
+    def _parse_filter_date(value):
+        """Date des filtres : AAAA-MM-JJ (champ date HTML) ou MM/JJ/AAAA (ancien sélecteur)"""
+        for fmt in ('%Y-%m-%d', '%m/%d/%Y'):
+            try:
+                return datetime.datetime.strptime(value, fmt).date()
+            except ValueError:
+                continue
+        return None
+
 
 class OrderItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
@@ -208,11 +410,40 @@ class OrderItem(models.Model):
     def __str__(self):
         return f'{self.product.title}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Mémoriser le total et la quantité chargés pour calculer les deltas au prochain save()
+        if 'total_price' in field_names:
+            instance._loaded_total_price = instance.total_price
+        if 'qty' in field_names:
+            instance._loaded_qty = instance.qty
+        return instance
+
     def save(self,  *args, **kwargs):
         self.final_price = self.discount_price if self.discount_price > 0 else self.price
         self.total_price = Decimal(self.qty) * Decimal(self.final_price)
+
+        # Ancien total et ancienne quantité de la ligne : 0 pour une création, sinon valeurs
+        # chargées depuis la base (relues seulement pour une instance construite à la main)
+        if self._state.adding:
+            self._loaded_total_price, self._loaded_qty = Decimal('0.00'), 0
+        elif getattr(self, '_loaded_total_price', None) is None or getattr(self, '_loaded_qty', None) is None:
+            self._loaded_total_price, self._loaded_qty = (
+                OrderItem.objects.filter(pk=self.pk).values_list('total_price', 'qty').first() or (Decimal('0.00'), 0)
+            )
+        old_total = self._loaded_total_price
+
+        # post_save (statistiques journalières) lit encore les valeurs d'avant dans _loaded_*
         super().save(*args, **kwargs)
-        self.order.save()
+        self._loaded_total_price, self._loaded_qty = self.total_price, self.qty
+
+        delta = Decimal(self.total_price) - Decimal(old_total)
+        if Order.apply_total_delta(self.order_id, delta):
+            # Garder l'instance de commande en cache cohérente sans la relire
+            order = self._state.fields_cache.get('order')
+            if order is not None:
+                order.apply_cached_delta(delta)
 
     def tag_final_price(self):
         return f'{self.final_price} {get_currency_label()}'
@@ -224,8 +455,10 @@ class OrderItem(models.Model):
         return f'{self.price} {get_currency_label()}'
 
 
-class Payment(models.Model):
+class Payment(LoadedValuesMixin, models.Model):
     """Modèle pour gérer les paiements échelonnés d'une commande"""
+    loaded_fields = ('date', 'amount')
+
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='payments')
     amount = models.DecimalField(max_digits=20, decimal_places=2, help_text="Montant du paiement")
     date = models.DateField(default=datetime.date.today, help_text="Date du paiement")
@@ -243,6 +476,10 @@ class Payment(models.Model):
 
     class Meta:
         ordering = ['-date', '-created_at']
+        indexes = [
+            # Somme des paiements par commande lue dans l'index seul (payments_total_subquery)
+            models.Index(fields=['order', 'amount'], name='payment_order_amount_idx'),
+        ]
 
     def __str__(self):
         return f'{self.amount} {get_currency_label()} - {self.get_method_display()}'
@@ -254,23 +491,55 @@ class Payment(models.Model):
 # Important: la restauration de stock lors de la suppression d'un OrderItem
 # est gérée dans 'aprovision.signals.annuler_mouvement_vente' pour éviter les doublons
 
+@receiver(post_delete, sender=OrderItem)
+def update_order_total_on_item_delete(sender, instance, origin=None, **kwargs):
+    """Retire le montant de la ligne supprimée des totaux de la commande"""
+    # Inutile si c'est la commande elle-même qui est supprimée (cascade)
+    if isinstance(origin, Order) or (isinstance(origin, models.QuerySet) and origin.model is Order):
+        return
+    delta = -Decimal(instance.total_price)
+    if Order.apply_total_delta(instance.order_id, delta):
+        order = instance._state.fields_cache.get('order')
+        if order is not None:
+            order.apply_cached_delta(delta)
+
 
-# Signal pour mettre à jour automatiquement is_paid quand un paiement est ajouté/supprimé
+# Signaux pour maintenir amount_paid (et donc remaining_amount) et is_paid quand un paiement est ajouté/modifié/supprimé
 from django.db.models.signals import post_save, post_delete
 
+def _refresh_cached_order(payment):
+    """Relit les colonnes de paiement de la commande du paiement si elle est déjà chargée
+    (les tag_* mémorisés de cette instance sont vidés par refresh_from_db)"""
+    order = payment._state.fields_cache.get('order')
+    if order is not None:
+        order.refresh_from_db(fields=['amount_paid', 'is_paid', 'remaining_amount'])
+
+
+def refresh_payment_totals(order_id):
+    """Recalcule amount_paid et is_paid d'une commande en un seul UPDATE (somme des paiements en sous-requête)"""
+    paid = payments_total_subquery()
+    # Une commande sans montant n'est pas considérée comme payée (voir is_fully_paid)
+    return Order.objects.filter(pk=order_id).update(
+        amount_paid=paid,
+        is_paid=Case(
+            When(Q(final_value__gt=0) & GreaterThanOrEqual(paid, F('final_value')), then=Value(True)),
+            default=Value(False),
+            output_field=models.BooleanField(),
+        ),
+    )
+
 @receiver(post_save, sender=Payment)
 def update_order_payment_status_on_save(sender, instance, **kwargs):
-    """Met à jour le statut is_paid de la commande quand un paiement est ajouté/modifié"""
-    order = instance.order
-    order.is_paid = order.is_fully_paid()
+    """Met à jour amount_paid et is_paid de la commande quand un paiement est ajouté/modifié"""
     # Utiliser update pour éviter de déclencher le signal save de Order
-    Order.objects.filter(id=order.id).update(is_paid=order.is_paid)
+    refresh_payment_totals(instance.order_id)
+    _refresh_cached_order(instance)
 
 @receiver(post_delete, sender=Payment)
-def update_order_payment_status_on_delete(sender, instance, **kwargs):
-    """Met à jour le statut is_paid de la commande quand un paiement est supprimé"""
-    order = instance.order
-    order.is_paid = order.is_fully_paid()
-    # Utiliser update pour éviter de déclencher le signal save de Order
-    Order.objects.filter(id=order.id).update(is_paid=order.is_paid)
-
+def update_order_payment_status_on_delete(sender, instance, origin=None, **kwargs):
+    """Met à jour amount_paid et is_paid de la commande quand un paiement est supprimé"""
+    # Inutile si c'est la commande elle-même qui est supprimée (cascade)
+    if isinstance(origin, Order) or (isinstance(origin, models.QuerySet) and origin.model is Order):
+        return
+    refresh_payment_totals(instance.order_id)
+    _refresh_cached_order(instance)
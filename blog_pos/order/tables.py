@@ -44,11 +44,11 @@ class ProductTable(tables.Table):
     qty = tables.TemplateColumn(
         '''
         {% if record.qty > 5 %}
-            <span class="badge bg-success">{{ record.qty }}</span>
+            <span class="badge bg-success stock-badge">{{ record.qty }}</span>
         {% elif record.qty > 0 %}
-            <span class="badge bg-warning">{{ record.qty }}</span>
+            <span class="badge bg-warning stock-badge">{{ record.qty }}</span>
         {% else %}
-            <span class="badge bg-danger">0</span>
+            <span class="badge bg-danger stock-badge">0</span>
         {% endif %}
         ''',
         orderable=False,
@@ -83,9 +83,12 @@ class ProductTable(tables.Table):
         model = Product
         template_name = 'django_tables2/bootstrap.html'
         fields = ['title', 'category', 'qty', 'tag_final_value']
+        # Repère pour les mises à jour partielles du stock (voir include/ajax_calls.html)
+        row_attrs = {'data-product-id': lambda record: record.pk}
 
 
 class OrderItemTable(tables.Table):
+    qty = tables.Column(attrs={'td': {'class': 'cart-qty'}})
     tag_final_price = tables.Column(orderable=False, verbose_name='Price')
     action = tables.TemplateColumn('''
             <button data-href="{% url "ajax_modify" record.id "add" %}" class="btn btn-success edit_button"><i class="fa fa-arrow-up"></i></button>
@@ -96,4 +99,6 @@ class OrderItemTable(tables.Table):
     class Meta:
         model = OrderItem
         template_name = 'django_tables2/bootstrap.html'
-        fields = ['product', 'qty', 'tag_final_price']
\ No newline at end of file
+        fields = ['product', 'qty', 'tag_final_price']
+        # Repère pour les mises à jour partielles des lignes (voir include/ajax_calls.html)
+        row_attrs = {'data-item-id': lambda record: record.pk}
\ No newline at end of file
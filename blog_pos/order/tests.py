@@ -1,3 +1,489 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from blog_pos import querybudget
+from blog_pos.pagination import KeysetPaginator
+from blog_pos.testing import PosTestCase
+from users.models import AppSetting
+from client.models import Client
+from order import invoices
+from order.invoices import PDF_AVAILABLE, get_invoice_path, invoice_context
+from order.models import Order, OrderItem, OrderSequence, Payment
+from product.models import Product
+
+
+class OrderTotalsTests(PosTestCase):
+    """Totaux maintenus en SQL par les lignes et les paiements (jamais par une instance périmée)"""
+
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(discount=Decimal('100.00'))
+        self.product = self.make_product('Lait', qty=20, value='700.00')
+
+    def add_line(self, qty):
+        return OrderItem.objects.create(order_id=self.order.pk, product=self.product, qty=qty, price=self.product.value)
+
+    def test_item_deltas_update_totals_and_version(self):
+        item = self.add_line(2)
+        item.qty = 3
+        item.save()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.value, Decimal('2100.00'))
+        self.assertEqual(self.order.final_value, Decimal('2000.00'))
+        self.assertEqual(self.order.cart_version, 2)
+        item.delete()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.value, Decimal('0.00'))
+
+    def test_stale_instance_save_keeps_sql_totals(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        self.add_line(2)
+        Payment.objects.create(order_id=self.order.pk, amount=Decimal('500.00'))
+        stale.discount = Decimal('200.00')
+        stale.save()
+        self.assertEqual(stale.value, Decimal('1400.00'))
+        self.assertEqual(stale.final_value, Decimal('1200.00'))
+        self.assertEqual(stale.amount_paid, Decimal('500.00'))
+        self.assertEqual(stale.remaining_amount, Decimal('700.00'))
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.value, self.order.final_value), (Decimal('1400.00'), Decimal('1200.00')))
+        self.assertEqual(self.order.cart_version, 1)
+
+    def test_line_and_payment_writes_refresh_a_loaded_order(self):
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(order.tag_final_value(), '-100.00 GMD')
+        item = OrderItem.objects.create(order=order, product=self.product, qty=2, price=self.product.value)
+        self.assertEqual(order.final_value, Decimal('1300.00'))
+        self.assertEqual(order.remaining_amount, Decimal('1300.00'))
+        self.assertEqual(order.tag_final_value(), '1300.00 GMD')
+        self.assertEqual(order.tag_remaining_amount(), '1300.00 GMD')
+
+        Payment.objects.create(order=order, amount=Decimal('500.00'))
+        self.assertEqual(order.tag_remaining_amount(), '800.00 GMD')
+        item.delete()
+        self.assertEqual(order.tag_final_value(), '-100.00 GMD')
+        self.assertEqual(order.remaining_amount, Decimal('0.00'))
+        fresh = Order.objects.get(pk=order.pk)
+        self.assertEqual(
+            (order.value, order.final_value, order.amount_paid, order.remaining_amount, order.cart_version),
+            (fresh.value, fresh.final_value, fresh.amount_paid, fresh.remaining_amount, fresh.cart_version),
+        )
+
+    def test_recalculate_totals_rewrites_drift(self):
+        self.add_line(1)
+        Order.objects.filter(pk=self.order.pk).update(value=Decimal('9.00'), final_value=Decimal('9.00'))
+        self.assertEqual(self.order.recalculate_totals(), Decimal('700.00'))
+        self.assertEqual(self.order.final_value, Decimal('600.00'))
+
+
+class OrderSequenceTests(PosTestCase):
+    """Numéros de commande tirés du compteur du jour de la commande"""
+
+    def test_counter_is_per_day(self):
+        jour, lendemain = datetime.date(2026, 3, 10), datetime.date(2026, 3, 11)
+        self.assertEqual([OrderSequence.next_value(jour) for _ in range(3)], [1, 2, 3])
+        self.assertEqual(OrderSequence.next_value(lendemain), 1)
+        self.assertEqual(OrderSequence.next_value(datetime.datetime(2026, 3, 10, 18, 30)), 4)
+
+    def test_titles_follow_the_order_date(self):
+        jour = datetime.date(2026, 3, 10)
+        titres = [Order.objects.create(date=jour).title for _ in range(2)]
+        self.assertEqual([titre.split('-')[1] for titre in titres], ['20260310', '20260310'])
+        self.assertEqual([titre.split('-')[3] for titre in titres], ['001', '002'])
+        self.assertTrue(Order.objects.create(date=jour + datetime.timedelta(days=1)).title.endswith('-001'))
+
+
+class KeysetPaginationTests(PosTestCase):
+    """Pages lues après / avant la clé de tri de la dernière ligne affichée"""
+
+    def setUp(self):
+        super().setUp()
+        jour = datetime.date(2026, 3, 10)
+        # Plusieurs commandes par jour : l'id départage les égalités de date
+        self.orders = [Order.objects.create(date=jour + datetime.timedelta(days=n // 3)) for n in range(8)]
+        self.attendu = [o.pk for o in sorted(self.orders, key=lambda o: (o.date, o.pk), reverse=True)]
+
+    def paginator(self):
+        return KeysetPaginator(Order.objects.all(), ('-date', '-pk'), per_page=3, count_limit=5)
+
+    def test_next_pages_cover_all_rows_once(self):
+        paginator, cursor, vus = self.paginator(), None, []
+        while True:
+            page = paginator.page(cursor)
+            vus += [o.pk for o in page]
+            if not page.has_next():
+                break
+            cursor = page.next_url.split('cursor=')[1]
+        self.assertEqual(vus, self.attendu)
+
+    def test_previous_and_last_pages(self):
+        paginator = self.paginator()
+        premiere = paginator.page()
+        deuxieme = paginator.page(premiere.next_url.split('cursor=')[1])
+        self.assertTrue(deuxieme.has_previous())
+        retour = paginator.page(deuxieme.previous_url.split('cursor=')[1])
+        self.assertEqual([o.pk for o in retour], self.attendu[:3])
+        self.assertFalse(retour.has_previous())
+        self.assertEqual([o.pk for o in paginator.page('last')], self.attendu[-3:])
+
+    def test_invalid_or_foreign_cursor_gives_first_page(self):
+        paginator = self.paginator()
+        curseur_autre_tri = KeysetPaginator(Order.objects.all(), ('title',), 3).encode(self.orders[0])
+        for cursor in ('n.nimportequoi', 'n.' + curseur_autre_tri):
+            self.assertEqual([o.pk for o in paginator.page(cursor)], self.attendu[:3])
+        self.assertEqual(paginator.count, 5)
+        self.assertTrue(paginator.count_is_capped)
+
+    def test_list_view_keeps_filters_in_links(self):
+        response = self.client.get(reverse('order_list'), {'sort': 'date'})
+        self.assertEqual(response.status_code, 200)
+        page = response.context['page_obj']
+        self.assertIn('sort=date', page.next_url)
+        response = self.client.get(reverse('order_list') + page.next_url)
+        self.assertEqual(response.status_code, 200)
+
+
+class AjaxAddProductTests(PosTestCase):
+    """Ajout au panier depuis l'écran de caisse, en mode delta et en mode complet"""
+
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create()
+        self.product = self.make_product('Riz parfumé 5kg', qty=3, value='2500.00')
+
+    def add(self, qty=1, delta=True, version=None):
+        url = reverse('ajax_add', args=[self.order.pk, self.product.pk])
+        params = {'qty': qty}
+        if delta:
+            params.update(mode='delta', version=self.order.cart_version if version is None else version)
+        return self.client.get(url, params)
+
+    def test_add_full_mode_renders_cart_and_products(self):
+        response = self.add(delta=False)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIn('result', data)
+        self.assertIn('Riz parfumé 5kg', data['products'])
+        self.assertEqual(data['version'], 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.qty, 2)
+
+    def test_add_delta_mode_returns_line_and_totals(self):
+        response = self.add()
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['mode'], 'delta')
+        self.assertEqual(data['line']['qty'], 1)
+        self.assertEqual(data['totals']['final_value'], '2500.00')
+        self.assertEqual(data['stock'], {'product_id': self.product.pk, 'qty': 2})
+        self.assertNotIn('products', data)
+
+    def test_add_delta_last_unit_renders_products(self):
+        response = self.add(qty=3)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['stock']['qty'], 0)
+        self.assertIn('products', data)
+
+    def test_add_beyond_stock_is_refused_without_writing(self):
+        response = self.add(qty=4)
+        self.assertFalse(response.json()['success'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.qty, 3)
+        self.assertFalse(OrderItem.objects.filter(order=self.order).exists())
+
+    def test_stale_version_gets_full_cart(self):
+        self.add()
+        data = self.add(version=0).json()
+        self.assertEqual(data['version'], 2)
+        self.assertIn('result', data)
+
+    def test_delta_delete_at_zero_stock_renders_products(self):
+        self.add(qty=3)
+        item = OrderItem.objects.get(order=self.order)
+        url = reverse('ajax_modify', args=[item.pk, 'delete'])
+        response = self.client.get(url, {'mode': 'delta', 'version': 1})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['deleted'], item.pk)
+        self.assertEqual(data['stock']['qty'], 3)
+        self.assertIn('products', data)
+
+
+class OrderDuplicateTests(PosTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.riz = self.make_product('Riz', qty=5, value='1000.00')
+        self.huile = self.make_product('Huile', qty=3, value='1500.00')
+        self.order = Order.objects.create()
+        OrderItem.objects.create(order=self.order, product=self.riz, qty=2, price=Decimal('900.00'))
+        OrderItem.objects.create(order=self.order, product=self.huile, qty=1, price=self.huile.value)
+        Product.objects.filter(pk=self.riz.pk).update(qty=3)
+        Product.objects.filter(pk=self.huile.pk).update(qty=2)
+
+    def duplicate(self):
+        return self.client.post(reverse('order_action', args=[self.order.pk, 'duplicate']))
+
+    def test_duplicate_copies_lines_prices_and_stock(self):
+        response = self.duplicate()
+        copie = Order.objects.exclude(pk=self.order.pk).get()
+        self.assertRedirects(response, reverse('update_order', args=[copie.pk]), fetch_redirect_response=False)
+        self.assertNotEqual(copie.title, self.order.title)
+        lignes = sorted(copie.order_items.values_list('product__title', 'qty', 'price'))
+        self.assertEqual(lignes, [('Huile', 1, Decimal('1500.00')), ('Riz', 2, Decimal('900.00'))])
+        self.assertEqual(copie.final_value, Decimal('3300.00'))
+        self.assertEqual(Product.objects.get(pk=self.riz.pk).qty, 1)
+        self.assertEqual(Product.objects.get(pk=self.huile.pk).qty, 1)
+
+    def test_duplicate_without_stock_leaves_nothing_behind(self):
+        Product.objects.filter(pk=self.huile.pk).update(qty=0)
+        sequence = OrderSequence.objects.values_list('last_value', flat=True).get()
+        response = self.duplicate()
+        self.assertRedirects(response, reverse('update_order', args=[self.order.pk]), fetch_redirect_response=False)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(pk=self.riz.pk).qty, 3)
+        self.assertEqual(OrderSequence.objects.values_list('last_value', flat=True).get(), sequence)
+
+
+class AjaxCartOperationsTests(PosTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create()
+        self.riz = self.make_product('Riz', qty=5, value='1000.00')
+        self.huile = self.make_product('Huile', qty=1, value='1500.00')
+
+    def post(self, operations):
+        return self.client.post(
+            reverse('ajax_cart_operations', args=[self.order.pk]),
+            json.dumps({'operations': operations}), content_type='application/json',
+        )
+
+    def test_batch_applies_all_lines(self):
+        response = self.post([{'product_id': self.riz.pk, 'delta': 2}, {'product_id': self.huile.pk, 'delta': 1}])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertIn('products', data)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.final_value, 3500)
+        self.assertEqual(Product.objects.get(pk=self.riz.pk).qty, 3)
+        self.assertEqual(Product.objects.get(pk=self.huile.pk).qty, 0)
+
+    def test_batch_is_all_or_nothing(self):
+        response = self.post([{'product_id': self.riz.pk, 'delta': 2}, {'product_id': self.huile.pk, 'delta': 2}])
+        data = response.json()
+        self.assertFalse(data['success'])
+        self.assertIn('Disponible: 1', data['error'])
+        self.assertEqual(Product.objects.get(pk=self.riz.pk).qty, 5)
+        self.assertFalse(OrderItem.objects.filter(order=self.order).exists())
+
+
+class AjaxSearchProductsTests(PosTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create()
+        self.make_product('Sucre en poudre', qty=4, value='800.00')
+
+    async def test_search_is_served_by_async_view(self):
+        response = await self.async_client.get(reverse('ajax-search', args=[self.order.pk]), {'q': 'sucre'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Sucre en poudre', response.json()['products'])
+
+    async def test_unknown_order_is_404(self):
+        response = await self.async_client.get(reverse('ajax-search', args=[999999]), {'q': 'sucre'})
+        self.assertEqual(response.status_code, 404)
+
+
+class OrderExportTests(PosTestCase):
+
+    def setUp(self):
+        super().setUp()
+        client = Client.objects.create(name='=HYPERLINK("http://x")', phone='+221770000001')
+        Order.objects.create(title='CMD-TEST-001', client=client)
+
+    def test_csv_neutralizes_formulas(self):
+        response = self.client.get(reverse('order_export'), {'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content.startswith('\ufeff'))
+        self.assertIn('CMD-TEST-001;', content)
+        self.assertIn('"\'=HYPERLINK(""http://x"")"', content)
+        self.assertIn("'+221770000001", content)
+
+    def test_xlsx_neutralizes_formulas(self):
+        response = self.client.get(reverse('order_export'), {'format': 'xlsx'})
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertIn("'=HYPERLINK", sheet)
+
+    async def test_asgi_export_is_streamed_by_async_iterator(self):
+        response = await self.async_client.get(reverse('order_export'), {'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode('utf-8')
+        self.assertIn('CMD-TEST-001', content)
+
+
+@unittest.skipUnless(PDF_AVAILABLE, "xhtml2pdf n'est pas installé")
+class InvoiceExportTests(PosTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+        product = self.make_product('Savon', qty=10, value='500.00')
+        for _ in range(2):
+            order = Order.objects.create()
+            OrderItem.objects.create(order=order, product=product, qty=1, price=product.value)
+
+    def test_web_export_renders_in_process(self):
+        with mock.patch('order.invoice_export.ProcessPoolExecutor', side_effect=AssertionError('pool')):
+            response = self.client.get(reverse('invoice_export'), {'format': 'zip'})
+            content = b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        names = zipfile.ZipFile(io.BytesIO(content)).namelist()
+        self.assertEqual(len(names), 2)
+        self.assertTrue(all(name.endswith('.pdf') for name in names))
+
+
+@unittest.skipUnless(PDF_AVAILABLE, "xhtml2pdf n'est pas installé")
+class InvoiceCacheTests(PosTestCase):
+    """PDF en cache par empreinte du contenu imprimé : servi tel quel, rendu à nouveau à chaque changement"""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = self.settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+        AppSetting.objects.create(id=1, company_name='Boutique Awa')
+        product = self.make_product('Savon', qty=10, value='500.00')
+        self.order = Order.objects.create(date=datetime.date(2026, 3, 10))
+        self.item = OrderItem.objects.create(order=self.order, product=product, qty=2, price=product.value)
+
+    def path(self):
+        return get_invoice_path(Order.objects.for_display().get(pk=self.order.pk))
+
+    def assertNewFile(self, previous):
+        path = self.path()
+        self.assertNotEqual(path, previous)
+        self.assertEqual(list(path.parent.glob('*.pdf')), [path])
+        return path
+
+    def test_hit_serves_the_same_file_without_rendering(self):
+        path = self.path()
+        mtime = path.stat().st_mtime_ns
+        with mock.patch.object(invoices, 'render_invoice_pdf', side_effect=AssertionError('rendu')):
+            self.assertEqual(self.path(), path)
+        self.assertEqual(path.stat().st_mtime_ns, mtime)
+
+    def test_payment_line_and_setting_changes_replace_the_file(self):
+        path = self.path()
+        payment = Payment.objects.create(order_id=self.order.pk, amount=Decimal('300.00'), date=datetime.date(2026, 3, 12))
+        path = self.assertNewFile(path)
+
+        item = OrderItem.objects.get(pk=self.item.pk)
+        item.qty = 3
+        item.save()
+        path = self.assertNewFile(path)
+
+        setting = AppSetting.get_solo(use_cache=False)
+        setting.company_name = 'Boutique Awa & Fils'
+        setting.save()
+        path = self.assertNewFile(path)
+
+        payment.delete()
+        self.assertNewFile(path)
+
+    def test_printed_date_follows_the_last_payment(self):
+        order = Order.objects.for_display().get(pk=self.order.pk)
+        self.assertEqual(invoice_context(order)['issued_on'], datetime.date(2026, 3, 10))
+        Payment.objects.create(order=order, amount=Decimal('100.00'), date=datetime.date(2026, 3, 15))
+        self.assertEqual(invoice_context(order)['issued_on'], datetime.date(2026, 3, 15))
+
+
+@unittest.skipUnless(PDF_AVAILABLE, "xhtml2pdf n'est pas installé")
+class BenchmarkCommandTests(PosTestCase):
+
+    def test_benchmark_leaves_the_invoice_cache_alone(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        product = self.make_product('Savon', qty=20, value='500.00')
+        order = Order.objects.create()
+        OrderItem.objects.create(order=order, product=product, qty=1, price=product.value)
+        cached = os.path.join(media, 'invoices', str(order.pk), 'facture.pdf')
+        os.makedirs(os.path.dirname(cached))
+        open(cached, 'wb').close()
+
+        with self.settings(MEDIA_ROOT=media):
+            call_command(
+                'benchmark_endpoints', endpoint=['invoice_pdf_view'], repetitions=2, echauffement=0,
+                stdout=io.StringIO(),
+            )
+        self.assertTrue(os.path.exists(cached))
+        self.assertEqual(os.listdir(os.path.join(media, 'invoices')), [str(order.pk)])
+
+
+class QueryBudgetTests(PosTestCase):
+    """Échantillons du budget de requêtes par nom d'URL et requêtes répétées"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.store = querybudget.BudgetStore(os.path.join(directory, 'budget.sqlite3'))
+        self.addCleanup(lambda: self.store._connection and self.store._connection.close())
+        patcher = mock.patch.object(querybudget, 'get_store', return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        override = self.settings(QUERY_BUDGET_ENABLED=True)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.products = [self.make_product(f'Produit {n}') for n in range(3)]
+
+    def test_request_is_recorded_under_its_url_name(self):
+        response = self.client.get(reverse('order_list'))
+        self.assertIn('Server-Timing', response)
+        rapport = self.store.report()
+        self.assertEqual(rapport['order_list']['samples'], 1)
+        self.assertGreater(rapport['order_list']['queries']['max'], 0)
+
+    def test_repeated_sql_is_reported_as_duplicate(self):
+        def vue_n_plus_un(request):
+            for product in self.products:
+                Product.objects.get(pk=product.pk)
+            Product.objects.get(pk=self.products[0].pk)
+            return HttpResponse('ok')
+
+        request = RequestFactory().get(reverse('order_list'))
+        request.resolver_match = resolve(reverse('order_list'))
+        querybudget.QueryBudgetMiddleware(vue_n_plus_un)(request)
+
+        [repetee] = self.store.report()['order_list']['duplicates']
+        self.assertIn('FROM "product_product"', repetee['signature'])
+        self.assertEqual(repetee['max_per_request'], 4)
+
+        sortie = io.StringIO()
+        call_command('query_budget', stdout=sortie)
+        self.assertIn('order_list : requêtes répétées', sortie.getvalue())
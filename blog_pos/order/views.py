@@ -2,18 +2,26 @@ from django.views.generic import ListView, CreateView, UpdateView
 from django.utils.decorators import method_decorator
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import get_object_or_404, redirect, reverse, render
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, reverse, render
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.template.loader import render_to_string
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models import Sum, Count, Avg, Q
 from django_tables2 import RequestConfig
 from .models import Order, OrderItem, Payment, get_currency_label
+from .invoices import get_invoice_path, invoice_issued_on, prerender_invoice
+from .invoice_export import EXPORT_FORMATS, MAX_MERGED_ORDERS, stream_export
 from decimal import Decimal
 from .forms import OrderCreateForm, OrderEditForm
 from product.models import Product, Category, get_low_stock_threshold
+from product.catalog import apos_products, pos_products
 from .tables import ProductTable, OrderItemTable, OrderTable
+from blog_pos.exports import StreamingExportMixin, streaming_response
+from blog_pos.pagination import KeysetPaginationMixin
 from django.template.loader import get_template
 
 import importlib.util
@@ -28,20 +36,19 @@ from io import BytesIO
 
 # Vérifie si xhtml2pdf est dispo dans l'environnement
 PDF_AVAILABLE = importlib.util.find_spec("xhtml2pdf") is not None
-if PDF_AVAILABLE:
-    from xhtml2pdf import pisa
 
 
 # Import pour les statistiques de dépenses
 try:
     from aprovision.models import Depense, MouvementStock, TypeMouvement
+    from aprovision.rollup import charger_lignes, resumer_periode, detailler_depenses_par_type
     APROVISION_AVAILABLE = True
 except ImportError:
     APROVISION_AVAILABLE = False
 
 # Import pour la vérification des utilisateurs
 try:
-    from users.models import User
+    from users.models import is_setup_complete
     USERS_AVAILABLE = True
 except ImportError:
     USERS_AVAILABLE = False
@@ -59,11 +66,11 @@ def _currency():
 class HomepageView(ListView):
     template_name = 'main_dashboard.html'
     model = Order
-    queryset = Order.objects.all()[:10]
+    queryset = Order.objects.for_display()[:10]
 
     def dispatch(self, request, *args, **kwargs):
         # Vérifier si la configuration initiale est nécessaire
-        if USERS_AVAILABLE and not User.objects.exists():
+        if USERS_AVAILABLE and not is_setup_complete():
             return redirect('users:setup')
         
         # Vérifier l'authentification
@@ -83,33 +90,48 @@ class HomepageView(ListView):
         
         # Toutes les commandes - filtrage sur DateField
         all_orders = Order.objects.all()
-        today_orders = all_orders.filter(date=today)
-        yesterday_orders = all_orders.filter(date=yesterday)
-        week_orders = all_orders.filter(date__gte=seven_days_ago, date__lte=today)
-        month_orders = all_orders.filter(date__gte=this_month_start, date__lte=today)
         
         # === STATISTIQUES SIMPLES ET PARLANTES ===
         
-        # Ventes d'aujourd'hui
-        today_sales = today_orders.aggregate(Sum('final_value'))['final_value__sum'] or 0
-        today_orders_count = today_orders.count()
-        
-        # Ventes d'hier (pour comparaison)
-        yesterday_sales = yesterday_orders.aggregate(Sum('final_value'))['final_value__sum'] or 0
+        if APROVISION_AVAILABLE:
+            # Agrégats journaliers pré-calculés : une seule lecture pour toutes les périodes
+            daily_stats = charger_lignes(min(seven_days_ago, this_month_start), today)
+            today_stats = resumer_periode(daily_stats, today, today)
+            week_stats = resumer_periode(daily_stats, seven_days_ago, today)
+            month_stats = resumer_periode(daily_stats, this_month_start, today)
+            
+            today_sales = today_stats['ventes']
+            today_orders_count = today_stats['nb_commandes']
+            yesterday_sales = resumer_periode(daily_stats, yesterday, yesterday)['ventes']
+            week_sales = week_stats['ventes']
+            week_orders_count = week_stats['nb_commandes']
+            month_sales = month_stats['ventes']
+            month_orders_count = month_stats['nb_commandes']
+        else:
+            today_orders = all_orders.filter(date=today)
+            week_orders = all_orders.filter(date__gte=seven_days_ago, date__lte=today)
+            month_orders = all_orders.filter(date__gte=this_month_start, date__lte=today)
+            
+            # Ventes d'aujourd'hui
+            today_sales = today_orders.aggregate(Sum('final_value'))['final_value__sum'] or 0
+            today_orders_count = today_orders.count()
+            
+            # Ventes d'hier (pour comparaison)
+            yesterday_sales = all_orders.filter(date=yesterday).aggregate(Sum('final_value'))['final_value__sum'] or 0
+            
+            # Ventes de la semaine
+            week_sales = week_orders.aggregate(Sum('final_value'))['final_value__sum'] or 0
+            week_orders_count = week_orders.count()
+            
+            # Ventes du mois
+            month_sales = month_orders.aggregate(Sum('final_value'))['final_value__sum'] or 0
+            month_orders_count = month_orders.count()
         
         # Évolution par rapport à hier
         if yesterday_sales > 0:
             sales_evolution = ((today_sales - yesterday_sales) / yesterday_sales) * 100
         else:
             sales_evolution = 100 if today_sales > 0 else 0
-            
-        # Ventes de la semaine
-        week_sales = week_orders.aggregate(Sum('final_value'))['final_value__sum'] or 0
-        week_orders_count = week_orders.count()
-        
-        # Ventes du mois
-        month_sales = month_orders.aggregate(Sum('final_value'))['final_value__sum'] or 0
-        month_orders_count = month_orders.count()
         
         # Panier moyen aujourd'hui
         avg_order_today = today_sales / today_orders_count if today_orders_count > 0 else 0
@@ -132,7 +154,7 @@ class HomepageView(ListView):
         total_products_in_stock = Product.objects.filter(active=True, qty__gt=0).aggregate(Sum('qty'))['qty__sum'] or 0
         
         # Commandes récentes (5 dernières)
-        recent_orders = Order.objects.all()[:5]
+        recent_orders = Order.objects.for_display()[:5]
         
         # === FORMATAGE POUR L'AFFICHAGE ===
         context.update({
@@ -175,24 +197,13 @@ class HomepageView(ListView):
         
         # === STATISTIQUES DE DÉPENSES (si l'app aprovision est disponible) ===
         if APROVISION_AVAILABLE:
-            # Dépenses d'aujourd'hui
-            today_expenses = Depense.objects.filter(date_depense=today).aggregate(
-                total=Sum('montant')
-            )['total'] or 0
-            
-            # Dépenses du mois
-            month_expenses = Depense.objects.filter(
-                date_depense__gte=this_month_start,
-                date_depense__lte=today
-            ).aggregate(total=Sum('montant'))['total'] or 0
+            # Dépenses d'aujourd'hui et du mois (agrégats journaliers)
+            today_expenses = today_stats['depenses']
+            month_expenses = month_stats['depenses']
             
             # Dépenses par type ce mois (top 3)
-            top_expense_types = Depense.objects.filter(
-                date_depense__gte=this_month_start,
-                date_depense__lte=today
-            ).values('type_depense__nom', 'type_depense__couleur').annotate(
-                total=Sum('montant')
-            ).order_by('-total')[:3]
+            month_expense_types = detailler_depenses_par_type(month_stats)
+            top_expense_types = month_expense_types[:3]
             
             # Mouvements de stock récents (5 derniers)
             recent_stock_movements = MouvementStock.objects.select_related(
@@ -200,11 +211,10 @@ class HomepageView(ListView):
             ).order_by('-date_mouvement')[:5]
             
             # Bénéfice brut approximatif (ventes - dépenses approvisionnement)
-            appro_expenses = Depense.objects.filter(
-                date_depense__gte=this_month_start,
-                date_depense__lte=today,
-                type_depense__nom__icontains='approvisionnement'
-            ).aggregate(total=Sum('montant'))['total'] or 0
+            appro_expenses = sum(
+                (t['total'] for t in month_expense_types if 'approvisionnement' in t['type_depense__nom'].lower()),
+                Decimal('0.00')
+            )
             
             gross_profit = month_sales - appro_expenses
             
@@ -231,20 +241,26 @@ class HomepageView(ListView):
 
 @login_required
 def auto_create_order_view(request):
+    # Le titre provisoire est généré (unique) puis remplacé par l'identifiant
     new_order = Order.objects.create(
-        title='Order 66',
-        date=datetime.datetime.now()
-
+        date=datetime.date.today()
     )
     new_order.title = f'Order - {new_order.id}'
     new_order.save()
     return redirect(new_order.get_edit_url())
 
 
-class OrderListView(ListView):
+class OrderListView(KeysetPaginationMixin, ListView):
     template_name = 'list.html'
     model = Order
     paginate_by = 50
+    # Tris proposés par les en-têtes du tableau, l'id départageant les égalités
+    keyset_orderings = {
+        'date': ('date', 'pk'),
+        '-date': ('-date', '-pk'),
+        'title': ('title',),
+        '-title': ('-title',),
+    }
     
     def dispatch(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -257,14 +273,35 @@ class OrderListView(ListView):
             qs = Order.filter_data(self.request, qs)
         return qs
 
+    def get_keyset_ordering(self):
+        return self.keyset_orderings.get(self.request.GET.get('sort'), ('-date', '-pk'))
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        orders = OrderTable(self.object_list)
-        RequestConfig(self.request).configure(orders)
+        # Page déjà triée et découpée par KeysetPaginator : le tableau ne fait que l'afficher
+        orders = OrderTable(context['object_list'])
+        RequestConfig(self.request, paginate=False).configure(orders)
         context.update(locals())
         return context
 
 
+class OrderExportView(StreamingExportMixin, OrderListView):
+    """Export CSV / XLSX des commandes filtrées (mêmes filtres que la liste), en flux"""
+    export_filename = 'commandes'
+    export_sheet_name = 'Commandes'
+    export_columns = (
+        ('N° commande', 'title'),
+        ('Date', 'date'),
+        ('Client', 'client__name'),
+        ('Téléphone', 'client__phone'),
+        ('Montant', 'value'),
+        ('Remise', 'discount'),
+        ('Montant final', 'final_value'),
+        ('Montant payé', 'amount_paid'),
+        ('Reste à payer', 'remaining_amount'),
+        ('Payée', 'is_paid'),
+    )
+
 class CreateOrderView(CreateView):
     template_name = 'form.html'
     form_class = OrderCreateForm
@@ -337,8 +374,8 @@ class OrderUpdateView(UpdateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         instance = self.object
-        qs_p = Product.objects.filter(active=True)[:12]
-        products = ProductTable(qs_p)
+        # Catalogue en mémoire, seul le stock est relu
+        products = ProductTable(pos_products())
         order_items = OrderItemTable(instance.order_items.all())
         RequestConfig(self.request).configure(products)
         RequestConfig(self.request).configure(order_items)
@@ -364,14 +401,14 @@ def done_order_view(request, pk):
     """
     order = get_object_or_404(Order, id=pk)
     # Recalculer les totaux sans dépendre d'un save de chaque item
-    items_total = order.order_items.aggregate(total=Sum('total_price'))['total'] or Decimal('0.00')
-    order.value = Decimal(items_total)
-    order.final_value = Decimal(items_total) - Decimal(order.discount)
-    # Mettre à jour le statut de paiement
-    total_paid_now = order.total_payments()
-    order.is_paid = (total_paid_now >= order.final_value) and (order.final_value > Decimal('0.00'))
+    order.recalculate_totals()
+    # Mettre à jour le statut de paiement (amount_paid est maintenu par les paiements)
+    order.is_paid = order.is_fully_paid()
     order.save()
 
+    # Préparer le PDF de la facture en arrière-plan pour un téléchargement immédiat
+    prerender_invoice(order.id)
+
     # Nettoyer le snapshot de session s'il existe
     session_key = f'order_snapshot_{order.id}'
     if session_key in request.session:
@@ -386,14 +423,14 @@ def done_order_view(request, pk):
 
 @login_required
 def invoice_preview_view(request, pk):
-    order = get_object_or_404(Order, id=pk)
+    order = get_object_or_404(Order.objects.for_display(), id=pk)
     # Devise à la volée pour refléter les Paramètres actuels
     try:
         currency = get_currency_label()
     except Exception:
         currency = CURRENCY
-    items = order.order_items.all()
-    payments = order.payments.all()
+    items = order.order_items.select_related('product')
+    payments = list(order.payments.all())
     # Charger paramètres entreprise
     try:
         from users.models import AppSetting
@@ -405,66 +442,179 @@ def invoice_preview_view(request, pk):
         'items': items,
         'payments': payments,
         'currency': currency,
-        'total_payments': order.total_payments(),
-        'remaining_amount': order.remaining_amount(),
+        'total_payments': order.amount_paid,
+        'remaining_amount': order.remaining_amount,
         'client': getattr(order, 'client', None),
         'pdf_available': PDF_AVAILABLE,
         'app_settings': app_settings,
+        # Même date que sur le PDF
+        'issued_on': invoice_issued_on(order, payments),
     }
     return render(request, 'invoice/order_invoice.html', context)
 
 
 @login_required
 def invoice_pdf_view(request, pk):
-    order = get_object_or_404(Order, id=pk)
+    order = get_object_or_404(Order.objects.for_display(), id=pk)
 
     # Si pas de support PDF, on redirige
     if not PDF_AVAILABLE:
         messages.error(request, "⚠️ Génération PDF indisponible. Veuillez installer 'xhtml2pdf'.")
         return redirect('invoice_preview', pk=order.id)
 
-    # Récupération de la devise
+    # PDF en cache sur disque (pré-rendu par done_order_view), rendu ici seulement s'il a changé
+    path = get_invoice_path(order)
+    if path is None:
+        messages.error(request, ' Erreur lors de la génération de la facture.')
+        return redirect('invoice_preview', pk=order.id)
+
     try:
-        currency = get_currency_label()
-    except Exception:
-        currency = CURRENCY
+        pdf_file = open(path, 'rb')
+    except FileNotFoundError:
+        # Remplacé entre-temps par une version plus récente
+        pdf_file = open(get_invoice_path(order), 'rb')
 
-    items = order.order_items.all()
-    payments = order.payments.all()
+    filename = f"Facture-{order.title or order.id}.pdf"
+    return FileResponse(pdf_file, as_attachment=True, filename=filename, content_type='application/pdf')
 
-    # Paramètres globaux
-    try:
-        from users.models import AppSetting
-        app_settings = AppSetting.get_solo()
-    except Exception:
-        app_settings = None
 
-    context = {
-        'order': order,
-        'items': items,
-        'payments': payments,
-        'currency': currency,
-        'total_payments': order.total_payments(),
-        'remaining_amount': order.remaining_amount(),
-        'client': getattr(order, 'client', None),
-        'app_settings': app_settings,
-    }
+INVOICE_EXPORT_PROGRESS_KEY = 'invoice-export:{}'
 
-    # Génération du PDF
-    html = render_to_string('invoice/order_invoice_pdf.html', context)
-    result = BytesIO()
-    pdf = pisa.CreatePDF(src=html, dest=result)
 
-    if pdf.err:
-        messages.error(request, ' Erreur lors de la génération de la facture.')
-        return redirect('invoice_preview', pk=order.id)
+@login_required
+def invoice_export_view(request):
+    """Export des factures des commandes filtrées (mêmes filtres que la liste) en ZIP ou en PDF unique.
 
-    response = HttpResponse(result.getvalue(), content_type='application/pdf')
-    filename = f"Facture-{order.title or order.id}.pdf"
+    Paramètres : filtres de Order.filter_data, format=zip|pdf et un jeton facultatif
+    (token) pour suivre l'avancement via invoice_export_progress_view.
+    """
+    if not PDF_AVAILABLE:
+        messages.error(request, "⚠️ Génération PDF indisponible. Veuillez installer 'xhtml2pdf'.")
+        return redirect('order_list')
+
+    export_format = request.GET.get('format', 'zip')
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'zip'
+    order_ids = list(
+        Order.filter_data(request, Order.objects.all()).order_by('date', 'pk').values_list('pk', flat=True)
+    )
+    if not order_ids:
+        messages.warning(request, "Aucune commande ne correspond aux filtres.")
+        return redirect('order_list')
+    if export_format == 'pdf' and len(order_ids) > MAX_MERGED_ORDERS:
+        messages.error(request, f"Trop de commandes pour un PDF unique ({len(order_ids)} > {MAX_MERGED_ORDERS}) : utilisez l'export ZIP.")
+        return redirect('order_list')
+
+    token = request.GET.get('token', '')[:64]
+    progress = None
+    if token:
+        key = INVOICE_EXPORT_PROGRESS_KEY.format(token)
+
+        def progress(done, total):
+            cache.set(key, {'done': done, 'total': total}, 3600)
+
+        progress(0, len(order_ids))
+
+    # Rendu dans le processus du serveur : pas de pool de processus depuis une requête web
+    response = streaming_response(
+        request, stream_export(order_ids, export_format, workers=1, progress=progress),
+        content_type='application/pdf' if export_format == 'pdf' else 'application/zip',
+    )
+    filename = f"Factures-{timezone.localdate():%Y%m%d}.{export_format}"
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
 
 
+@login_required
+def invoice_export_progress_view(request):
+    """AJAX - Avancement d'un export de factures ({'done': n, 'total': n})"""
+    token = request.GET.get('token', '')[:64]
+    state = cache.get(INVOICE_EXPORT_PROGRESS_KEY.format(token)) if token else None
+    return JsonResponse({'success': state is not None, **(state or {'done': 0, 'total': 0})})
+
+
+# === MISES À JOUR PARTIELLES DU PANIER ===
+# Avec ?mode=delta&version=<cart_version connue>, les endpoints du panier ne renvoient que la
+# ligne modifiée, les totaux et le stock du produit en JSON. Si la version envoyée ne précède
+# pas exactement la nouvelle (panier modifié ailleurs entre-temps), le conteneur complet est
+# rendu en plus pour resynchroniser l'écran.
+
+def _render_order_container(request, instance):
+    order_items = OrderItemTable(instance.order_items.select_related('product'))
+    RequestConfig(request).configure(order_items)
+    return render_to_string(template_name='include/order_container.html',
+                            request=request,
+                            context={'instance': instance,
+                                     'order_items': order_items
+                                     }
+                            )
+
+
+def _render_product_container(request, instance, records=None):
+    """Liste des produits de la caisse ; records : résultat de recherche déjà chargé (tout le catalogue sinon)"""
+    products = ProductTable(pos_products() if records is None else records)
+    RequestConfig(request).configure(products)
+    return render_to_string(template_name='include/product_container.html',
+                            request=request,
+                            context={
+                                'products': products,
+                                'instance': instance
+                            })
+
+
+def _cart_line(order_item):
+    return {
+        'id': order_item.id,
+        'product_id': order_item.product_id,
+        'qty': order_item.qty,
+        'final_price': str(order_item.final_price),
+        'total_price': str(order_item.total_price),
+        'tag_final_price': order_item.tag_final_price(),
+    }
+
+
+def _cart_delta(request, order_id, changes, line=None, deleted_item_id=None, product_id=None, stock=None,
+                products_for=None):
+    """Données compactes : ligne modifiée (ou supprimée), totaux, stock et nouvelle version du panier.
+
+    changes est le nombre de modifications de lignes faites par l'appel (0 ou 1) :
+    la version du client doit alors être exactement version - changes.
+    Si products_for (la commande) est donné, la liste des produits est rendue aussi :
+    à utiliser quand le stock passe de 0 à positif ou l'inverse (bouton d'ajout / « Rupture »).
+    """
+    state = Order.objects.filter(pk=order_id).values('value', 'discount', 'final_value', 'cart_version').get()
+    currency = get_currency_label()
+    data = {
+        'success': True,
+        'mode': 'delta',
+        'version': state['cart_version'],
+        'totals': {
+            'value': str(state['value']),
+            'discount': str(state['discount']),
+            'final_value': str(state['final_value']),
+            'tag_value': f"{state['value']} {currency}",
+            'tag_discount': f"{state['discount']} {currency}",
+            'tag_final_value': f"{state['final_value']} {currency}",
+        },
+    }
+    if line is not None:
+        data['line'] = line
+    if deleted_item_id is not None:
+        data['deleted'] = deleted_item_id
+    if product_id is not None:
+        data['stock'] = {'product_id': product_id, 'qty': stock}
+
+    try:
+        client_version = int(request.GET.get('version'))
+    except (TypeError, ValueError):
+        client_version = None
+    if client_version is None or client_version + changes != state['cart_version']:
+        data['result'] = _render_order_container(request, Order.objects.get(pk=order_id))
+    if products_for is not None:
+        data['products'] = _render_product_container(request, products_for)
+    return data
+
+
 @login_required
 def ajax_add_product(request, pk, dk):
     instance = get_object_or_404(Order, id=pk)
@@ -478,126 +628,202 @@ def ajax_add_product(request, pk, dk):
     except (ValueError, TypeError):
         requested_qty = 1
     
-    # Vérifier si le produit a assez de stock
-    if product.qty <= 0:
-        return JsonResponse({
-            'success': False,
-            'error': f'Le produit "{product.title}" est en rupture de stock'
-        })
-    
-    if requested_qty > product.qty:
-        return JsonResponse({
-            'success': False,
-            'error': f'Stock insuffisant. Disponible: {product.qty}, Demandé: {requested_qty}'
-        })
-    
-    order_item, created = OrderItem.objects.get_or_create(order=instance, product=product)
-    if created:
-        order_item.qty = requested_qty
-        order_item.price = product.value
-        order_item.discount_price = product.discount_value
-    else:
-        order_item.qty += requested_qty
-    order_item.save()
-    
-    # Décrémenter le stock
-    product.qty -= requested_qty
-    product.save()
-    
+    # Réserver le stock en une seule écriture conditionnelle (pas de survente entre caisses)
+    with transaction.atomic():
+        if Product.objects.decrement_stock(product, requested_qty) is None:
+            product.refresh_from_db(fields=['qty'])
+            if product.qty <= 0:
+                return JsonResponse({
+                    'success': False,
+                    'error': f'Le produit "{product.title}" est en rupture de stock'
+                })
+            return JsonResponse({
+                'success': False,
+                'error': f'Stock insuffisant. Disponible: {product.qty}, Demandé: {requested_qty}'
+            })
+
+        order_item, created = OrderItem.objects.get_or_create(
+            order=instance, product=product,
+            defaults={'qty': requested_qty, 'price': product.value, 'discount_price': product.discount_value}
+        )
+        if not created:
+            # Commande et produit déjà chargés (totaux de la commande, statistiques du jour)
+            order_item.order, order_item.product = instance, product
+            order_item.qty += requested_qty
+            order_item.save()
+
+    if request.GET.get('mode') == 'delta':
+        data = _cart_delta(request, instance.id, 1, line=_cart_line(order_item),
+                           product_id=product.id, stock=product.qty,
+                           products_for=instance if product.qty <= 0 else None)
+        # Nouvelle ligne : la table de la commande est rendue pour l'afficher avec ses boutons
+        if created and 'result' not in data:
+            data['result'] = _render_order_container(request, Order.objects.get(pk=instance.id))
+        return JsonResponse(data)
+
     instance.refresh_from_db()
-    order_items = OrderItemTable(instance.order_items.all())
-    RequestConfig(request).configure(order_items)
-    
-    # Mettre à jour aussi la liste des produits pour refléter le nouveau stock
-    products = ProductTable(Product.objects.filter(active=True)[:12])
-    RequestConfig(request).configure(products)
-    
     data = dict()
-    data['result'] = render_to_string(template_name='include/order_container.html',
-                                      request=request,
-                                      context={'instance': instance,
-                                               'order_items': order_items
-                                               }
-                                    )
-    data['products'] = render_to_string(template_name='include/product_container.html',
-                                        request=request,
-                                        context={
-                                            'products': products,
-                                            'instance': instance
-                                        })
+    data['version'] = instance.cart_version
+    data['result'] = _render_order_container(request, instance)
+    # Mettre à jour aussi la liste des produits pour refléter le nouveau stock
+    data['products'] = _render_product_container(request, instance)
     return JsonResponse(data)
 
 
 @login_required
 def ajax_modify_order_item(request, pk, action):
-    order_item = get_object_or_404(OrderItem, id=pk)
+    order_item = get_object_or_404(OrderItem.objects.select_related('product'), id=pk)
     product = order_item.product
-    instance = order_item.order
+    instance_id = order_item.order_id
+    changes = 0
     
     if action == 'remove':
-        order_item.qty -= 1
-        product.qty += 1
-        if order_item.qty < 1: 
-            order_item.qty = 1
+        # La quantité minimale d'une ligne est 1 : on ne rend au stock que ce qui est retiré
+        if order_item.qty > 1:
+            with transaction.atomic():
+                order_item.qty -= 1
+                order_item.save()
+                Product.objects.increment_stock(product, 1)
+            changes = 1
     elif action == 'add':
-        # Vérifier si le produit est encore en stock
-        if product.qty <= 0:
-            return JsonResponse({
-                'success': False,
-                'error': f'Le produit "{product.title}" est en rupture de stock'
-            })
-        order_item.qty += 1
-        product.qty -= 1
+        # Vérifier si le produit est encore en stock (décrément conditionnel atomique)
+        with transaction.atomic():
+            if Product.objects.decrement_stock(product, 1) is None:
+                return JsonResponse({
+                    'success': False,
+                    'error': f'Le produit "{product.title}" est en rupture de stock'
+                })
+            order_item.qty += 1
+            order_item.save()
+        changes = 1
     elif action == 'delete':
-        # Remettre tout le stock quand on supprime l'item
-        product.qty += order_item.qty
+        # Le stock est remis par aprovision.signals.annuler_mouvement_vente
+        item_id = order_item.id
         order_item.delete()
-        product.save()
-        instance.refresh_from_db()
-        order_items = OrderItemTable(instance.order_items.all())
-        RequestConfig(request).configure(order_items)
-        data = dict()
-        data['result'] = render_to_string(template_name='include/order_container.html',
-                                          request=request,
-                                          context={
-                                              'instance': instance,
-                                              'order_items': order_items
-                                          }
-                                          )
-        return JsonResponse(data)
-    
-    product.save()
-    order_item.save()
-    
+        if request.GET.get('mode') == 'delta':
+            stock = Product.objects.filter(pk=product.pk).values_list('qty', flat=True).first()
+            restocked = stock is not None and stock == order_item.qty
+            return JsonResponse(_cart_delta(request, instance_id, 1, deleted_item_id=item_id,
+                                            product_id=product.pk, stock=stock,
+                                            products_for=order_item.order if restocked else None))
+
+    if request.GET.get('mode') == 'delta':
+        crossed_zero = changes and product.qty == (0 if action == 'add' else 1)
+        return JsonResponse(_cart_delta(request, instance_id, changes, line=_cart_line(order_item),
+                                        product_id=product.pk, stock=product.qty,
+                                        products_for=order_item.order if crossed_zero else None))
+
+    instance = Order.objects.get(pk=instance_id)
     data = dict()
-    instance.refresh_from_db()
-    order_items = OrderItemTable(instance.order_items.all())
-    RequestConfig(request).configure(order_items)
-    data['result'] = render_to_string(template_name='include/order_container.html',
-                                      request=request,
-                                      context={
-                                          'instance': instance,
-                                          'order_items': order_items
-                                      }
-                                      )
+    data['version'] = instance.cart_version
+    data['result'] = _render_order_container(request, instance)
     return JsonResponse(data)
 
 
 @login_required
-def ajax_search_products(request, pk):
+def ajax_apply_cart_operations(request, pk):
+    """Applique un lot d'opérations panier en une seule requête et une seule transaction.
+
+    Corps JSON attendu : {"operations": [{"product_id": 12, "delta": 3}, {"product_id": 7, "delta": -1}]}
+    Les deltas d'un même produit sont cumulés. Si une opération est impossible (stock
+    insuffisant, produit inconnu), la transaction est annulée et rien n'est appliqué.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Méthode non autorisée'})
+
     instance = get_object_or_404(Order, id=pk)
+    try:
+        data = json.loads(request.body)
+        deltas = {}
+        for operation in data.get('operations', []):
+            product_id = int(operation['product_id'])
+            deltas[product_id] = deltas.get(product_id, 0) + int(operation.get('delta', 1))
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Données JSON invalides'})
+
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta != 0}
+    if not deltas:
+        return JsonResponse({'success': False, 'error': 'Aucune opération à appliquer'})
+
+    with transaction.atomic():
+        products = Product.objects.in_bulk(list(deltas))
+        items = {
+            item.product_id: item
+            for item in instance.order_items.filter(product_id__in=list(deltas))
+        }
+
+        lines = []
+        for product_id, delta in deltas.items():
+            product = products.get(product_id)
+            if product is None:
+                transaction.set_rollback(True)
+                return JsonResponse({'success': False, 'error': f'Produit introuvable (id {product_id})'})
+            order_item = items.get(product_id)
+            if order_item is not None:
+                order_item.product = product
+                order_item.order = instance
+
+            if delta > 0:
+                # Décrément conditionnel avant la création pour un journal de mouvement correct ;
+                # en cas d'échec toute la transaction est annulée
+                if Product.objects.decrement_stock(product, delta) is None:
+                    # Stock disponible lu avant d'annuler : plus de requête possible ensuite
+                    product.refresh_from_db(fields=['qty'])
+                    transaction.set_rollback(True)
+                    return JsonResponse({
+                        'success': False,
+                        'error': f'Stock insuffisant pour "{product.title}". Disponible: {product.qty}, Demandé: {delta}'
+                    })
+                if order_item is None:
+                    order_item = OrderItem(
+                        order=instance,
+                        product=product,
+                        qty=delta,
+                        price=product.value,
+                        discount_price=product.discount_value
+                    )
+                else:
+                    order_item.qty += delta
+                order_item.save()
+            elif order_item is not None:
+                removed = min(-delta, order_item.qty)
+                if removed >= order_item.qty:
+                    # La restauration du stock est faite par aprovision.signals.annuler_mouvement_vente
+                    order_item.delete()
+                    order_item = None
+                else:
+                    order_item.qty -= removed
+                    order_item.save()
+                    Product.objects.increment_stock(product, removed)
+
+            lines.append({
+                'product_id': product_id,
+                'qty': order_item.qty if order_item else 0,
+                'stock': product.qty,
+            })
+
+    instance.refresh_from_db()
+
+    data = dict()
+    data['success'] = True
+    data['lines'] = lines
+    data['version'] = instance.cart_version
+    data['result'] = _render_order_container(request, instance)
+    data['products'] = _render_product_container(request, instance)
+    return JsonResponse(data)
+
+
+@login_required
+async def ajax_search_products(request, pk):
+    """Recherche au fil de la frappe (vue async) : catalogue en mémoire, stock et commande
+    lus par l'ORM async ; seul le rendu HTML, qui appelle les context processors
+    synchrones (paramètres, licence), passe par un thread"""
+    instance = await aget_object_or_404(Order.objects.only('id'), id=pk)
     q = request.GET.get('q', None)
-    products = Product.browser.active().filter(title__startswith=q) if q else Product.browser.active()
-    products = products[:12]
-    products = ProductTable(products)
-    RequestConfig(request).configure(products)
+    # Recherche dans le catalogue en mémoire, seul le stock est relu
+    records = await apos_products(q, limit=12)
     data = dict()
-    data['products'] = render_to_string(template_name='include/product_container.html',
-                                        request=request,
-                                        context={
-                                            'products': products,
-                                            'instance': instance
-                                        })
+    data['products'] = await sync_to_async(_render_product_container)(request, instance, records)
     return JsonResponse(data)
 
 
@@ -609,31 +835,40 @@ def order_action_view(request, pk, action):
     if action == 'delete':
         order.delete()
         messages.success(request, 'Commande supprimée avec succès.')
-        return redirect('order:order_list')
+        return redirect('order_list')
     
     elif action == 'duplicate':
         # Créer une nouvelle commande basée sur l'ancienne
-        new_order = Order.objects.create(
-            title=f"Copie de {order.title}",
-            date=timezone.now().date(),
-            client=order.client,
-            is_paid=False
-        )
-        
-        # Copier les items
-        for item in order.order_items.all():
-            OrderItem.objects.create(
-                order=new_order,
-                product=item.product,
-                qty=item.qty,
-                unit_price=item.unit_price
+        # Le numéro de commande étant unique, la copie reçoit un nouveau numéro généré.
+        # Tout dans une transaction : si un produit manque, ni commande vide ni numéro consommé
+        with transaction.atomic():
+            new_order = Order.objects.create(
+                date=timezone.now().date(),
+                client=order.client,
+                is_paid=False
             )
-        
-        new_order.calculate_final_value()
-        new_order.save()
-        
+
+            # Copier les items (stock décrémenté comme à la caisse ; totaux maintenus par les lignes)
+            for item in order.order_items.select_related('product').order_by('pk'):
+                if Product.objects.decrement_stock(item.product, item.qty) is None:
+                    item.product.refresh_from_db(fields=['qty'])
+                    transaction.set_rollback(True)
+                    messages.error(
+                        request,
+                        f'Stock insuffisant pour "{item.product.title}". '
+                        f'Disponible: {item.product.qty}, Demandé: {item.qty}'
+                    )
+                    return redirect('update_order', pk=order.id)
+                OrderItem.objects.create(
+                    order=new_order,
+                    product=item.product,
+                    qty=item.qty,
+                    price=item.price,
+                    discount_price=item.discount_price
+                )
+
         messages.success(request, f'Commande dupliquée. Nouvelle commande #{new_order.id}')
-        return redirect('order:order_update', pk=new_order.id)
+        return redirect('update_order', pk=new_order.id)
     
     elif action == 'cancel':
         # Annuler les modifications locales de la commande et restaurer l'état initial
@@ -650,21 +885,21 @@ def order_action_view(request, pk, action):
                 delta = order_item.qty - target_qty
                 if delta > 0:
                     # Trop dans la commande → rendre au stock
-                    order_item.product.qty += delta
-                    order_item.product.save()
                     if target_qty == 0:
+                        # Le stock est remis par aprovision.signals.annuler_mouvement_vente
                         order_item.delete()
                     else:
+                        Product.objects.increment_stock(order_item.product, delta)
                         order_item.qty = target_qty
                         order_item.save()
                 elif delta < 0:
                     # Pas assez dans la commande → reprendre du stock si possible
                     need = -delta
-                    available = order_item.product.qty
-                    take = min(need, available)
-                    order_item.product.qty -= take
-                    order_item.product.save()
-                    order_item.qty = target_qty + (need - take)  # si stock insuffisant, on met au max possible
+                    take = min(need, order_item.product.qty)
+                    while take > 0 and Product.objects.decrement_stock(order_item.product, take) is None:
+                        order_item.product.refresh_from_db(fields=['qty'])
+                        take = min(need, order_item.product.qty)
+                    order_item.qty = order_item.qty + take  # si stock insuffisant, on met au max possible
                     if order_item.qty <= 0:
                         order_item.delete()
                     else:
@@ -673,13 +908,13 @@ def order_action_view(request, pk, action):
             # Ajouter les items manquants du snapshot
             for product_id, target_qty in desired.items():
                 if product_id not in current_items:
-                    from product.models import Product
                     try:
                         product = Product.objects.get(id=product_id)
                         take = min(target_qty, product.qty)
+                        while take > 0 and Product.objects.decrement_stock(product, take) is None:
+                            product.refresh_from_db(fields=['qty'])
+                            take = min(target_qty, product.qty)
                         if take > 0:
-                            product.qty -= take
-                            product.save()
                             OrderItem.objects.create(
                                 order=order,
                                 product=product,
@@ -701,7 +936,7 @@ def order_action_view(request, pk, action):
             messages.info(request, "Modifications annulées. Commande restaurée.")
         return redirect('order_list')
 
-    return redirect('order:order_list')
+    return redirect('order_list')
 
 
 @login_required
@@ -754,18 +989,16 @@ def ajax_add_payment(request, pk):
                 return JsonResponse({'success': False, 'error': 'Le montant doit être supérieur à 0'})
             
             # Vérifier que le paiement ne dépasse pas le montant restant
-            # Recalculer le montant restant à partir des items (sans nécessiter de "Save")
-            items_total = order.order_items.aggregate(total=Sum('total_price'))['total'] or Decimal('0.00')
-            final_now = (Decimal(items_total) - Decimal(order.discount))
-            total_paid_now = order.total_payments()
-            remaining = max(Decimal('0.00'), final_now - total_paid_now)
+            # (final_value et amount_paid sont tenus à jour à chaque écriture)
+            remaining = order.remaining_amount
             if amount > remaining:
                 return JsonResponse({
                     'success': False, 
                     'error': f'Le paiement ({amount} {_currency()}) dépasse le montant restant ({remaining} {_currency()})'
                 })
             
-            # Créer le paiement
+            # Créer le paiement (le signal met à jour amount_paid et is_paid en un UPDATE,
+            # puis relit ces colonnes sur order, passée au paiement)
             payment = Payment.objects.create(
                 order=order,
                 amount=amount,
@@ -773,12 +1006,6 @@ def ajax_add_payment(request, pk):
                 note=note
             )
             
-            # Mettre à jour le statut is_paid de la commande sans dépendre de final_value
-            total_paid_after = total_paid_now + amount
-            is_paid_now = total_paid_after >= final_now and final_now > Decimal('0.00')
-            Order.objects.filter(id=order.id).update(is_paid=is_paid_now)
-            order.refresh_from_db()
-            
             # Retourner les données mises à jour
             payments_html = render_to_string('include/payments_container.html', {
                 'order': order,
@@ -788,9 +1015,9 @@ def ajax_add_payment(request, pk):
             return JsonResponse({
                 'success': True,
                 'payments_html': payments_html,
-                'total_payments': str(order.total_payments()),
-                'remaining_amount': str(max(Decimal('0.00'), final_now - order.total_payments())),
-                'payment_percentage': round((order.total_payments() / final_now * 100) if final_now > 0 else 0, 1),
+                'total_payments': str(order.amount_paid),
+                'remaining_amount': str(order.remaining_amount),
+                'payment_percentage': round(order.payment_percentage(), 1) if order.final_value > 0 else 0,
                 'is_fully_paid': order.is_paid
             })
             
@@ -808,15 +1035,8 @@ def ajax_delete_payment(request, pk, payment_id):
     
     if request.method == 'POST':
         try:
-            # Supprimer le paiement
+            # Supprimer le paiement (le signal met à jour amount_paid et is_paid en un UPDATE)
             payment.delete()
-            
-            # Mettre à jour le statut is_paid de la commande sans dépendre d'un "Save" préalable
-            items_total = order.order_items.aggregate(total=Sum('total_price'))['total'] or Decimal('0.00')
-            final_now = (Decimal(items_total) - Decimal(order.discount))
-            total_paid_now = order.total_payments()
-            is_paid_now = total_paid_now >= final_now and final_now > Decimal('0.00')
-            Order.objects.filter(id=order.id).update(is_paid=is_paid_now)
             order.refresh_from_db()
             
             # Retourner les données mises à jour
@@ -828,9 +1048,9 @@ def ajax_delete_payment(request, pk, payment_id):
             return JsonResponse({
                 'success': True,
                 'payments_html': payments_html,
-                'total_payments': str(order.total_payments()),
-                'remaining_amount': str(max(Decimal('0.00'), final_now - order.total_payments())),
-                'payment_percentage': round((order.total_payments() / final_now * 100) if final_now > 0 else 0, 1),
+                'total_payments': str(order.amount_paid),
+                'remaining_amount': str(order.remaining_amount),
+                'payment_percentage': round(order.payment_percentage(), 1) if order.final_value > 0 else 0,
                 'is_fully_paid': order.is_paid
             })
             
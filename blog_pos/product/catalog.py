@@ -0,0 +1,237 @@
+"""
+Catalogue des produits actifs en mémoire pour l'écran de caisse.
+
+Le titre, la catégorie et le prix changent rarement : ils sont chargés une fois
+par processus (deux requêtes) dans un instantané, puis corrigés sur place par
+les signaux de product/signals.py après chaque enregistrement validé. Seul le
+stock (qty) est relu à chaque affichage, par une requête sur cette seule colonne.
+
+L'instantané porte un numéro de version (uuid) recopié dans le cache Django :
+un autre processus qui modifie un produit change ce numéro, et l'instantané
+local est alors rechargé au prochain accès.
+
+Parcours et recherche (mêmes règles de correspondance et de classement que
+product.search) se font en mémoire, sans SQL.
+"""
+
+import threading
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from .search import normalize
+
+CATALOG_VERSION_KEY = 'product:catalog:version'
+
+
+class CatalogProduct:
+    """Fiche produit compacte, utilisable comme enregistrement de ProductTable"""
+    __slots__ = ('id', 'title', 'category_id', 'category', 'final_value', 'qty', 'search_title', 'search_category')
+
+    def __init__(self, id, title, category_id, category, final_value, qty=0):
+        self.id = id
+        self.title = title
+        self.category_id = category_id
+        self.category = category
+        self.final_value = final_value
+        self.qty = qty
+        self.search_title = normalize(title)
+        self.search_category = normalize(category)
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.title
+
+    def tag_final_value(self):
+        from .models import get_currency_label
+        return f'{self.final_value} {get_currency_label()}'
+
+    def with_qty(self, qty):
+        """Copie portant le stock donné (l'instantané partagé n'est jamais modifié pour le stock)"""
+        record = CatalogProduct.__new__(CatalogProduct)
+        for name in self.__slots__:
+            setattr(record, name, getattr(self, name))
+        record.qty = qty
+        return record
+
+    def rank(self, query, terms):
+        """Rang de pertinence pour la saisie normalisée, ou None si elle ne correspond pas"""
+        title, category = self.search_title, self.search_category
+        for term in terms:
+            if term not in title and term not in category:
+                return None
+        if title == query:
+            return 0
+        if title.startswith(query + ' '):
+            return 1
+        if title.startswith(query):
+            return 2
+        if (' ' + query) in title:
+            return 3
+        if query in title:
+            return 4
+        return 5
+
+
+class Catalog:
+    """Instantané des produits actifs, dans l'ordre des ids"""
+
+    def __init__(self, version, categories, products):
+        self.version = version
+        self.categories = categories  # {id: titre}
+        self.products = products  # {id: CatalogProduct}, ordre d'insertion = ordre des ids
+
+    @classmethod
+    def load(cls, version):
+        from .models import Category, Product
+        categories = dict(Category.objects.values_list('id', 'title'))
+        products = {}
+        rows = Product.objects.filter(active=True).order_by('pk').values_list('id', 'title', 'category_id', 'final_value')
+        for product_id, title, category_id, final_value in rows:
+            products[product_id] = CatalogProduct(
+                product_id, title, category_id, categories.get(category_id), final_value
+            )
+        return cls(version, categories, products)
+
+    # --- Lecture ---
+
+    def browse(self, limit=12):
+        """Premiers produits actifs (ordre des ids), sans le stock"""
+        records = list(self.products.values())
+        return records[:limit] if limit is not None else records
+
+    def search(self, query, limit=12):
+        """Produits actifs correspondant à la saisie, triés par pertinence puis par titre"""
+        query = normalize(query)
+        terms = query.split()
+        if not terms:
+            return self.browse(limit)
+        ranked = []
+        for record in list(self.products.values()):
+            rank = record.rank(query, terms)
+            if rank is not None:
+                ranked.append((rank, record.search_title, record.id, record))
+        ranked.sort(key=lambda entry: entry[:3])
+        records = [entry[3] for entry in ranked]
+        return records[:limit] if limit is not None else records
+
+    # --- Corrections appliquées par les signaux (via patch_catalog, sous verrou) ---
+
+    def put_product(self, product):
+        if not product.active:
+            self.products.pop(product.pk, None)
+            return
+        is_new = product.pk not in self.products
+        last_id = next(reversed(self.products), None)
+        self.products[product.pk] = CatalogProduct(
+            product.pk, product.title, product.category_id,
+            self.categories.get(product.category_id), product.final_value
+        )
+        if is_new and last_id is not None and product.pk < last_id:
+            # Produit réactivé : remis à sa place dans l'ordre des ids
+            self.products = dict(sorted(self.products.items()))
+
+    def drop_product(self, product_id):
+        self.products.pop(product_id, None)
+
+    def put_category(self, category_id, title):
+        self.categories[category_id] = title
+        self._move_category(category_id, category_id, title)
+
+    def drop_category(self, category_id):
+        self.categories.pop(category_id, None)
+        self._move_category(category_id, None, None)
+
+    def _move_category(self, category_id, new_category_id, title):
+        for product_id, record in list(self.products.items()):
+            if record.category_id == category_id:
+                self.products[product_id] = CatalogProduct(
+                    product_id, record.title, new_category_id, title, record.final_value
+                )
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Instantané courant, rechargé si un autre processus a changé la version"""
+    global _catalog
+    version = cache.get(CATALOG_VERSION_KEY)
+    catalog = _catalog
+    if catalog is not None and version == catalog.version:
+        return catalog
+    with _catalog_lock:
+        if _catalog is None or _catalog.version != version:
+            if version is None:
+                version = uuid.uuid4().hex
+                cache.set(CATALOG_VERSION_KEY, version, None)
+            _catalog = Catalog.load(version)
+        return _catalog
+
+
+def patch_catalog(apply):
+    """Applique une correction à l'instantané local et publie une nouvelle version.
+
+    Sans instantané chargé, seule la version change (il sera chargé à jour au prochain accès).
+    """
+    version = uuid.uuid4().hex
+    with _catalog_lock:
+        catalog = _catalog
+        if catalog is not None:
+            apply(catalog)
+            catalog.version = version
+        cache.set(CATALOG_VERSION_KEY, version, None)
+
+
+def with_stock(records):
+    """Copies des fiches avec le stock courant, lu en une requête sur la seule colonne qty"""
+    from .models import Product
+    records = list(records)
+    if not records:
+        return []
+    stock = dict(Product.objects.filter(pk__in=[r.id for r in records]).values_list('id', 'qty'))
+    return [record.with_qty(stock[record.id]) for record in records if record.id in stock]
+
+
+def pos_products(query=None, limit=12):
+    """Produits à afficher sur l'écran de caisse (parcours ou recherche), avec leur stock"""
+    catalog = get_catalog()
+    records = catalog.search(query, limit) if query else catalog.browse(limit)
+    return with_stock(records)
+
+
+# --- Variantes async (vues AJAX async de l'écran de caisse) ---
+# Le cache Django par défaut (LocMemCache) est en mémoire du processus : il est lu
+# directement, sans passer par un thread comme le ferait cache.aget().
+
+async def aget_catalog():
+    """Comme get_catalog ; seul le (re)chargement de l'instantané passe par un thread"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    catalog = _catalog
+    if catalog is not None and version == catalog.version:
+        return catalog
+    return await sync_to_async(get_catalog)()
+
+
+async def awith_stock(records):
+    """Comme with_stock, par l'ORM async"""
+    from .models import Product
+    records = list(records)
+    if not records:
+        return []
+    stock = {
+        pk: qty async for pk, qty in Product.objects.filter(pk__in=[r.id for r in records]).values_list('id', 'qty')
+    }
+    return [record.with_qty(stock[record.id]) for record in records if record.id in stock]
+
+
+async def apos_products(query=None, limit=12):
+    """Comme pos_products : recherche en mémoire, seul le stock est lu (une requête)"""
+    catalog = await aget_catalog()
+    records = catalog.search(query, limit) if query else catalog.browse(limit)
+    return await awith_stock(records)
@@ -0,0 +1,22 @@
+"""
+Reconstruit l'index de recherche des produits (table FTS5 product_search).
+
+Usage:
+    python manage.py rebuild_product_search
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from product.search import index_available, index_products
+
+
+class Command(BaseCommand):
+    help = "Réindexe le titre et la catégorie de tous les produits pour la recherche"
+
+    def handle(self, *args, **options):
+        if not index_available():
+            raise CommandError("Index de recherche indisponible (base non SQLite ou SQLite sans FTS5)")
+        with transaction.atomic():
+            nombre = index_products()
+        self.stdout.write(self.style.SUCCESS(f"{nombre} produit(s) indexé(s)"))
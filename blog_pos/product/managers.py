@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
 
 
 class ProductManager(models.Manager):
@@ -7,4 +8,79 @@ class ProductManager(models.Manager):
         return self.filter(active=True)
 
     def have_qty(self):
-        return self.active().filter(qty__gte=1)
\ No newline at end of file
+        return self.active().filter(qty__gte=1)
+
+    # === SERVICE DE STOCK ATOMIQUE ===
+    # Toutes les variations de Product.qty passent par ces méthodes : un UPDATE conditionnel
+    # (qty = qty - n WHERE qty >= n) au lieu d'un lire-modifier-écrire, donc pas de survente
+    # entre deux caisses et pas de verrou. Chaque méthode accepte une instance ou un id ;
+    # si une instance est passée, son attribut qty est mis à jour avec la valeur en base.
+
+    def _apply_stock_delta(self, product, delta, require_available=False):
+        product_id = getattr(product, 'pk', product)
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        sql = f'UPDATE {table} SET "qty" = "qty" + %s WHERE "id" = %s'
+        params = [delta, product_id]
+        if require_available:
+            sql += ' AND "qty" >= %s'
+            params.append(-delta)
+
+        if connection.features.can_return_columns_from_insert:
+            # Nouvelle quantité retournée par la même instruction
+            with connection.cursor() as cursor:
+                cursor.execute(sql + ' RETURNING "qty"', params)
+                row = cursor.fetchone()
+            new_qty = row[0] if row else None
+        else:
+            with transaction.atomic(using=self.db):
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, params)
+                    updated = cursor.rowcount
+                new_qty = self.filter(pk=product_id).values_list('qty', flat=True).first() if updated else None
+
+        if new_qty is not None and isinstance(product, self.model):
+            product.qty = new_qty
+        return new_qty
+
+    def decrement_stock(self, product, quantity):
+        """Retire quantity unités si le stock le permet.
+
+        Retourne la nouvelle quantité, ou None si le stock est insuffisant (rien n'est modifié).
+        """
+        return self._apply_stock_delta(product, -int(quantity), require_available=True)
+
+    def increment_stock(self, product, quantity):
+        """Ajoute quantity unités au stock et retourne la nouvelle quantité"""
+        return self._apply_stock_delta(product, int(quantity))
+
+    def increment_stock_bulk(self, quantities):
+        """Ajoute des quantités à plusieurs produits en un seul UPDATE (CASE ... WHEN).
+
+        quantities : dict {product_id: quantité}. Retourne un dict {product_id: nouvelle quantité}.
+        """
+        quantities = {product_id: int(qty) for product_id, qty in quantities.items() if qty}
+        if not quantities:
+            return {}
+        self.filter(pk__in=list(quantities)).update(qty=F('qty') + Case(
+            *[When(pk=product_id, then=Value(qty)) for product_id, qty in quantities.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+        return dict(self.filter(pk__in=list(quantities)).values_list('pk', 'qty'))
+
+    def set_stock(self, product, quantity):
+        """Définit le stock à quantity (comparer-puis-écrire, réessaie en cas d'écriture concurrente).
+
+        Retourne le couple (ancienne quantité, nouvelle quantité), ou None si le produit n'existe pas.
+        """
+        product_id = getattr(product, 'pk', product)
+        quantity = int(quantity)
+        while True:
+            old_qty = self.filter(pk=product_id).values_list('qty', flat=True).first()
+            if old_qty is None:
+                return None
+            if self.filter(pk=product_id, qty=old_qty).update(qty=quantity):
+                if isinstance(product, self.model):
+                    product.qty = quantity
+                return old_qty, quantity
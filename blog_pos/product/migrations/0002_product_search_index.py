@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def creer_index_recherche(apps, schema_editor):
+    """Crée la table FTS5 product_search et y indexe le catalogue existant"""
+    from product.search import create_index, index_products
+    if create_index(schema_editor):
+        index_products(using=schema_editor.connection.alias, apps=apps)
+
+
+def supprimer_index_recherche(apps, schema_editor):
+    from product.search import SEARCH_TABLE
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+        schema_editor.connection._product_search_available = False
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index_recherche, supprimer_index_recherche),
+    ]
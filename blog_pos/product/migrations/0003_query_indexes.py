@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-17 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0002_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['active', 'qty'], name='product_active_qty_idx'),
+        ),
+    ]
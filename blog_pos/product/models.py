@@ -43,11 +43,14 @@ class Product(models.Model):
     qty = models.PositiveIntegerField(default=0)
     prix_achat = models.DecimalField(default=0.00, decimal_places=2, max_digits=10, help_text="Prix d'achat unitaire (pour la traçabilité)")
 
-    objects = models.Manager()
+    objects = ProductManager()
     browser = ProductManager()
 
     class Meta:
         verbose_name_plural = 'Products'
+        indexes = [
+            models.Index(fields=['active', 'qty'], name='product_active_qty_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         self.final_value = self.discount_value if self.discount_value > 0 else self.value
@@ -0,0 +1,201 @@
+"""
+Recherche de produits (caisse, approvisionnement, liste des produits).
+
+Sous SQLite, un index FTS5 à trigrammes (table virtuelle product_search, rowid =
+id du produit) contient le titre et la catégorie de chaque produit sous forme
+normalisée : minuscules et sans accents, de sorte que « cafe » trouve « Café ».
+Il est tenu à jour par les signaux de product/signals.py et peut être reconstruit
+avec la commande rebuild_product_search.
+
+Les résultats sont classés : titre identique, premier mot identique, titre
+commençant par la saisie, mot du titre commençant par la saisie, titre contenant la saisie, puis
+correspondance sur la catégorie seulement.
+
+Sur une autre base, ou si FTS5 n'est pas disponible, la recherche retombe sur
+des icontains par mot, triés par titre (sans classement ni insensibilité aux accents).
+"""
+
+import unicodedata
+
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'product_search'
+
+# Les trigrammes ne permettent pas de MATCH en dessous de 3 caractères
+MIN_MATCH_LENGTH = 3
+
+
+def normalize(text):
+    """Minuscules, sans accents et espaces simples : « Crème  Brûlée » -> « creme brulee »"""
+    text = unicodedata.normalize('NFKD', str(text or '').casefold())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.split())
+
+
+def _like_pattern(term, prefix='%', suffix='%'):
+    term = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'{prefix}{term}{suffix}'
+
+
+def index_available(using=DEFAULT_DB_ALIAS):
+    """Vrai si la table product_search existe sur cette connexion (vérifié une fois par connexion)"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    available = getattr(connection, '_product_search_available', None)
+    if available is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SEARCH_TABLE])
+            available = cursor.fetchone() is not None
+        connection._product_search_available = available
+    return available
+
+
+async def aindex_available(using=DEFAULT_DB_ALIAS):
+    """Comme index_available, pour le code async : la vérification se fait dans le thread
+    de la base, le résultat est mémorisé sur la connexion du thread courant"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    available = getattr(connection, '_product_search_available', None)
+    if available is None:
+        available = await sync_to_async(index_available)(using)
+        connection._product_search_available = available
+    return available
+
+
+def create_index(schema_editor):
+    """Crée la table FTS5 (utilisé par la migration) ; sans effet hors SQLite ou sans FTS5"""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+                f"USING fts5(titre, categorie, tokenize = 'trigram')"
+            )
+    except Exception:
+        # SQLite compilé sans FTS5 ou antérieur à 3.34 : la recherche utilisera icontains
+        return False
+    connection._product_search_available = True
+    return True
+
+
+def index_products(product_ids=None, using=DEFAULT_DB_ALIAS, apps=None):
+    """(Ré)indexe les produits donnés, ou tout le catalogue si product_ids est None"""
+    if not index_available(using):
+        return 0
+    if apps is None:
+        from .models import Product
+    else:
+        Product = apps.get_model('product', 'Product')
+
+    products = Product._default_manager.using(using).order_by()
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        if not product_ids:
+            return 0
+        products = products.filter(pk__in=product_ids)
+    rows = [
+        (pk, normalize(title), normalize(category_title))
+        for pk, title, category_title in products.values_list('pk', 'title', 'category__title')
+    ]
+
+    with connections[using].cursor() as cursor:
+        if product_ids is None:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        else:
+            unindex_products(product_ids, using=using)
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, titre, categorie) VALUES (%s, %s, %s)", rows
+        )
+    return len(rows)
+
+
+def unindex_products(product_ids, using=DEFAULT_DB_ALIAS):
+    """Retire les produits donnés de l'index"""
+    product_ids = list(product_ids)
+    if not product_ids or not index_available(using):
+        return
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", product_ids)
+
+
+def _match_clause(terms):
+    """Condition SQL sur product_search : chaque mot dans le titre ou la catégorie.
+
+    Les mots d'au moins 3 caractères passent par l'index (MATCH), les plus courts par LIKE.
+    """
+    match_terms = ['"%s"' % term.replace('"', '""') for term in terms if len(term) >= MIN_MATCH_LENGTH]
+    conditions, params = [], []
+    if match_terms:
+        conditions.append(f"{SEARCH_TABLE} MATCH %s")
+        params.append(' AND '.join(match_terms))
+    for term in terms:
+        if len(term) < MIN_MATCH_LENGTH:
+            conditions.append("(titre LIKE %s ESCAPE '\\' OR categorie LIKE %s ESCAPE '\\')")
+            params += [_like_pattern(term), _like_pattern(term)]
+    return ' AND '.join(conditions), params
+
+
+def _rank_expression(query):
+    """Rang de pertinence (0 = meilleur) d'une ligne de product_search pour la saisie normalisée"""
+    sql = (
+        "CASE"
+        " WHEN titre = %s THEN 0"
+        " WHEN titre LIKE %s ESCAPE '\\' THEN 1"
+        " WHEN titre LIKE %s ESCAPE '\\' THEN 2"
+        " WHEN titre LIKE %s ESCAPE '\\' THEN 3"
+        " WHEN titre LIKE %s ESCAPE '\\' THEN 4"
+        " ELSE 5 END"
+    )
+    params = [
+        query,
+        _like_pattern(query, prefix='', suffix=' %'),
+        _like_pattern(query, prefix=''),
+        _like_pattern(query, prefix='% '),
+        _like_pattern(query),
+    ]
+    return sql, params
+
+
+def search(queryset, query, limit=None, use_index=None):
+    """Restreint le queryset de produits à la saisie, trié par pertinence puis par titre.
+
+    Les filtres déjà posés sur le queryset (actif, catégorie...) sont conservés et le
+    tout reste une seule requête : la correspondance est une sous-requête sur l'index
+    et le rang est annoté (search_rank).
+
+    use_index : résultat de index_available déjà connu (aindex_available dans une vue
+    async, où le queryset n'est évalué qu'ensuite par l'ORM async).
+    """
+    query = normalize(query)
+    terms = query.split()
+    if not terms:
+        return queryset[:limit] if limit is not None else queryset
+
+    if use_index is None:
+        use_index = index_available(queryset.db)
+    if not use_index:
+        for term in terms:
+            queryset = queryset.filter(Q(title__icontains=term) | Q(category__title__icontains=term))
+        queryset = queryset.order_by('title')
+        return queryset[:limit] if limit is not None else queryset
+
+    match_sql, match_params = _match_clause(terms)
+    rank_sql, rank_params = _rank_expression(query)
+    table = connections[queryset.db].ops.quote_name(queryset.model._meta.db_table)
+    queryset = queryset.filter(
+        pk__in=RawSQL(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {match_sql}", match_params)
+    ).annotate(
+        search_rank=RawSQL(
+            f"SELECT {rank_sql} FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE}.rowid = {table}.\"id\"",
+            rank_params,
+        )
+    ).order_by('search_rank', 'title')
+    return queryset[:limit] if limit is not None else queryset
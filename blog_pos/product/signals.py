@@ -0,0 +1,96 @@
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.db import transaction
+from django.dispatch import receiver
+from .catalog import patch_catalog
+from .models import Product, Category
+from .search import index_products, unindex_products
+
+
+@receiver(post_save, sender=Product)
+def indexer_produit(sender, instance, using, raw=False, **kwargs):
+    """
+    Signal pour tenir à jour l'index de recherche après création/modification d'un produit
+    """
+    if raw:
+        return
+    index_products([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Product)
+def desindexer_produit(sender, instance, using, **kwargs):
+    """
+    Signal pour retirer un produit supprimé de l'index de recherche
+    """
+    unindex_products([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Category)
+def indexer_produits_categorie(sender, instance, created, using, raw=False, **kwargs):
+    """
+    Signal pour réindexer les produits d'une catégorie renommée
+    """
+    if raw or created:
+        return
+    product_ids = list(Product.objects.using(using).filter(category=instance).values_list('pk', flat=True))
+    index_products(product_ids, using=using)
+
+
+@receiver(pre_delete, sender=Category)
+def memoriser_produits_categorie(sender, instance, using, **kwargs):
+    """
+    Signal pour mémoriser les produits d'une catégorie avant sa suppression
+    (ils passent à « sans catégorie » par un UPDATE qui n'émet pas de signal)
+    """
+    instance._produits_a_reindexer = list(
+        Product.objects.using(using).filter(category=instance).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Category)
+def reindexer_produits_categorie(sender, instance, using, **kwargs):
+    """
+    Signal pour réindexer les produits d'une catégorie supprimée
+    """
+    index_products(getattr(instance, '_produits_a_reindexer', []), using=using)
+
+
+# === INSTANTANÉ DU CATALOGUE (voir product/catalog.py) ===
+# Corrections appliquées après validation de la transaction, pour ne jamais refléter une écriture annulée
+
+@receiver(post_save, sender=Product)
+def corriger_catalogue_produit(sender, instance, raw=False, **kwargs):
+    """
+    Signal pour reporter la création/modification d'un produit dans le catalogue en mémoire
+    """
+    if raw:
+        return
+    transaction.on_commit(lambda: patch_catalog(lambda catalog: catalog.put_product(instance)))
+
+
+@receiver(post_delete, sender=Product)
+def retirer_produit_catalogue(sender, instance, **kwargs):
+    """
+    Signal pour retirer un produit supprimé du catalogue en mémoire
+    """
+    product_id = instance.pk
+    transaction.on_commit(lambda: patch_catalog(lambda catalog: catalog.drop_product(product_id)))
+
+
+@receiver(post_save, sender=Category)
+def corriger_catalogue_categorie(sender, instance, raw=False, **kwargs):
+    """
+    Signal pour reporter le titre d'une catégorie dans le catalogue en mémoire
+    """
+    if raw:
+        return
+    category_id, title = instance.pk, instance.title
+    transaction.on_commit(lambda: patch_catalog(lambda catalog: catalog.put_category(category_id, title)))
+
+
+@receiver(post_delete, sender=Category)
+def retirer_categorie_catalogue(sender, instance, **kwargs):
+    """
+    Signal pour passer les produits d'une catégorie supprimée en « sans catégorie » dans le catalogue
+    """
+    category_id = instance.pk
+    transaction.on_commit(lambda: patch_catalog(lambda catalog: catalog.drop_category(category_id)))
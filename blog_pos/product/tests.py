@@ -1,3 +1,120 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import transaction
+
+from blog_pos.testing import PosTestCase
+
+from .catalog import CATALOG_VERSION_KEY, get_catalog, pos_products
+from .models import Category, Product
+
+
+class StockServiceTests(PosTestCase):
+    """Variations de stock par UPDATE conditionnel (ProductManager)"""
+
+    def setUp(self):
+        super().setUp()
+        self.riz = self.make_product('Riz', qty=5)
+        self.huile = self.make_product('Huile', qty=2)
+
+    def test_decrement_refuses_beyond_stock(self):
+        self.assertEqual(Product.objects.decrement_stock(self.riz, 3), 2)
+        self.assertEqual(self.riz.qty, 2)
+        self.assertIsNone(Product.objects.decrement_stock(self.riz.pk, 3))
+        self.assertEqual(Product.objects.get(pk=self.riz.pk).qty, 2)
+
+    def test_increment_single_and_bulk(self):
+        self.assertEqual(Product.objects.increment_stock(self.riz.pk, 4), 9)
+        nouveaux = Product.objects.increment_stock_bulk({self.riz.pk: 1, self.huile.pk: 3})
+        self.assertEqual(nouveaux, {self.riz.pk: 10, self.huile.pk: 5})
+        self.assertEqual(Product.objects.increment_stock_bulk({self.riz.pk: 0}), {})
+
+    def test_set_stock_returns_old_and_new(self):
+        self.assertEqual(Product.objects.set_stock(self.huile, 7), (2, 7))
+        self.assertEqual(self.huile.qty, 7)
+        self.assertIsNone(Product.objects.set_stock(999999, 1))
+
+
+class CatalogSnapshotTests(PosTestCase):
+    """Instantané du catalogue corrigé sur place par les signaux, après commit uniquement"""
+
+    def setUp(self):
+        super().setUp()
+        self.boissons = Category.objects.create(title='Boissons')
+        self.jus = self.make_product('Jus de gingembre', value='500.00', category=self.boissons)
+        self.riz = self.make_product('Riz parfumé', value='1000.00')
+        pos_products()
+        self.catalog = get_catalog()
+
+    def titles(self, query=None):
+        return [record.title for record in pos_products(query)]
+
+    def commit(self, obj, method='save'):
+        with self.captureOnCommitCallbacks(execute=True):
+            getattr(obj, method)()
+
+    def assertPatched(self):
+        """Corrigé sur place, pas rechargé : même instantané et seule la requête du stock"""
+        self.assertIs(get_catalog(), self.catalog)
+        with self.assertNumQueries(1):
+            pos_products()
+
+    def test_created_product_is_listed_and_searchable(self):
+        self.make_product('Jus de bissap', value='400.00', category=self.boissons)
+        self.assertPatched()
+        self.assertEqual(self.titles('bissap'), ['Jus de bissap'])
+        self.assertEqual(self.titles()[-1], 'Jus de bissap')
+
+    def test_edited_product_shows_new_title_and_price(self):
+        self.riz.title = 'Riz brisé'
+        self.riz.discount_value = Decimal('900.00')
+        self.commit(self.riz)
+        self.assertPatched()
+        self.assertEqual(self.titles('parfume'), [])
+        [record] = pos_products('brise')
+        self.assertEqual((record.title, record.final_value, record.qty), ('Riz brisé', Decimal('900.00'), 10))
+
+    def test_deactivated_then_reactivated_product(self):
+        self.jus.active = False
+        self.commit(self.jus)
+        self.assertPatched()
+        self.assertEqual(self.titles(), ['Riz parfumé'])
+        self.assertEqual(self.titles('gingembre'), [])
+        self.jus.active = True
+        self.commit(self.jus)
+        # Remis à sa place dans l'ordre des ids
+        self.assertEqual(self.titles(), ['Jus de gingembre', 'Riz parfumé'])
+
+    def test_deleted_product_is_dropped(self):
+        self.commit(self.riz, 'delete')
+        self.assertPatched()
+        self.assertEqual(self.titles(), ['Jus de gingembre'])
+
+    def test_category_rename_and_delete(self):
+        self.boissons.title = 'Sodas'
+        self.commit(self.boissons)
+        self.assertPatched()
+        self.assertEqual(self.titles('sodas'), ['Jus de gingembre'])
+        self.assertEqual(pos_products('sodas')[0].category, 'Sodas')
+
+        self.commit(self.boissons, 'delete')
+        self.assertPatched()
+        self.assertEqual(self.titles('sodas'), [])
+        [record] = pos_products('gingembre')
+        self.assertIsNone(record.category_id)
+
+    def test_rolled_back_save_does_not_patch_the_snapshot(self):
+        version = cache.get(CATALOG_VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.riz.title = 'Riz annulé'
+                    self.riz.save()
+                    Product.objects.create(title='Produit annulé', qty=5, value=Decimal('100.00'))
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(cache.get(CATALOG_VERSION_KEY), version)
+        self.assertPatched()
+        self.assertEqual(self.titles('annule'), [])
+        self.assertEqual(self.titles(), ['Jus de gingembre', 'Riz parfumé'])
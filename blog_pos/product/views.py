@@ -7,6 +7,7 @@ from django.views.generic import ListView
 from django.db.models import Q
 from django.http import JsonResponse
 from .models import Product, Category, get_low_stock_threshold
+from .search import search as search_products
 from .forms import SimpleProductForm, SimpleCategoryForm, QuickStockForm
 from users.models import AppSetting
 
@@ -52,10 +53,7 @@ def product_list(request):
     # Recherche
     search = request.GET.get('search', '')
     if search:
-        products = products.filter(
-            Q(title__icontains=search) |
-            Q(category__title__icontains=search)
-        )
+        products = search_products(products, search)
     
     # Filtre par catégorie
     category_id = request.GET.get('category', '')
@@ -108,7 +106,9 @@ def edit_product(request, pk):
     if request.method == 'POST':
         form = SimpleProductForm(request.POST, instance=product)
         if form.is_valid():
-            product = form.save()
+            # N'écrire que les champs du formulaire : qty est géré par le service de stock
+            product = form.save(commit=False)
+            product.save(update_fields=list(form.Meta.fields) + ['final_value'])
             messages.success(request, f'Produit "{product.title}" modifié avec succès!')
             return redirect('product:product_list')
     else:
@@ -146,9 +146,6 @@ def quick_stock_update(request, pk):
             reference = form.cleaned_data.get('reference', '')
             description = form.cleaned_data.get('description', '')
             
-            # Sauvegarder l'ancien stock pour la traçabilité
-            stock_avant = product.qty
-            
             try:
                 # Import conditionnel pour éviter les erreurs si l'app n'est pas disponible
                 from aprovision.models import Approvisionnement, MouvementStock, TypeMouvement
@@ -159,9 +156,9 @@ def quick_stock_update(request, pk):
                     if action == 'add':
                         # Approvisionnement avec traçabilité complète
                         if prix_achat:
-                            # Mettre à jour le prix d'achat du produit
+                            # Mettre à jour le prix d'achat du produit (sans réécrire qty)
                             product.prix_achat = prix_achat
-                            product.save()
+                            product.save(update_fields=['prix_achat'])
                             
                             # Utiliser le système d'approvisionnement complet
                             result = Approvisionnement.objects.create_approvisionnement(
@@ -180,15 +177,14 @@ def quick_stock_update(request, pk):
                             )
                         else:
                             # Ajout simple sans prix (ajustement)
-                            product.qty += quantity
-                            product.save()
+                            Product.objects.increment_stock(product, quantity)
                             
                             # Créer seulement le mouvement de stock
                             MouvementStock.objects.create(
                                 produit=product,
                                 type_mouvement=TypeMouvement.AJUSTEMENT_PLUS,
                                 quantite=quantity,
-                                stock_avant=stock_avant,
+                                stock_avant=product.qty - quantity,
                                 stock_apres=product.qty,
                                 description=description or f"Ajustement positif - {quantity} unités",
                                 created_by=request.user
@@ -196,29 +192,27 @@ def quick_stock_update(request, pk):
                             messages.success(request, f'{quantity} unités ajoutées au stock de "{product.title}"')
                             
                     elif action == 'remove':
-                        if product.qty >= quantity:
-                            product.qty -= quantity
-                            product.save()
-                            
+                        # Retrait conditionnel atomique : échoue si le stock est insuffisant
+                        if Product.objects.decrement_stock(product, quantity) is not None:
                             # Créer le mouvement de stock
                             MouvementStock.objects.create(
                                 produit=product,
                                 type_mouvement=TypeMouvement.AJUSTEMENT_MOINS,
                                 quantite=-quantity,
-                                stock_avant=stock_avant,
+                                stock_avant=product.qty + quantity,
                                 stock_apres=product.qty,
                                 description=description or f"Ajustement négatif - {quantity} unités retirées",
                                 created_by=request.user
                             )
                             messages.success(request, f'{quantity} unités retirées du stock de "{product.title}"')
                         else:
+                            product.refresh_from_db(fields=['qty'])
                             messages.error(request, f'Stock insuffisant! Stock actuel: {product.qty}')
                             return redirect('product:product_list')
                             
                     elif action == 'set':
-                        old_qty = product.qty
-                        product.qty = quantity
-                        product.save()
+                        old_qty, _ = Product.objects.set_stock(product, quantity)
+                        stock_avant = old_qty
                         
                         # Déterminer le type de mouvement
                         if quantity > old_qty:
@@ -246,20 +240,17 @@ def quick_stock_update(request, pk):
             except ImportError:
                 # Si l'app aprovision n'est pas disponible, fonctionnement classique
                 if action == 'add':
-                    product.qty += quantity
+                    Product.objects.increment_stock(product, quantity)
                     messages.success(request, f'{quantity} unités ajoutées au stock de "{product.title}"')
                 elif action == 'remove':
-                    if product.qty >= quantity:
-                        product.qty -= quantity
+                    if Product.objects.decrement_stock(product, quantity) is not None:
                         messages.success(request, f'{quantity} unités retirées du stock de "{product.title}"')
                     else:
                         messages.error(request, f'Stock insuffisant! Stock actuel: {product.qty}')
                         return redirect('product:product_list')
                 elif action == 'set':
-                    product.qty = quantity
+                    Product.objects.set_stock(product, quantity)
                     messages.success(request, f'Stock de "{product.title}" défini à {quantity} unités')
-                
-                product.save()
             
             return redirect('product:product_list')
     else:
@@ -286,7 +277,7 @@ def toggle_product_status(request, pk):
     """Activer/désactiver un produit"""
     product = get_object_or_404(Product, pk=pk)
     product.active = not product.active
-    product.save()
+    product.save(update_fields=['active'])
     
     status = "activé" if product.active else "désactivé"
     messages.success(request, f'Produit "{product.title}" {status}!')
@@ -334,10 +325,7 @@ def delete_category(request, pk):
 def ajax_product_search(request):
     """Recherche AJAX pour les produits"""
     query = request.GET.get('q', '')
-    products = Product.objects.filter(
-        Q(title__icontains=query) | Q(category__title__icontains=query),
-        active=True
-    )[:10]
+    products = search_products(Product.objects.filter(active=True).select_related('category'), query, limit=10)
     
     results = []
     for product in products:
@@ -1,35 +1,48 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.conf import settings
 
 class SetupMiddleware:
-    """Middleware pour rediriger vers la configuration initiale si aucun utilisateur n'existe"""
-    
+    """Middleware pour rediriger vers la configuration initiale si aucun utilisateur n'existe.
+
+    Utilisable en mode synchrone (WSGI) comme asynchrone (ASGI / Uvicorn) : en ASGI
+    les vues async ne repassent pas par un thread à cause de ce middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    # Liste des URLs qui ne doivent pas être redirigées
+    excluded_urls = [
+        '/users/setup/',
+        '/admin/',
+        '/static/',
+        '/media/',
+        '/users/login/',
+        '/users/logout/',
+        '/activate-license/',  # Page d'activation de licence exemptée
+        '/license-status/',    # Page de statut de licence exemptée
+    ]
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
-    def __call__(self, request):
-        # Liste des URLs qui ne doivent pas être redirigées
-        excluded_urls = [
-            '/users/setup/',
-            '/admin/',
-            '/static/',
-            '/media/',
-            '/users/login/',
-            '/users/logout/',
-            '/activate-license/',  # Page d'activation de licence exemptée
-            '/license-status/',    # Page de statut de licence exemptée
-        ]
-        
+    def _is_excluded(self, request):
         # Vérifier si l'URL actuelle est exclue
         current_path = request.path
-        is_excluded = any(current_path.startswith(url) for url in excluded_urls)
-        
+        return any(current_path.startswith(url) for url in self.excluded_urls)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
         # Si l'URL n'est pas exclue et qu'aucun utilisateur n'existe
-        if not is_excluded and not request.path.startswith('/admin/'):
+        if not self._is_excluded(request):
             try:
-                from .models import User
-                if not User.objects.exists():
+                from .models import is_setup_complete
+                if not is_setup_complete():
                     # Rediriger vers la configuration initiale
                     return redirect('users:setup')
             except ImportError:
@@ -37,4 +50,11 @@ class SetupMiddleware:
                 pass
         
         response = self.get_response(request)
-        return response 
\ No newline at end of file
+        return response
+
+    async def __acall__(self, request):
+        if not self._is_excluded(request):
+            from .models import ais_setup_complete
+            if not await ais_setup_complete():
+                return redirect('users:setup')
+        return await self.get_response(request)
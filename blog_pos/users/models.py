@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 from django.utils.translation import gettext_lazy as _
@@ -95,6 +95,41 @@ class User(AbstractUser):
         return True  # Tous les utilisateurs peuvent modifier les commandes pour les paiements
 
 
+# Verrou à sens unique : une fois un utilisateur créé, la configuration initiale est terminée
+_setup_complete = False
+
+
+def is_setup_complete():
+    """Indique si au moins un utilisateur existe.
+
+    Tant que la configuration n'est pas faite, la base est interrogée à chaque appel ;
+    dès qu'un utilisateur existe le résultat est mémorisé pour toute la durée du processus
+    (le signal post_save sur User lève aussi le verrou), sans plus aucune requête.
+    Dans une transaction, le résultat n'est mémorisé qu'au commit : l'utilisateur vu peut
+    encore être annulé.
+    """
+    if _setup_complete:
+        return True
+    if User.objects.exists():
+        transaction.on_commit(mark_setup_complete)
+        return True
+    return False
+
+
+async def ais_setup_complete():
+    """Variante async de is_setup_complete (vues et middlewares async)"""
+    global _setup_complete
+    if not _setup_complete:
+        _setup_complete = await User.objects.aexists()
+    return _setup_complete
+
+
+def mark_setup_complete():
+    """Lève le verrou de configuration initiale (appelé à la création d'un utilisateur)"""
+    global _setup_complete
+    _setup_complete = True
+
+
 class UserProfile(models.Model):
     """Profil étendu pour les utilisateurs"""
     
@@ -146,6 +181,12 @@ class UserProfile(models.Model):
         return f"Profil de {self.user.get_full_name()}"
 
 
+# Cache process-local du singleton AppSetting : (updated_at, instance)
+_app_setting_cache = None
+# Vrai une fois updated_at comparé à la base pendant la requête en cours
+_app_setting_checked = False
+
+
 class AppSetting(models.Model):
     """Paramètres globaux personnalisables par le manager"""
     currency_label = models.CharField(
@@ -229,10 +270,46 @@ class AppSetting(models.Model):
         return f"Paramètres ({self.currency_label}, seuil {self.low_stock_threshold})"
 
     @classmethod
-    def get_solo(cls) -> 'AppSetting':
+    def get_solo(cls, use_cache=True) -> 'AppSetting':
+        """Retourne le singleton des paramètres.
+
+        Par défaut l'instance est servie depuis un cache process-local. Au premier appel
+        de chaque requête, sa date updated_at est comparée à celle de la base (lecture par
+        clé primaire) : une modification faite par un autre processus est donc vue dès la
+        requête suivante. Les appels suivants de la requête ne font aucune requête SQL.
+        Utiliser use_cache=False pour obtenir une instance à modifier (formulaires).
+        """
+        global _app_setting_cache, _app_setting_checked
+        if not use_cache:
+            obj, _ = cls.objects.get_or_create(id=1)
+            return obj
+
+        cached = _app_setting_cache
+        if cached is not None:
+            if _app_setting_checked:
+                return cached[1]
+            updated_at = cls.objects.filter(id=1).values_list('updated_at', flat=True).first()
+            if updated_at == cached[0]:
+                _app_setting_checked = True
+                return cached[1]
+
         obj, _ = cls.objects.get_or_create(id=1)
+        _app_setting_cache = (obj.updated_at, obj)
+        _app_setting_checked = True
         return obj
 
+    @classmethod
+    def invalidate_cache(cls):
+        """Invalide le cache local (modification faite par ce processus)"""
+        global _app_setting_cache
+        _app_setting_cache = None
+
+    @classmethod
+    def expire_cache(cls):
+        """Demande de revérifier updated_at au prochain appel (début de requête)"""
+        global _app_setting_checked
+        _app_setting_checked = False
+
     @classmethod
     def get_currency_label(cls) -> str:
         return cls.get_solo().currency_label or 'GMD'
@@ -0,0 +1,33 @@
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import AppSetting, User, mark_setup_complete
+
+
+@receiver(post_save, sender=AppSetting)
+@receiver(post_delete, sender=AppSetting)
+def invalider_cache_parametres(sender, **kwargs):
+    """
+    Signal pour invalider le cache des paramètres de l'application après modification
+    """
+    AppSetting.invalidate_cache()
+
+
+@receiver(request_started)
+def verifier_cache_parametres(sender, **kwargs):
+    """
+    Signal pour revérifier en début de requête que les paramètres en cache sont à jour
+    (ils peuvent avoir été modifiés par un autre processus)
+    """
+    AppSetting.expire_cache()
+
+
+@receiver(post_save, sender=User)
+def terminer_configuration_initiale(sender, instance, created, **kwargs):
+    """
+    Signal pour lever le verrou de configuration initiale dès qu'un utilisateur est créé
+    (au commit : un utilisateur dont la création est annulée ne compte pas)
+    """
+    if created:
+        transaction.on_commit(mark_setup_complete, using=kwargs.get('using'))
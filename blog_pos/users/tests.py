@@ -1,3 +1,78 @@
+from unittest import mock
+
+from django.core.signals import request_started
+from django.db import transaction
 from django.test import TestCase
+from django.utils import timezone
+
+from blog_pos.testing import PosTestCase
+
+from . import models
+from .models import AppSetting, User
+
+
+class AppSettingCacheTests(PosTestCase):
+    """Singleton des paramètres servi depuis la mémoire, revérifié à chaque requête"""
+
+    def setUp(self):
+        super().setUp()
+        AppSetting.objects.create(id=1, currency_label='GMD')
+
+    def test_served_without_sql_within_a_request(self):
+        self.assertEqual(AppSetting.get_solo().currency_label, 'GMD')
+        with self.assertNumQueries(0):
+            AppSetting.get_currency_label()
+            AppSetting.get_low_stock_threshold()
+
+    def test_save_in_this_process_is_seen_immediately(self):
+        AppSetting.get_solo()
+        setting = AppSetting.get_solo(use_cache=False)
+        setting.currency_label = 'FCFA'
+        setting.save()
+        self.assertEqual(AppSetting.get_currency_label(), 'FCFA')
+
+    def test_change_from_another_process_is_seen_by_next_request(self):
+        AppSetting.get_solo()
+        # Écriture d'un autre processus : aucun signal dans celui-ci
+        AppSetting.objects.filter(id=1).update(currency_label='XOF', updated_at=timezone.now())
+        self.assertEqual(AppSetting.get_currency_label(), 'GMD')
+
+        request_started.send(sender=self.__class__)
+        with self.assertNumQueries(2):
+            self.assertEqual(AppSetting.get_currency_label(), 'XOF')
+        request_started.send(sender=self.__class__)
+        with self.assertNumQueries(1):
+            self.assertEqual(AppSetting.get_currency_label(), 'XOF')
+
+    def test_page_shows_settings_changed_elsewhere(self):
+        self.assertEqual(self.client.get('/').context['currency'], 'GMD')
+        AppSetting.objects.filter(id=1).update(currency_label='XOF', updated_at=timezone.now())
+        self.assertEqual(self.client.get('/').context['currency'], 'XOF')
+
+
+class SetupLatchTests(TestCase):
+    """Verrou de configuration initiale levé seulement par un utilisateur validé en base"""
+
+    def setUp(self):
+        patcher = mock.patch.object(models, '_setup_complete', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rolled_back_user_does_not_complete_setup(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    User.objects.create_user('caissier', password='secret')
+                    self.assertTrue(models.is_setup_complete())
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertFalse(models._setup_complete)
+        self.assertFalse(models.is_setup_complete())
 
-# Create your tests here.
+    def test_committed_user_completes_setup(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user('caissier', password='secret')
+        self.assertTrue(models._setup_complete)
+        with self.assertNumQueries(0):
+            self.assertTrue(models.is_setup_complete())
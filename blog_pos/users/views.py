@@ -11,7 +11,7 @@ from django.urls import reverse_lazy
 from django.utils.decorators import method_decorator
 from django.contrib.admin.views.decorators import staff_member_required
 
-from .models import User, UserProfile, AppSetting
+from .models import User, UserProfile, AppSetting, is_setup_complete
 from .forms import (
     CustomUserCreationForm, CustomUserChangeForm, UserProfileForm,
     UserSearchForm, PasswordChangeForm, AppSettingForm
@@ -22,7 +22,7 @@ def setup_required(view_func):
     """Décorateur pour vérifier si la configuration initiale est nécessaire"""
     def wrapper(request, *args, **kwargs):
         # Vérifier s'il y a des utilisateurs dans la base
-        if not User.objects.exists():
+        if not is_setup_complete():
             return redirect('users:setup')
         return view_func(request, *args, **kwargs)
     return wrapper
@@ -31,7 +31,7 @@ def setup_required(view_func):
 def setup_view(request):
     """Configuration initiale - Création du premier manager"""
     # Si des utilisateurs existent déjà, rediriger vers la page de login
-    if User.objects.exists():
+    if is_setup_complete():
         return redirect('users:login')
     
     if request.method == 'POST':
@@ -73,7 +73,7 @@ def login_view(request):
         return redirect('create-order')
     
     # Vérifier si la configuration initiale est nécessaire
-    if not User.objects.exists():
+    if not is_setup_complete():
         return redirect('users:setup')
     
     if request.method == 'POST':
@@ -165,7 +165,8 @@ def app_settings_view(request):
         messages.error(request, 'Accès refusé. Vous devez être manager.')
         return redirect('create-order')
 
-    settings_obj = AppSetting.get_solo()
+    # Instance fraîche : le formulaire ne doit pas modifier l'instance partagée du cache
+    settings_obj = AppSetting.get_solo(use_cache=False)
     if request.method == 'POST':
         form = AppSettingForm(request.POST, request.FILES, instance=settings_obj)
         if form.is_valid():